@@ -1,67 +1,47 @@
 import os
-import requests
+import time
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import unquote
-import json
-import redis
+from urllib.parse import unquote, urlparse, parse_qs
+from storage import get_file, is_revoked
+from bot_api import download_file
+from signing import sign, verify
+from templates import message_page
+from http_utils import file_etag, last_modified, is_not_modified, content_type, content_disposition
+from config import STREAM_URL, BOT_API_DOWNLOAD_LIMIT, DOWNLOAD_LINK_TTL, DOWNLOAD_PROXY_LIMIT
 
-TOKEN = os.environ.get('TELEGRAM_TOKEN')
-REDIS_URL = os.environ.get('UPSTASH_REDIS_REST_URL')
-REDIS_TOKEN = os.environ.get('UPSTASH_REDIS_REST_TOKEN')
 BASE_URL = os.environ.get('BASE_URL', 'https://filmzicloud.vercel.app')
 
-def get_redis_client():
-    return redis.Redis(
-        host=REDIS_URL.replace('https://', '').split(':')[0],
-        port=6379,
-        password=REDIS_TOKEN,
-        ssl=True,
-        decode_responses=True
-    )
+# These pages never vary, so they are rendered once per process
+NOT_FOUND_PAGE = message_page("File Not Found", "❌", "File Not Found",
+                              "The download link is invalid or the file has been removed.",
+                              BASE_URL, "🔄 Go to Filmzi Cloud")
+GONE_PAGE = message_page("File Revoked", "🗑️", "File Revoked",
+                         "This file was revoked by its owner or has expired.", BASE_URL, "🔄 Go to Filmzi Cloud")
+ERROR_PAGE = message_page("Download Error", "😵", "Download Error",
+                          "Something went wrong while preparing this download.", BASE_URL, "Go to Filmzi Cloud")
+TOO_LARGE_PAGE = message_page("File Too Large", "📦", "Too Large for Direct Download",
+                              f"Files over {DOWNLOAD_PROXY_LIMIT // (1024 * 1024)} MB need the streaming server, "
+                              "which is not enabled here. Open the file from the bot in Telegram instead.",
+                              BASE_URL, "🔄 Go to Filmzi Cloud")
 
-def get_from_redis(short_id):
-    try:
-        r = get_redis_client()
-        key = f"file:{short_id}"
-        data = r.get(key)
-        if data:
-            return json.loads(data)
-        return None
-    except Exception as e:
-        return None
-
-def get_file_direct_url(file_id):
-    url = f"https://api.telegram.org/bot{TOKEN}/getFile"
-    data = {'file_id': file_id}
-    response = requests.post(url, json=data)
-    
-    if response.status_code == 200:
-        result = response.json()
-        if result.get('ok'):
-            file_path = result['result']['file_path']
-            return f"https://api.telegram.org/file/bot{TOKEN}/{file_path}"
-    return None
-
-def format_file_size(bytes_size):
-    if bytes_size == 0:
-        return "0 B"
-    
-    sizes = ["B", "KB", "MB", "GB", "TB"]
-    i = 0
-    while bytes_size >= 1024 and i < len(sizes) - 1:
-        bytes_size /= 1024.0
-        i += 1
-    
-    return f"{bytes_size:.2f} {sizes[i]}"
+def signed_download_link(filename_encoded, short_id, now):
+    """Signed link shared by every request in the current TTL window, so the
+    CDN can serve one cached copy; returns (link, seconds the link may
+    itself be handed out for)"""
+    window = int(now) // DOWNLOAD_LINK_TTL
+    expires = (window + 2) * DOWNLOAD_LINK_TTL
+    link = f"{BASE_URL}/api/download/{filename_encoded}-{short_id}?exp={expires}&sig={sign('download', short_id, expires)}"
+    return link, (window + 1) * DOWNLOAD_LINK_TTL - int(now)
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
-            path = self.path.strip('/')
+            url = urlparse(self.path)
+            path = url.path.strip('/')
             if not path.startswith('api/download/'):
                 self.send_response(404)
                 self.end_headers()
-                self.wfile.write(b'Not found')
+                self.send_body(b'Not found')
                 return
             
             slug = path.split('api/download/')[-1]
@@ -69,138 +49,129 @@ class handler(BaseHTTPRequestHandler):
             if not slug or '-' not in slug:
                 self.send_response(400)
                 self.end_headers()
-                self.wfile.write(b'Invalid download link')
+                self.send_body(b'Invalid download link')
                 return
             
             parts = slug.rsplit('-', 1)
             if len(parts) != 2:
                 self.send_response(400)
                 self.end_headers()
-                self.wfile.write(b'Invalid download link format')
+                self.send_body(b'Invalid download link format')
                 return
             
             filename_encoded, short_id = parts
             original_filename = unquote(filename_encoded)
             
-            file_data = get_from_redis(short_id)
+            file_data = get_file(short_id)
             
             if not file_data:
-                self.send_response(404)
-                self.send_header('Content-Type', 'text/html')
-                self.end_headers()
-                
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>File Not Found - Filmzi Cloud</title>
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <style>
-                        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-                        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: white; min-height: 100vh; display: flex; align-items: center; justify-content: center; }}
-                        .container {{ background: rgba(255,255,255,0.1); padding: 40px; border-radius: 20px; backdrop-filter: blur(10px); text-align: center; max-width: 500px; border: 1px solid rgba(255,255,255,0.2); }}
-                        .error-icon {{ font-size: 80px; margin-bottom: 20px; color: #ff6b6b; }}
-                        .btn {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 10px; display: inline-block; margin: 10px; font-weight: bold; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="error-icon">❌</div>
-                        <h1>File Not Found</h1>
-                        <p style="margin-bottom: 20px; opacity: 0.8;">The download link is invalid or the file has been removed.</p>
-                        <a href="{BASE_URL}" class="btn">🔄 Go to Filmzi Cloud</a>
-                    </div>
-                </body>
-                </html>
-                """
-                self.wfile.write(html_content.encode())
+                if is_revoked(short_id):
+                    self.send_html(410, GONE_PAGE)
+                else:
+                    self.send_html(404, NOT_FOUND_PAGE)
                 return
             
             file_id = file_data.get('file_id')
             file_name = file_data.get('file_name', original_filename)
             file_size = file_data.get('file_size', 0)
-            size_readable = format_file_size(file_size)
             
-            download_url = get_file_direct_url(file_id)
+            etag = file_etag(file_data)
+            
+            # Files over the Bot API limit are served by the MTProto streamer
+            if STREAM_URL and file_size > BOT_API_DOWNLOAD_LIMIT:
+                self.send_redirect(f"{STREAM_URL}/stream/{short_id}?download=1", 'public, max-age=86400')
+                return
+            
+            # The permanent link only hands out the current signed link
+            query = parse_qs(url.query)
+            signature = query.get('sig', [''])[0]
+            expires = query.get('exp', [''])[0]
+            now = time.time()
+            if not signature:
+                link, cacheable_for = signed_download_link(filename_encoded, short_id, now)
+                self.send_redirect(link, f'public, max-age=0, s-maxage={cacheable_for}')
+                return
+            
+            if not expires.isdigit() or not verify(signature, 'download', short_id, expires):
+                self.send_html(403, NOT_FOUND_PAGE)
+                return
+            remaining = int(expires) - int(now)
+            if remaining <= 0:
+                # Stale bookmark or cache; send it back through the permanent link
+                self.send_redirect(f"{BASE_URL}/api/download/{filename_encoded}-{short_id}", 'no-store')
+                return
+            
+            # Only reached on a CDN miss: the response below is cached for
+            # exactly as long as the signed link stays valid
+            cache_control = f'public, max-age={remaining}, s-maxage={remaining}'
+            if file_size <= DOWNLOAD_PROXY_LIMIT:
+                # Only this response carries the file, so only it revalidates
+                if is_not_modified(self.headers, etag, file_data):
+                    self.send_response(304)
+                    self.send_header('Cache-Control', cache_control)
+                    self.send_validators(etag, file_data)
+                    self.end_headers()
+                    return
+                # HEAD is answered from the record alone, leaving out the
+                # length if it has none; the whole body is always sent, so
+                # ranges aren't offered
+                head_only = self.command == 'HEAD'
+                body = b'' if head_only else download_file(file_id, DOWNLOAD_PROXY_LIMIT)
+                if body is not None:
+                    length = file_size if head_only else len(body)
+                    self.send_response(200)
+                    self.send_header('Content-Type', content_type(file_data))
+                    if length or not head_only:
+                        self.send_header('Content-Length', str(length))
+                    self.send_header('Content-Disposition', content_disposition(file_name))
+                    self.send_header('Cache-Control', cache_control)
+                    self.send_validators(etag, file_data)
+                    self.end_headers()
+                    self.send_body(body)
+                    return
+                if not STREAM_URL:
+                    # Telegram did not hand the file over; let the next request retry
+                    self.send_html(502, ERROR_PAGE)
+                    return
+            
+            if STREAM_URL:
+                self.send_redirect(f"{STREAM_URL}/stream/{short_id}?download=1", cache_control)
+                return
+            
+            # Without a streamer, larger files could only be fetched from
+            # Telegram's file URL, which embeds the bot token
+            self.send_html(200, TOO_LARGE_PAGE, cache_control)
             
-            if download_url:
-                # Redirect to Telegram's CDN for direct download
-                self.send_response(302)
-                self.send_header('Location', download_url)
-                self.send_header('Content-Disposition', f'attachment; filename="{file_name}"')
-                self.send_header('Cache-Control', 'public, max-age=31536000')
-                self.end_headers()
-            else:
-                # Show download page
-                self.send_response(200)
-                self.send_header('Content-Type', 'text/html')
-                self.end_headers()
-                
-                html_content = f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Download {file_name} - Filmzi Cloud</title>
-                    <meta name="viewport" content="width=device-width, initial-scale=1">
-                    <style>
-                        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-                        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: white; min-height: 100vh; display: flex; align-items: center; justify-content: center; }}
-                        .container {{ background: rgba(255,255,255,0.1); padding: 40px; border-radius: 20px; backdrop-filter: blur(10px); text-align: center; max-width: 600px; border: 1px solid rgba(255,255,255,0.2); }}
-                        .file-icon {{ font-size: 80px; margin-bottom: 20px; color: #4ecdc4; }}
-                        .filename {{ font-size: 22px; font-weight: bold; word-break: break-word; margin: 20px 0; }}
-                        .file-info {{ background: rgba(255,255,255,0.15); padding: 20px; border-radius: 10px; margin: 20px 0; text-align: left; }}
-                        .btn {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 18px 40px; text-decoration: none; border-radius: 12px; display: inline-block; font-size: 18px; font-weight: bold; margin: 10px; }}
-                        .features {{ display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 30px 0; }}
-                        .feature {{ background: rgba(255,255,255,0.1); padding: 15px; border-radius: 10px; font-size: 14px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="file-icon">📥</div>
-                        <div class="filename">{file_name}</div>
-                        
-                        <div class="file-info">
-                            <div><strong>Size:</strong> {size_readable}</div>
-                            <div><strong>Type:</strong> Download</div>
-                            <div><strong>Status:</strong> Ready</div>
-                        </div>
-                        
-                        <div style="margin: 30px 0;">
-                            <a href="{download_url}" class="btn" download="{file_name}">
-                                ⬇️ DOWNLOAD NOW
-                            </a>
-                        </div>
-                        
-                        <div class="features">
-                            <div class="feature">🛡️ Permanent Storage</div>
-                            <div class="feature">🔗 Never Expires</div>
-                            <div class="feature">⚡ Fast Download</div>
-                            <div class="feature">💾 2GB Support</div>
-                        </div>
-                    </div>
-                    
-                    <script>
-                        setTimeout(function() {{
-                            window.location.href = "{download_url}";
-                        }}, 1000);
-                    </script>
-                </body>
-                </html>
-                """
-                
-                self.wfile.write(html_content.encode())
-                
         except Exception as e:
-            self.send_response(500)
-            self.end_headers()
-            error_html = f"""
-            <html>
-            <body style="font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; text-align: center; margin: 100px auto; max-width: 500px; background: #1a1a2e; color: white; padding: 50px;">
-                <div style="font-size: 80px; color: #ff6b6b;">😵</div>
-                <h2 style="color: #ff6b6b;">Download Error</h2>
-                <p>Error: {str(e)}</p>
-                <a href="{BASE_URL}" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 8px; display: inline-block; margin-top: 20px;">Go to Filmzi Cloud</a>
-            </body>
-            </html>
-            """
-            self.wfile.write(error_html.encode())
+            print(f"Download error: {e}")
+            self.send_html(500, ERROR_PAGE)
+    
+    def do_HEAD(self):
+        self.do_GET()
+    
+    def send_redirect(self, location, cache_control):
+        # No validators: a revalidated redirect would keep pointing at an
+        # old signed link after it expires
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+    
+    def send_validators(self, etag, file_data):
+        self.send_header('ETag', etag)
+        modified = last_modified(file_data)
+        if modified:
+            self.send_header('Last-Modified', modified)
+    
+    def send_body(self, body):
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+    
+    def send_html(self, status, body, cache_control=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if cache_control:
+            self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        self.send_body(body)
@@ -0,0 +1,58 @@
+import os
+import json
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote, urlencode
+from storage import list_user_files
+from signing import verify
+
+BASE_URL = os.environ.get('BASE_URL', 'https://filmzicloud.vercel.app')
+PAGE_SIZE = 50
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        try:
+            url = urlparse(self.path)
+            path = url.path.strip('/')
+            if not path.startswith('api/files/'):
+                self.send_json(404, {'error': 'Not found'})
+                return
+            
+            user_id = path.split('api/files/')[-1]
+            query = parse_qs(url.query)
+            signature = query.get('sig', [''])[0]
+            cursor = query.get('cursor', [None])[0]
+            
+            # Library links are handed out by /myfiles and signed per user
+            if not user_id.isdigit() or not verify(signature, 'files', user_id):
+                self.send_json(403, {'error': 'Invalid library link'})
+                return
+            
+            files, next_cursor = list_user_files(int(user_id), cursor=cursor, limit=PAGE_SIZE)
+            
+            items = []
+            for file_data in files:
+                encoded_name = quote(file_data.get('file_name', 'file').replace(' ', '.'))
+                short_id = file_data['short_id']
+                items.append({
+                    'short_id': short_id,
+                    'file_name': file_data.get('file_name'),
+                    'file_size': file_data.get('file_size', 0),
+                    'download': f"{BASE_URL}/api/download/{encoded_name}-{short_id}",
+                    'stream': f"{BASE_URL}/api/stream/{encoded_name}-{short_id}"
+                })
+            
+            response = {'files': items, 'next_cursor': next_cursor}
+            if next_cursor:
+                response['next'] = f"{BASE_URL}/api/files/{user_id}?{urlencode({'sig': signature, 'cursor': next_cursor})}"
+            self.send_json(200, response)
+            
+        except Exception as e:
+            print(f"Library error: {e}")
+            self.send_json(500, {'error': 'Internal server error'})
+    
+    def send_json(self, status, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'private, no-store')
+        self.end_headers()
+        self.wfile.write(json.dumps(payload, indent=2).encode())
@@ -0,0 +1,39 @@
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from templates import ASSETS
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_asset(head=False)
+
+    def do_HEAD(self):
+        self.send_asset(head=True)
+
+    def send_asset(self, head):
+        name = urlparse(self.path).path.strip('/').split('static/')[-1]
+        asset = ASSETS.get(name)
+        if asset is None:
+            self.send_response(404)
+            self.end_headers()
+            if not head:
+                self.wfile.write(b'Not found')
+            return
+
+        content_type, body, version = asset
+        etag = f'"{version}"'
+        # Page links carry ?v=<hash>, so any given URL never changes content
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
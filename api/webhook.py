@@ -1,105 +1,57 @@
 from http.server import BaseHTTPRequestHandler
 import json
 import os
-import random
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode, quote
-import redis
+from storage import (save_to_redis, get_file, get_cache_stats,
+                     claim_update, release_update, finish_update, get_update_result, find_duplicate,
+                     count_upload, get_upload_stats, list_user_files, search_user_files,
+                     revoke_file, get_revoke_stats, set_file_expiry, get_archive_stats, save_many,
+                     find_duplicates, UPDATE_IN_PROGRESS)
+import bot_api
+import rate_limit
+from bot_api import get_file_direct_url
+from update_queue import enqueue_update
+from short_ids import allocate_short_id, allocate_short_ids
+from upload_batches import join_batch, collect_batch, adopt_orphans
+from signing import sign
+from config import ASYNC_UPDATES, FILE_TTL, UPLOAD_BATCH_WAIT, UPLOAD_BATCH_MAX_WAIT, UPLOAD_BATCH_SIZE
 
 # Environment variables
 TOKEN = os.environ.get('TELEGRAM_TOKEN')
 CHANNEL_ID = os.environ.get('CHANNEL_ID')
-REDIS_URL = os.environ.get('UPSTASH_REDIS_REST_URL')
-REDIS_TOKEN = os.environ.get('UPSTASH_REDIS_REST_TOKEN')
 BASE_URL = os.environ.get('BASE_URL', 'https://filmzicloud.vercel.app')
 
-# Initialize Redis
-def get_redis_client():
-    return redis.Redis(
-        host=REDIS_URL.replace('https://', '').split(':')[0],
-        port=6379,
-        password=REDIS_TOKEN,
-        ssl=True,
-        decode_responses=True
-    )
+# Runs the independent calls of an upload (getFile, short ID allocation)
+# alongside the channel forward instead of one after another
+_upload_pool = ThreadPoolExecutor(max_workers=8)
 
-def random_id():
-    return random.randint(10000000, 99999999)
+# How long an album's leading invocation may take to collect it before
+# another upload adopts the batch
+BATCH_LEADER_TTL = int(UPLOAD_BATCH_MAX_WAIT) + 60
+
+# Shown when a search word matched too many indexed words to search them all
+SEARCH_TRUNCATED_TEXT = "⚠️ Too many names start with those letters to search them all. Add more letters to see every match."
+
+# Telegram's limit is 4096 characters per message
+MAX_MESSAGE_LENGTH = 4000
 
 def send_message(chat_id, text, parse_mode=None, reply_markup=None):
-    url = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
     data = {'chat_id': chat_id, 'text': text}
     if parse_mode:
         data['parse_mode'] = parse_mode
     if reply_markup:
         data['reply_markup'] = json.dumps(reply_markup)
-    response = requests.post(url, json=data)
-    return response.json()
+    return bot_api.call('sendMessage', **data)
 
 def forward_to_channel(chat_id, message_id):
     """Forward message to storage channel"""
-    url = f"https://api.telegram.org/bot{TOKEN}/forwardMessage"
-    data = {
-        'chat_id': CHANNEL_ID,
-        'from_chat_id': chat_id,
-        'message_id': message_id
-    }
-    response = requests.post(url, json=data)
-    return response.json()
-
-def get_file_direct_url(file_id):
-    """Get direct download URL from Telegram"""
-    url = f"https://api.telegram.org/bot{TOKEN}/getFile"
-    data = {'file_id': file_id}
-    response = requests.post(url, json=data)
-    
-    if response.status_code == 200:
-        result = response.json()
-        if result.get('ok'):
-            file_path = result['result']['file_path']
-            return f"https://api.telegram.org/file/bot{TOKEN}/{file_path}"
-    return None
-
-def save_to_redis(short_id, file_data):
-    try:
-        r = get_redis_client()
-        key = f"file:{short_id}"
-        r.set(key, json.dumps(file_data))
-        
-        # Save user-file mapping
-        user_key = f"user:{file_data['user_id']}:files"
-        r.sadd(user_key, short_id)
-        return True
-    except Exception as e:
-        print(f"Redis error: {e}")
-        return False
+    return bot_api.call('forwardMessage', chat_id=CHANNEL_ID, from_chat_id=chat_id, message_id=message_id)
 
-def get_from_redis(short_id):
-    try:
-        r = get_redis_client()
-        key = f"file:{short_id}"
-        data = r.get(key)
-        if data:
-            return json.loads(data)
-        return None
-    except Exception as e:
-        print(f"Redis error: {e}")
-        return None
-
-def get_user_files(user_id):
-    try:
-        r = get_redis_client()
-        user_key = f"user:{user_id}:files"
-        file_ids = r.smembers(user_key)
-        files = []
-        for file_id in file_ids:
-            file_data = get_from_redis(file_id)
-            if file_data:
-                files.append(file_data)
-        return files
-    except Exception as e:
-        print(f"Redis error: {e}")
-        return []
+def forward_many_to_channel(chat_id, message_ids):
+    """Forward several messages to the storage channel in one call"""
+    return bot_api.call('forwardMessages', chat_id=CHANNEL_ID, from_chat_id=chat_id, message_ids=message_ids)
 
 def format_file_size(bytes_size):
     """Convert bytes to human readable format"""
@@ -139,34 +91,334 @@ def create_file_keyboard(file_id, is_video=False):
     
     return {"inline_keyboard": keyboard}
 
-class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
+def is_streamable(file_name):
+    file_ext = file_name.split('.')[-1].lower() if '.' in file_name else ''
+    return file_ext in ['mp4', 'mkv', 'avi', 'mov', 'wmv', 'webm', 'mp3', 'wav', 'aac', 'ogg', 'flac']
+
+def send_file_links(chat_id, file_data):
+    """Reply with the download/stream/share links for a stored file"""
+    file_name = file_data['file_name']
+    short_id = file_data['short_id']
+    size_readable = format_file_size(file_data.get('file_size', 0))
+    
+    # Check if file is video/audio for streaming
+    is_video_audio = is_streamable(file_name)
+    
+    # Build links
+    clean_name = file_name.replace(' ', '.')
+    encoded_name = quote(clean_name)
+    download_link = f"{BASE_URL}/api/download/{encoded_name}-{short_id}"
+    stream_link = f"{BASE_URL}/api/stream/{encoded_name}-{short_id}"
+    share_link = f"https://t.me/{TOKEN.split(':')[0]}?start=file_{short_id}"
+    
+    # Create response message like reference image
+    response_text = f"""
+✅ **Your Link Generated!**
+
+📁 **FILE NAME:** 
+`{file_name}`
+
+💾 **FILE SIZE:** {size_readable}
+
+⬇️ **Download:** {download_link}
+    """
+    
+    if is_video_audio:
+        response_text += f"📺 **Watch:** {stream_link}\n"
+    
+    response_text += f"🔗 **Share:** {share_link}"
+    
+    # Send message with inline keyboard
+    keyboard = create_file_keyboard(short_id, is_video_audio)
+    send_message(chat_id, response_text, parse_mode="Markdown", reply_markup=keyboard)
+
+def send_batch_links(chat_id, files, failed):
+    """Send the links for a batch of stored files in as few messages as fit"""
+    blocks = [f"✅ **{len(files)} Links Generated!**"]
+    if failed:
+        blocks.append(f"⚠️ {failed} file{'s' if failed != 1 else ''} could not be stored. Please send "
+                      f"{'them' if failed != 1 else 'it'} again.")
+    for file_data in files:
+        encoded_name = quote(file_data['file_name'].replace(' ', '.'))
+        short_id = file_data['short_id']
+        block = (f"📁 `{file_data['file_name']}` ({format_file_size(file_data.get('file_size', 0))})\n"
+                 f"⬇️ {BASE_URL}/api/download/{encoded_name}-{short_id}")
+        if is_streamable(file_data['file_name']):
+            block += f"\n📺 {BASE_URL}/api/stream/{encoded_name}-{short_id}"
+        blocks.append(block)
+    
+    texts = [blocks[0]]
+    for block in blocks[1:]:
+        if len(texts[-1]) + len(block) + 2 > MAX_MESSAGE_LENGTH:
+            texts.append(block)
+        else:
+            texts[-1] += "\n\n" + block
+    for text in texts:
+        send_message(chat_id, text, parse_mode="Markdown")
+
+def send_file_page(chat_id, user_id, cursor=None):
+    """Send one page of the user's library with a button for the next page"""
+    files, next_cursor = list_user_files(user_id, cursor=cursor)
+    if not files:
+        send_message(chat_id, "📂 No more files." if cursor else "📂 You haven't stored any files yet.")
+        return
+    
+    lines = ["📂 **Your Files**", ""]
+    for file_data in files:
+        encoded_name = quote(file_data['file_name'].replace(' ', '.'))
+        download_link = f"{BASE_URL}/api/download/{encoded_name}-{file_data['short_id']}"
+        size_readable = format_file_size(file_data.get('file_size', 0))
+        lines.append(f"• `{file_data['file_name']}` ({size_readable})\n{download_link}")
+    
+    library_link = f"{BASE_URL}/api/files/{user_id}?sig={sign('files', user_id)}"
+    keyboard = [[{"text": "🌐 FULL LIBRARY", "url": library_link}]]
+    if next_cursor:
+        keyboard[0].append({"text": "➡️ NEXT", "callback_data": f"myfiles_{next_cursor}"})
+    send_message(chat_id, "\n".join(lines), parse_mode="Markdown", reply_markup={"inline_keyboard": keyboard})
+
+def send_search_results(chat_id, user_id, query):
+    """Reply with the user's files whose names match query"""
+    if not query.strip():
+        send_message(chat_id, "🔍 Usage: `/search <words from the file name>`", parse_mode="Markdown")
+        return
+    
+    files, total, truncated = search_user_files(user_id, query)
+    if not files:
+        send_message(chat_id, SEARCH_TRUNCATED_TEXT if truncated else "🔍 No matching files.")
+        return
+    
+    lines = [f"🔍 **{total}{'+' if truncated else ''} matching file{'s' if total != 1 else ''}**", ""]
+    for file_data in files:
+        encoded_name = quote(file_data['file_name'].replace(' ', '.'))
+        download_link = f"{BASE_URL}/api/download/{encoded_name}-{file_data['short_id']}"
+        size_readable = format_file_size(file_data.get('file_size', 0))
+        lines.append(f"• `{file_data['file_name']}` ({size_readable})\n{download_link}")
+    if truncated:
+        lines += ["", SEARCH_TRUNCATED_TEXT]
+    send_message(chat_id, "\n".join(lines), parse_mode="Markdown")
+
+def set_expiry(chat_id, user_id, args):
+    """Handle /expire <file id or link> <days>; 0 days clears the expiry"""
+    try:
+        days = float(args[1]) if len(args) == 2 else -1
+    except ValueError:
+        days = -1
+    if not 0 <= days <= 3650:
+        send_message(chat_id, "⏳ Usage: `/expire <file id or link> <days>` (0 keeps the file until you revoke it)", parse_mode="Markdown")
+        return
+    
+    short_id = args[0].rstrip('/').rsplit('/', 1)[-1].rsplit('-', 1)[-1]
+    file_data = get_file(short_id)
+    if not file_data or file_data.get('user_id') != user_id:
+        send_message(chat_id, "❌ File not found")
+        return
+    expires_at = int(time.time() + days * 86400) if days else None
+    if not set_file_expiry(short_id, expires_at):
+        send_message(chat_id, "❌ Could not update the file. Please try again.")
+        return
+    if expires_at:
+        when = time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(expires_at))
+        send_message(chat_id, f"⏳ `{short_id}` will be deleted on {when}.", parse_mode="Markdown")
+    else:
+        send_message(chat_id, f"♾️ `{short_id}` will be kept until you revoke it.", parse_mode="Markdown")
+
+def upload_file(message):
+    """The file object of a media message and the name to store it under"""
+    file_obj = (message.get('document') or 
+               message.get('video') or 
+               message.get('audio') or 
+               message.get('photo'))
+    if not file_obj:
+        return None, None
+    
+    # Handle photo array
+    if isinstance(file_obj, list):
+        file_obj = max(file_obj, key=lambda x: x.get('file_size', 0))
+    
+    file_name = file_obj.get('file_name', 'file')
+    
+    # Add extension for photos
+    if message.get('photo') and not '.' in file_name:
+        file_name += '.jpg'
+    return file_obj, file_name
+
+def store_upload(chat_id, user_id, message):
+    """Store one uploaded file and reply with its links"""
+    file_obj, file_name = upload_file(message)
+    file_id = file_obj['file_id']
+    file_size = file_obj.get('file_size', 0)
+    
+    # A repeated upload of the same file by this user reuses its links
+    file_unique_id = file_obj.get('file_unique_id')
+    existing, own = find_duplicate(user_id, file_unique_id)
+    if existing and own:
+        count_upload(dedup_hit=True)
+        send_file_links(chat_id, existing)
+        return 'ok'
+    
+    short_id_future = _upload_pool.submit(allocate_short_id)
+    # Warms the getFile cache for the first download; nothing waits on it
+    _upload_pool.submit(get_file_direct_url, file_id)
+    
+    if existing:
+        # Someone already stored this content; reuse their channel copy
+        channel_msg_id = existing['channel_msg_id']
+    else:
+        # Forward file to channel for permanent storage
+        forward_result = forward_to_channel(chat_id, message['message_id'])
+        
+        if not forward_result.get('ok'):
+            send_message(chat_id, "❌ Failed to store file in cloud. Please try again.")
+            return 'Forward failed'
+        channel_msg_id = forward_result['result']['message_id']
+    
+    short_id = short_id_future.result()
+    
+    # Prepare file data for Redis
+    file_data = {
+        'file_id': file_id,
+        'file_unique_id': file_unique_id,
+        'file_name': file_name,
+        'file_size': file_size,
+        'user_id': user_id,
+        'timestamp': int(time.time()),
+        'short_id': short_id,
+        'chat_id': chat_id,
+        'channel_msg_id': channel_msg_id,
+        'expires_at': int(time.time()) + FILE_TTL if FILE_TTL else None
+    }
+    
+    # Save to Redis
+    if not save_to_redis(short_id, file_data, dedup_hit=existing is not None):
+        send_message(chat_id, "❌ Failed to create file links. Please try again.")
+        return 'Redis save failed'
+    
+    send_file_links(chat_id, file_data)
+    return 'ok'
+
+def store_batch(chat_id, user_id, messages):
+    """Store several uploads from one chat with one forwardMessages call per
+    UPLOAD_BATCH_SIZE files, one Redis pipeline and one combined reply.
+    getFile is skipped: download links resolve the path when first used."""
+    uploads = []
+    seen = set()
+    for message in sorted(messages, key=lambda m: m['message_id']):
+        file_obj, file_name = upload_file(message)
+        if file_obj and file_obj.get('file_unique_id') not in seen:
+            seen.add(file_obj.get('file_unique_id'))
+            uploads.append((message['message_id'], file_obj, file_name))
+    duplicates = find_duplicates(user_id, [file_obj.get('file_unique_id') for _, file_obj, _ in uploads])
+    
+    # forwardMessages returns only IDs and silently skips what it cannot
+    # forward, so a short reply cannot be matched up and is undone
+    new = [message_id for (message_id, _, _), (existing, _) in zip(uploads, duplicates) if not existing]
+    channel_ids = {}
+    for start in range(0, len(new), UPLOAD_BATCH_SIZE):
+        chunk = new[start:start + UPLOAD_BATCH_SIZE]
+        forwarded = forward_many_to_channel(chat_id, chunk).get('result') or []
+        if len(forwarded) == len(chunk):
+            channel_ids.update(zip(chunk, (copy['message_id'] for copy in forwarded)))
+        elif forwarded:
+            bot_api.call('deleteMessages', chat_id=CHANNEL_ID,
+                         message_ids=[copy['message_id'] for copy in forwarded])
+    
+    files = [None] * len(uploads)
+    records = []
+    for i, ((message_id, file_obj, file_name), (existing, own)) in enumerate(zip(uploads, duplicates)):
+        if existing and own:
+            files[i] = existing
+            continue
+        channel_msg_id = existing['channel_msg_id'] if existing else channel_ids.get(message_id)
+        if channel_msg_id:
+            records.append((i, file_obj, file_name, channel_msg_id, existing is not None))
+    
+    now = time.time()
+    batch = []
+    positions = []
+    for short_id, (i, file_obj, file_name, channel_msg_id, dedup_hit) in zip(
+            allocate_short_ids(len(records)) if records else [], records):
+        file_data = {
+            'file_id': file_obj['file_id'],
+            'file_unique_id': file_obj.get('file_unique_id'),
+            'file_name': file_name,
+            'file_size': file_obj.get('file_size', 0),
+            'user_id': user_id,
+            'timestamp': int(now),
+            'short_id': short_id,
+            'chat_id': chat_id,
+            'channel_msg_id': channel_msg_id,
+            'expires_at': int(now) + FILE_TTL if FILE_TTL else None
+        }
+        # Offsets keep the batch in upload order in the library
+        batch.append((short_id, file_data, now + len(batch) / 1e6, dedup_hit))
+        positions.append(i)
+    stored = set(save_many(batch))
+    for i, (short_id, file_data, _, _) in zip(positions, batch):
+        if short_id in stored:
+            files[i] = file_data
+    
+    reused = sum(1 for existing, own in duplicates if existing and own)
+    if reused:
+        count_upload(dedup_hit=True, count=reused)
+    files = [file_data for file_data in files if file_data]
+    if not files:
+        send_message(chat_id, "❌ Failed to store files in cloud. Please try again.")
+        return 'Batch failed'
+    send_batch_links(chat_id, files, len(uploads) - len(files))
+    return 'ok'
+
+def store_album_part(chat_id, user_id, group_id, message):
+    """Join the album's batch; the part that opened it stores the whole album"""
+    try:
+        if not join_batch(chat_id, group_id, message, BATCH_LEADER_TTL):
+            return 'batched'
+        messages = collect_batch(chat_id, group_id, UPLOAD_BATCH_WAIT, UPLOAD_BATCH_MAX_WAIT, UPLOAD_BATCH_SIZE)
+    except Exception as e:
+        print(f"Upload batch error: {e}")
+        messages = [message]
+    if len(messages) > 1:
+        return store_batch(chat_id, user_id, messages)
+    return store_upload(chat_id, user_id, message)
+
+def store_orphaned_batches():
+    """Store album batches whose leading invocation died before storing them"""
+    try:
+        batches = adopt_orphans(BATCH_LEADER_TTL)
+    except Exception as e:
+        print(f"Upload batch error: {e}")
+        return
+    for messages in batches:
+        chat_id = messages[0]['chat']['id']
+        user_id = messages[0]['from']['id']
         try:
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            update = json.loads(post_data.decode('utf-8'))
-            
-            # Handle callback queries
-            if 'callback_query' in update:
-                self.handle_callback_query(update['callback_query'])
-                return
-            
-            message = update.get('message')
-            if not message:
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'No message')
-                return
-            
-            chat_id = message['chat']['id']
-            user_id = message['from']['id']
-            message_id = message['message_id']
-            message_text = message.get('text', '')
-            
-            # Handle /start command
-            if message_text.startswith('/start'):
-                # Send welcome message with image
-                welcome_text = """
+            if len(messages) > 1:
+                store_batch(chat_id, user_id, messages)
+            else:
+                store_upload(chat_id, user_id, messages[0])
+        except Exception as e:
+            print(f"Orphaned upload batch error: {e}")
+
+def handle_update(update):
+    """Handle one Telegram update and return a short status for the HTTP reply"""
+    chat_id = None
+    try:
+        # Handle callback queries
+        if 'callback_query' in update:
+            handle_callback_query(update['callback_query'])
+            return 'ok'
+        
+        message = update.get('message')
+        if not message:
+            return 'No message'
+        
+        chat_id = message['chat']['id']
+        user_id = message['from']['id']
+        message_text = message.get('text', '')
+        
+        # Handle /start command
+        if message_text.startswith('/start'):
+            # Send welcome message with image
+            welcome_text = """
 🎬 **WELCOME TO FILESTREAMBOT**
 📥 DOWNLOAD | 📺 STREAM | 🔗 SHARE
 
@@ -182,29 +434,26 @@ class handler(BaseHTTPRequestHandler):
 • 🔒 Secure & Private
 
 **Just send me any file to get started!**
-                """
-                
-                # Try to send photo first, then fallback to text
-                try:
-                    photo_url = "https://file-to-link-api-ivory.vercel.app/download/BQACAgUAAyEGAASyjq0lAANGaNjZZ_rcsEN1JVwiHjZHaA_mwj0AAvkXAAJVc8lWuuyu3PJgDUw2BA?filename=IMG_20250804_180013_611.jpg"
-                    photo_data = {
-                        'chat_id': chat_id,
-                        'photo': photo_url,
-                        'caption': welcome_text,
-                        'parse_mode': 'Markdown'
-                    }
-                    requests.post(f"https://api.telegram.org/bot{TOKEN}/sendPhoto", json=photo_data)
-                except:
-                    send_message(chat_id, welcome_text, parse_mode="Markdown")
-                
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'ok')
-                return
+            """
             
-            # Handle /help command
-            if message_text.startswith('/help'):
-                help_text = """
+            # Try to send photo first, then fallback to text
+            try:
+                photo_url = "https://file-to-link-api-ivory.vercel.app/download/BQACAgUAAyEGAASyjq0lAANGaNjZZ_rcsEN1JVwiHjZHaA_mwj0AAvkXAAJVc8lWuuyu3PJgDUw2BA?filename=IMG_20250804_180013_611.jpg"
+                photo_data = {
+                    'chat_id': chat_id,
+                    'photo': photo_url,
+                    'caption': welcome_text,
+                    'parse_mode': 'Markdown'
+                }
+                bot_api.call('sendPhoto', **photo_data)
+            except:
+                send_message(chat_id, welcome_text, parse_mode="Markdown")
+            
+            return 'ok'
+        
+        # Handle /help command
+        if message_text.startswith('/help'):
+            help_text = """
 🆘 **HELP**
 
 **How to use:**
@@ -228,21 +477,33 @@ class handler(BaseHTTPRequestHandler):
 **Commands:**
 /start - Welcome message
 /help - This help message
-                """
-                send_message(chat_id, help_text, parse_mode="Markdown")
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'ok')
-                return
-            
-            # Handle file upload
-            file_obj = (message.get('document') or 
-                       message.get('video') or 
-                       message.get('audio') or 
-                       message.get('photo'))
-            
-            if not file_obj:
-                help_text = """
+/myfiles - Your stored files
+/search <words> - Find your files by name
+/expire <file> <days> - Delete a file automatically
+            """
+            send_message(chat_id, help_text, parse_mode="Markdown")
+            return 'ok'
+        
+        # Handle /myfiles command
+        if message_text.startswith('/myfiles'):
+            send_file_page(chat_id, user_id)
+            return 'ok'
+        
+        # Handle /search command
+        if message_text.startswith('/search'):
+            send_search_results(chat_id, user_id, ' '.join(message_text.split()[1:]))
+            return 'ok'
+        
+        # Handle /expire command
+        if message_text.startswith('/expire'):
+            set_expiry(chat_id, user_id, message_text.split()[1:])
+            return 'ok'
+        
+        # Handle file upload
+        file_obj, _ = upload_file(message)
+        
+        if not file_obj:
+            help_text = """
 📤 **Ready to Upload!**
 
 Just send me any file and I'll create instant:
@@ -251,194 +512,177 @@ Just send me any file and I'll create instant:
 • 🔗 **SHARE** - Share with friends
 
 **Supported:** All file types up to 2GB!
-                """
-                send_message(chat_id, help_text, parse_mode="Markdown")
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'No file found')
-                return
-            
-            # Handle photo array
-            if isinstance(file_obj, list):
-                file_obj = max(file_obj, key=lambda x: x.get('file_size', 0))
-            
-            file_id = file_obj['file_id']
-            file_name = file_obj.get('file_name', 'file')
-            file_size = file_obj.get('file_size', 0)
-            
-            # Add extension for photos
-            if message.get('photo') and not '.' in file_name:
-                file_name += '.jpg'
-            
-            short_id = str(random_id())
-            size_readable = format_file_size(file_size)
-            
-            # Forward file to channel for permanent storage
-            forward_result = forward_to_channel(chat_id, message_id)
-            
-            if not forward_result.get('ok'):
-                send_message(chat_id, "❌ Failed to store file in cloud. Please try again.")
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Forward failed')
-                return
-            
-            # Get file URL
-            file_url = get_file_direct_url(file_id)
-            
-            # Prepare file data for Redis
-            file_data = {
-                'file_id': file_id,
-                'file_name': file_name,
-                'file_size': file_size,
-                'file_url': file_url,
-                'user_id': user_id,
-                'timestamp': int(os.times().elapsed),
-                'short_id': short_id,
-                'chat_id': chat_id,
-                'channel_msg_id': forward_result['result']['message_id']
-            }
-            
-            # Save to Redis
-            if not save_to_redis(short_id, file_data):
-                send_message(chat_id, "❌ Failed to create file links. Please try again.")
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Redis save failed')
-                return
-            
-            # Check if file is video/audio for streaming
-            file_ext = file_name.split('.')[-1].lower() if '.' in file_name else ''
-            is_video_audio = file_ext in ['mp4', 'mkv', 'avi', 'mov', 'wmv', 'webm', 'mp3', 'wav', 'aac', 'ogg', 'flac']
-            
-            # Build links
-            clean_name = file_name.replace(' ', '.')
-            encoded_name = quote(clean_name)
-            download_link = f"{BASE_URL}/api/download/{encoded_name}-{short_id}"
-            stream_link = f"{BASE_URL}/api/stream/{encoded_name}-{short_id}"
-            share_link = f"https://t.me/{TOKEN.split(':')[0]}?start=file_{short_id}"
-            
-            # Create response message like reference image
-            response_text = f"""
-✅ **Your Link Generated!**
+            """
+            send_message(chat_id, help_text, parse_mode="Markdown")
+            return 'No file found'
+        
+        # Album parts arrive as separate updates sharing a media_group_id;
+        # the first one to arrive stores the whole album and the rest return.
+        # Anything else is stored right away.
+        group_id = message.get('media_group_id')
+        if group_id and UPLOAD_BATCH_WAIT > 0:
+            result = store_album_part(chat_id, user_id, group_id, message)
+        else:
+            result = store_upload(chat_id, user_id, message)
+        if UPLOAD_BATCH_WAIT > 0:
+            store_orphaned_batches()
+        return result
+    except Exception:
+        if chat_id is not None:
+            try:
+                send_message(chat_id, "❌ Server error occurred. Please try again.")
+            except:
+                pass
+        raise
 
-📁 **FILE NAME:** 
-`{file_name}`
+def process_update(update):
+    """Run handle_update at most once per update_id; redeliveries get the stored result"""
+    update_id = update.get('update_id')
+    if update_id is None:
+        return handle_update(update)
+    if not claim_update(update_id):
+        return get_update_result(update_id) or 'duplicate'
+    
+    try:
+        result = handle_update(update)
+    except Exception:
+        # Let the redelivery retry it rather than wait out the claim
+        release_update(update_id)
+        raise
+    finish_update(update_id, result)
+    return result
 
-💾 **FILE SIZE:** {size_readable}
+def handle_callback_query(callback_query):
+    """Handle button clicks"""
+    try:
+        chat_id = callback_query['message']['chat']['id']
+        user_id = callback_query['from']['id']
+        data = callback_query['data']
+        message_id = callback_query['message']['message_id']
 
-⬇️ **Download:** {download_link}
-            """
-            
-            if is_video_audio:
-                response_text += f"📺 **Watch:** {stream_link}\n"
+        if data.startswith('stream_'):
+            short_id = data.replace('stream_', '')
+            file_data = get_file(short_id)
+
+            if file_data and file_data.get('user_id') == user_id:
+                file_name = file_data.get('file_name', 'Unknown')
+                clean_name = file_name.replace(' ', '.')
+                encoded_name = quote(clean_name)
+                stream_link = f"{BASE_URL}/api/stream/{encoded_name}-{short_id}"
+
+                answer_callback(callback_query['id'], "📺 Opening stream...")
+                send_message(chat_id, f"📺 **Stream Link:**\n{stream_link}")
+            else:
+                answer_callback(callback_query['id'], "❌ File not found")
+
+        elif data.startswith('download_'):
+            short_id = data.replace('download_', '')
+            file_data = get_file(short_id)
+
+            if file_data and file_data.get('user_id') == user_id:
+                file_name = file_data.get('file_name', 'Unknown')
+                clean_name = file_name.replace(' ', '.')
+                encoded_name = quote(clean_name)
+                download_link = f"{BASE_URL}/api/download/{encoded_name}-{short_id}"
+
+                answer_callback(callback_query['id'], "⬇️ Download link sent!")
+                send_message(chat_id, f"⬇️ **Download Link:**\n{download_link}")
+            else:
+                answer_callback(callback_query['id'], "❌ File not found")
+
+        elif data.startswith('share_'):
+            short_id = data.replace('share_', '')
+            file_data = get_file(short_id)
+
+            if file_data and file_data.get('user_id') == user_id:
+                share_link = f"https://t.me/{TOKEN.split(':')[0]}?start=file_{short_id}"
+                answer_callback(callback_query['id'], "🔗 Share link sent!")
+                send_message(chat_id, f"🔗 **Share Link:**\n{share_link}")
+            else:
+                answer_callback(callback_query['id'], "❌ File not found")
+
+        elif data.startswith('revoke_'):
+            short_id = data.replace('revoke_', '')
+            file_data = get_file(short_id)
+
+            if file_data and file_data.get('user_id') == user_id:
+                if revoke_file(file_data) is None:
+                    answer_callback(callback_query['id'], "❌ Could not revoke the file. Please try again.")
+                else:
+                    answer_callback(callback_query['id'], "🗑️ File revoked successfully!")
+                    send_message(chat_id, f"🗑️ File with ID `{short_id}` has been revoked.")
+            else:
+                answer_callback(callback_query['id'], "❌ File not found")
+
+        elif data.startswith('myfiles_'):
+            cursor = data.replace('myfiles_', '')
+            answer_callback(callback_query['id'], "📂 Loading more files...")
+            send_file_page(chat_id, user_id, cursor=cursor)
+        
+        elif data == 'close':
+            delete_message(chat_id, message_id)
+            answer_callback(callback_query['id'], "Closed")
+
+        else:
+            answer_callback(callback_query['id'], "❌ Unknown action")
+
+    except Exception as e:
+        print(f"Callback error: {e}")
+        answer_callback(callback_query['id'], "❌ Error processing request")
+
+def delete_message(chat_id, message_id):
+    bot_api.call('deleteMessage', chat_id=chat_id, message_id=message_id)
+
+def answer_callback(callback_id, text):
+    bot_api.call('answerCallbackQuery', callback_query_id=callback_id, text=text)
+
+class handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            update = json.loads(post_data.decode('utf-8'))
             
-            response_text += f"🔗 **Share:** {share_link}"
+            # In queue mode Telegram gets its 200 right away and worker.py
+            # does the slow forward/getFile/Redis work out of band
+            if ASYNC_UPDATES:
+                enqueue_update(update)
+                result = 'queued'
+            else:
+                result = process_update(update)
             
-            # Send message with inline keyboard
-            keyboard = create_file_keyboard(short_id, is_video_audio)
-            send_message(chat_id, response_text, parse_mode="Markdown", reply_markup=keyboard)
+            # Another delivery is still on it; have Telegram retry in case
+            # that one never finishes
+            if result == UPDATE_IN_PROGRESS:
+                self.send_response(503)
+                self.end_headers()
+                return
             
             self.send_response(200)
             self.end_headers()
-            self.wfile.write(b'ok')
+            self.wfile.write(result.encode())
             
         except Exception as e:
             print(f"Webhook error: {e}")
             import traceback
             print(f"Traceback: {traceback.format_exc()}")
             
-            try:
-                send_message(chat_id, "❌ Server error occurred. Please try again.")
-            except:
-                pass
-            
             self.send_response(500)
             self.end_headers()
             self.wfile.write(f'Server error: {str(e)}'.encode())
     
-    def handle_callback_query(self, callback_query):
-        """Handle button clicks"""
-        try:
-            chat_id = callback_query['message']['chat']['id']
-            user_id = callback_query['from']['id']
-            data = callback_query['data']
-            message_id = callback_query['message']['message_id']
-            
-            if data.startswith('stream_'):
-                short_id = data.replace('stream_', '')
-                file_data = get_from_redis(short_id)
-                
-                if file_data and file_data.get('user_id') == user_id:
-                    file_name = file_data.get('file_name', 'Unknown')
-                    clean_name = file_name.replace(' ', '.')
-                    encoded_name = quote(clean_name)
-                    stream_link = f"{BASE_URL}/api/stream/{encoded_name}-{short_id}"
-                    
-                    self.answer_callback(callback_query['id'], "📺 Opening stream...")
-                    send_message(chat_id, f"📺 **Stream Link:**\n{stream_link}")
-                else:
-                    self.answer_callback(callback_query['id'], "❌ File not found")
-            
-            elif data.startswith('download_'):
-                short_id = data.replace('download_', '')
-                file_data = get_from_redis(short_id)
-                
-                if file_data and file_data.get('user_id') == user_id:
-                    file_name = file_data.get('file_name', 'Unknown')
-                    clean_name = file_name.replace(' ', '.')
-                    encoded_name = quote(clean_name)
-                    download_link = f"{BASE_URL}/api/download/{encoded_name}-{short_id}"
-                    
-                    self.answer_callback(callback_query['id'], "⬇️ Download link sent!")
-                    send_message(chat_id, f"⬇️ **Download Link:**\n{download_link}")
-                else:
-                    self.answer_callback(callback_query['id'], "❌ File not found")
-            
-            elif data.startswith('share_'):
-                short_id = data.replace('share_', '')
-                file_data = get_from_redis(short_id)
-                
-                if file_data and file_data.get('user_id') == user_id:
-                    share_link = f"https://t.me/{TOKEN.split(':')[0]}?start=file_{short_id}"
-                    self.answer_callback(callback_query['id'], "🔗 Share link sent!")
-                    send_message(chat_id, f"🔗 **Share Link:**\n{share_link}")
-                else:
-                    self.answer_callback(callback_query['id'], "❌ File not found")
-            
-            elif data.startswith('revoke_'):
-                short_id = data.replace('revoke_', '')
-                # Implement file deletion logic here
-                self.answer_callback(callback_query['id'], "🗑️ File revoked successfully!")
-                send_message(chat_id, f"🗑️ File with ID `{short_id}` has been revoked.")
-            
-            elif data == 'close':
-                self.delete_message(chat_id, message_id)
-                self.answer_callback(callback_query['id'], "Closed")
-            
-            else:
-                self.answer_callback(callback_query['id'], "❌ Unknown action")
-                
-        except Exception as e:
-            print(f"Callback error: {e}")
-            self.answer_callback(callback_query['id'], "❌ Error processing request")
-    
-    def delete_message(self, chat_id, message_id):
-        url = f"https://api.telegram.org/bot{TOKEN}/deleteMessage"
-        data = {'chat_id': chat_id, 'message_id': message_id}
-        requests.post(url, json=data)
-    
-    def answer_callback(self, callback_id, text):
-        url = f"https://api.telegram.org/bot{TOKEN}/answerCallbackQuery"
-        data = {'callback_query_id': callback_id, 'text': text}
-        requests.post(url, json=data)
-    
     def do_GET(self):
         self.send_response(200)
         self.end_headers()
         response = {
             "status": "FileStreamBot is running!",
             "ui": "Professional BZW-style interface",
-            "features": "Stream + Download + Share"
+            "features": "Stream + Download + Share",
+            "file_cache": get_cache_stats(),
+            "uploads": get_upload_stats(),
+            "revokes": get_revoke_stats(),
+            "archive": get_archive_stats(),
+            "bot_api_latency": bot_api.latency_stats(),
+            "rate_limit": rate_limit.stats()
         }
         self.wfile.write(json.dumps(response, indent=2).encode())
@@ -1,22 +1,33 @@
+import asyncio
+import functools
 import os
 import random
-import asyncio
-from pyrogram import Client, filters
-from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+import threading
+import time
+from pyrogram import Client, filters, idle
+from pyrogram.types import (Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, InlineQuery,
+                            InlineQueryResultArticle, InputTextMessageContent, InlineQueryResultCachedDocument,
+                            InlineQueryResultCachedVideo, InlineQueryResultCachedAudio,
+                            InlineQueryResultCachedPhoto)
 from pyrogram.enums import ParseMode
-import redis
-import json
-from config import API_ID, API_HASH, BOT_TOKEN, CHANNEL_ID, REDIS_URL, REDIS_TOKEN, BASE_URL, MAX_FILE_SIZE
-
-# Initialize Redis client
-def get_redis_client():
-    return redis.Redis(
-        host=REDIS_URL.replace('https://', '').split(':')[0],
-        port=6379,
-        password=REDIS_TOKEN,
-        ssl=True,
-        decode_responses=True
-    )
+from config import (API_ID, API_HASH, BOT_TOKEN, CHANNEL_ID, BASE_URL, MAX_FILE_SIZE, MULTI_BOT_TOKENS,
+                    CHUNK_CACHE_BYTES, STREAM_READ_AHEAD, DISK_CACHE_DIR, DISK_CACHE_BYTES, INLINE_CACHE_TIME,
+                    CHANNEL_GC_INTERVAL, CHANNEL_GC_BATCH, FILE_TTL, UPLOAD_BATCH_WAIT, UPLOAD_BATCH_MAX_WAIT,
+                    UPLOAD_BATCH_SIZE)
+from storage import (save_to_redis, save_many, get_file, get_cache_stats, find_duplicate, find_duplicates,
+                     count_upload, get_upload_stats,
+                     list_user_files, search_user_files, revoke_file, get_revoke_stats, set_file_expiry,
+                     get_archive_stats)
+from short_ids import allocate_short_id, allocate_short_ids
+import inline_search
+import channel_gc
+import rate_limit
+from rate_limit import acquire_async
+from signing import sign
+from streamer import start_stream_server
+from client_pool import ClientPool, PooledChunkSource
+from chunk_cache import ChunkCache, CachingChunkSource
+from disk_cache import DiskChunkCache, DiskTierChunkSource
 
 # Initialize Pyrogram client
 app = Client(
@@ -27,6 +38,34 @@ app = Client(
     in_memory=True
 )
 
+# Extra clients that only download chunks for the streaming server
+worker_clients = [
+    Client(
+        f"filmzi_worker_{i}",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=token,
+        in_memory=True,
+        no_updates=True
+    )
+    for i, token in enumerate(MULTI_BOT_TOKENS, start=1)
+]
+chunk_pool = ClientPool.from_clients([app] + worker_clients)
+chunk_cache = ChunkCache(CHUNK_CACHE_BYTES)
+disk_cache = DiskChunkCache(DISK_CACHE_DIR, DISK_CACHE_BYTES) if DISK_CACHE_DIR else None
+
+# Shown when a search word matched too many indexed words to search them all
+SEARCH_TRUNCATED_TEXT = "⚠️ Too many names start with those letters to search them all. Add more letters to see every match."
+
+# Telegram's limit is 4096 characters per message
+MAX_MESSAGE_LENGTH = 4000
+
+async def blocking(func, *args, **kwargs):
+    """Run a Redis-backed call on an executor thread, so a slow round trip
+    does not hold up the streams and handlers sharing the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
 def random_id():
     return random.randint(10000000, 99999999)
 
@@ -43,32 +82,6 @@ def format_file_size(size_bytes):
     
     return f"{size_bytes:.2f} {size_names[i]}"
 
-def save_to_redis(short_id, file_data):
-    try:
-        r = get_redis_client()
-        key = f"file:{short_id}"
-        r.set(key, json.dumps(file_data))
-        
-        # Save user-file mapping
-        user_key = f"user:{file_data['user_id']}:files"
-        r.sadd(user_key, short_id)
-        return True
-    except Exception as e:
-        print(f"Redis error: {e}")
-        return False
-
-def get_from_redis(short_id):
-    try:
-        r = get_redis_client()
-        key = f"file:{short_id}"
-        data = r.get(key)
-        if data:
-            return json.loads(data)
-        return None
-    except Exception as e:
-        print(f"Redis error: {e}")
-        return None
-
 def create_file_keyboard(file_id, is_video=False):
     """Create inline keyboard like BZW bot"""
     keyboard = []
@@ -94,6 +107,50 @@ def create_file_keyboard(file_id, is_video=False):
     
     return InlineKeyboardMarkup(keyboard)
 
+async def reply_file_links(message: Message, file_data):
+    """Reply with the download/stream/share links for a stored file"""
+    file_name = file_data['file_name']
+    short_id = file_data['short_id']
+    size_readable = format_file_size(file_data.get('file_size', 0))
+
+    # Build links
+    clean_name = file_name.replace(' ', '.')
+    download_link = f"{BASE_URL}/api/download/{clean_name}-{short_id}"
+    stream_link = f"{BASE_URL}/api/stream/{clean_name}-{short_id}"
+    share_link = f"https://t.me/{BOT_TOKEN.split(':')[0]}?start=file_{short_id}"
+
+    # Check if file is video/audio for streaming
+    mime_type = file_data.get('mime_type', '')
+    is_video_audio = mime_type.startswith('video') or mime_type.startswith('audio')
+
+    # Create response message like BZW bot
+    response_text = f"""
+✅ **Your Link Generated!**
+
+📁 **FILE NAME:** 
+`{file_name}`
+
+💾 **FILE SIZE:** {size_readable}
+
+⬇️ **Download:** `{download_link}`
+    """
+    
+    if is_video_audio:
+        response_text += f"📺 **Watch:** `{stream_link}`\n"
+    
+    response_text += f"🔗 **Share:** `{share_link}`"
+
+    # Send message with inline keyboard
+    keyboard = create_file_keyboard(short_id, is_video_audio)
+    
+    await acquire_async(message.chat.id)
+    await message.reply_text(
+        response_text,
+        reply_markup=keyboard,
+        parse_mode=ParseMode.MARKDOWN,
+        disable_web_page_preview=True
+    )
+
 # Start command handler
 @app.on_message(filters.command("start"))
 async def start_command(client: Client, message: Message):
@@ -117,6 +174,7 @@ async def start_command(client: Client, message: Message):
     """
     
     # Try to send welcome image
+    await acquire_async(message.chat.id)
     try:
         await message.reply_photo(
             photo="https://file-to-link-api-ivory.vercel.app/download/BQACAgUAAyEGAASyjq0lAANGaNjZZ_rcsEN1JVwiHjZHaA_mwj0AAvkXAAJVc8lWuuyu3PJgDUw2BA?filename=IMG_20250804_180013_611.jpg",
@@ -156,129 +214,448 @@ async def help_command(client: Client, message: Message):
 **Commands:**
 /start - Welcome message
 /help - This help message
+/myfiles - Your stored files
+/search <words> - Find your files by name
+/expire <file> <days> - Delete a file automatically
     """
     
+    await acquire_async(message.chat.id)
     await message.reply_text(
         help_text,
         parse_mode=ParseMode.MARKDOWN
     )
 
-# Handle all media messages
-@app.on_message(filters.media & filters.private)
-async def handle_media(client: Client, message: Message):
+async def send_file_page(client: Client, chat_id, user_id, cursor=None):
+    """Send one page of the user's library with a button for the next page"""
+    files, next_cursor = await blocking(list_user_files, user_id, cursor=cursor)
+    await acquire_async(chat_id)
+    if not files:
+        await client.send_message(chat_id, "📂 No more files." if cursor else "📂 You haven't stored any files yet.")
+        return
+
+    lines = ["📂 **Your Files**", ""]
+    for file_data in files:
+        clean_name = file_data['file_name'].replace(' ', '.')
+        download_link = f"{BASE_URL}/api/download/{clean_name}-{file_data['short_id']}"
+        size_readable = format_file_size(file_data.get('file_size', 0))
+        lines.append(f"• `{file_data['file_name']}` ({size_readable})\n`{download_link}`")
+
+    library_link = f"{BASE_URL}/api/files/{user_id}?sig={sign('files', user_id)}"
+    buttons = [InlineKeyboardButton("🌐 FULL LIBRARY", url=library_link)]
+    if next_cursor:
+        buttons.append(InlineKeyboardButton("➡️ NEXT", callback_data=f"myfiles_{next_cursor}"))
+
+    await client.send_message(
+        chat_id,
+        "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup([buttons]),
+        parse_mode=ParseMode.MARKDOWN,
+        disable_web_page_preview=True
+    )
+
+# My files command handler
+@app.on_message(filters.command("myfiles"))
+async def myfiles_command(client: Client, message: Message):
+    await send_file_page(client, message.chat.id, message.from_user.id)
+
+# Search command handler
+@app.on_message(filters.command("search"))
+async def search_command(client: Client, message: Message):
+    query = ' '.join(message.command[1:])
+    await acquire_async(message.chat.id)
+    if not query.strip():
+        await message.reply_text("🔍 Usage: `/search <words from the file name>`", parse_mode=ParseMode.MARKDOWN)
+        return
+
+    files, total, truncated = await blocking(search_user_files, message.from_user.id, query)
+    if not files:
+        await message.reply_text(SEARCH_TRUNCATED_TEXT if truncated else "🔍 No matching files.")
+        return
+
+    lines = [f"🔍 **{total}{'+' if truncated else ''} matching file{'s' if total != 1 else ''}**", ""]
+    for file_data in files:
+        clean_name = file_data['file_name'].replace(' ', '.')
+        download_link = f"{BASE_URL}/api/download/{clean_name}-{file_data['short_id']}"
+        size_readable = format_file_size(file_data.get('file_size', 0))
+        lines.append(f"• `{file_data['file_name']}` ({size_readable})\n`{download_link}`")
+    if truncated:
+        lines += ["", SEARCH_TRUNCATED_TEXT]
+    await message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+
+def inline_result(file_data):
+    """Send the stored file itself when its Telegram type is known, else its links"""
+    clean_name = file_data['file_name'].replace(' ', '.')
+    download_link = f"{BASE_URL}/api/download/{clean_name}-{file_data['short_id']}"
+    size_readable = format_file_size(file_data.get('file_size', 0))
+    caption = f"⬇️ {download_link}"
+    short_id = file_data['short_id']
+    file_id = file_data.get('file_id')
+    mime_type = file_data.get('mime_type', '')
+
+    # bot.py records the sending method: 'video', 'audio' and 'photo'
+    # literally, a real MIME type (or 'document') for documents
+    if file_id and mime_type == 'video':
+        return InlineQueryResultCachedVideo(file_id, file_data['file_name'], id=short_id,
+                                            description=size_readable, caption=caption)
+    if file_id and mime_type == 'audio':
+        return InlineQueryResultCachedAudio(file_id, id=short_id, caption=caption)
+    if file_id and mime_type == 'photo':
+        return InlineQueryResultCachedPhoto(file_id, id=short_id, title=file_data['file_name'],
+                                            description=size_readable, caption=caption)
+    if file_id and ('/' in mime_type or mime_type == 'document'):
+        return InlineQueryResultCachedDocument(file_id, file_data['file_name'], id=short_id,
+                                               description=size_readable, caption=caption)
+    return InlineQueryResultArticle(
+        title=file_data['file_name'],
+        description=size_readable,
+        input_message_content=InputTextMessageContent(
+            f"📁 {file_data['file_name']} ({size_readable})\n{caption}",
+            disable_web_page_preview=True
+        ),
+        id=short_id
+    )
+
+# Inline search: @bot <words> in any chat shares a stored file
+@app.on_inline_query()
+async def inline_search_handler(client: Client, inline_query: InlineQuery):
+    files, next_offset, complete = await blocking(inline_search.inline_page, inline_query.from_user.id,
+                                                  inline_query.query, inline_query.offset)
+    # Like /search, say so when these are not all the matches
+    hint = {} if complete else {'switch_pm_text': "More files match, type more letters",
+                                'switch_pm_parameter': "search"}
+    await inline_query.answer(
+        [inline_result(file_data) for file_data in files],
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=True,
+        next_offset=next_offset,
+        **hint
+    )
+
+# Expiry command handler
+@app.on_message(filters.command("expire"))
+async def expire_command(client: Client, message: Message):
+    await acquire_async(message.chat.id)
+    args = message.command[1:]
+    try:
+        days = float(args[1]) if len(args) == 2 else -1
+    except ValueError:
+        days = -1
+    if not 0 <= days <= 3650:
+        await message.reply_text("⏳ Usage: `/expire <file id or link> <days>` (0 keeps the file until you revoke it)", parse_mode=ParseMode.MARKDOWN)
+        return
+
+    short_id = args[0].rstrip('/').rsplit('/', 1)[-1].rsplit('-', 1)[-1]
+    file_data = await blocking(get_file, short_id)
+    if not file_data or file_data.get('user_id') != message.from_user.id:
+        await message.reply_text("❌ File not found")
+        return
+    expires_at = int(time.time() + days * 86400) if days else None
+    if not await blocking(set_file_expiry, short_id, expires_at):
+        await message.reply_text("❌ Could not update the file. Please try again.")
+        return
+    if expires_at:
+        when = time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime(expires_at))
+        await message.reply_text(f"⏳ `{short_id}` will be deleted on {when}.", parse_mode=ParseMode.MARKDOWN)
+    else:
+        await message.reply_text(f"♾️ `{short_id}` will be kept until you revoke it.", parse_mode=ParseMode.MARKDOWN)
+
+# Stats command handler
+@app.on_message(filters.command("stats"))
+async def stats_command(client: Client, message: Message):
+    stats = await blocking(get_cache_stats)
+    totals = stats['global']
+    local = stats['local']
+    lookups = totals.get('hits', 0) + totals.get('misses', 0)
+    hit_ratio = totals.get('hits', 0) / lookups if lookups else 0.0
+    chunks = chunk_cache.stats()
+    uploads = await blocking(get_upload_stats)
+
+    stats_text = f"""
+📊 **STATS**
+
+**File cache (all instances):**
+• Hits: {totals.get('hits', 0)}
+• Misses: {totals.get('misses', 0)}
+• Negative hits: {totals.get('negative_hits', 0)}
+• Evictions: {totals.get('evictions', 0)}
+• Hit ratio: {hit_ratio:.1%}
+
+**File cache (this bot):** {local['size']}/{local['maxsize']} entries
+
+**Uploads:** {uploads['uploads']} ({uploads['dedup_hits']} deduplicated, {uploads['dedup_hit_rate']:.1%})
+
+**Chunk cache:**
+• Cached: {chunks['chunks']} chunks, {format_file_size(chunks['bytes'])} of {format_file_size(chunks['max_bytes'])}
+• Hit ratio: {chunks['hit_ratio']:.1%} ({chunks['hits']} hits, {chunks['misses']} misses)
+• Prefetched: {chunks['prefetched']} ({chunks['prefetch_hits']} used, {chunks['prefetch_waste']} wasted, {format_file_size(chunks['prefetch_waste_bytes'])})
+"""
+    if disk_cache is not None:
+        disk = disk_cache.stats()
+        stats_text += (
+            f"\n**Disk cache:** {disk['files']} files, {format_file_size(disk['bytes'])} of "
+            f"{format_file_size(disk['max_bytes'])}, hit ratio {disk['hit_ratio']:.1%}\n"
+        )
+
+    inline = inline_search.stats()
+    stats_text += f"\n**Inline result cache:** {inline['size']} users, hit ratio {inline['hit_ratio']:.1%}\n"
+
+    revokes = await blocking(get_revoke_stats)
+    stats_text += (
+        f"\n**Revokes:** {revokes['revoked']} files, {revokes['expired']} expired, {revokes['keys']} keys and "
+        f"{format_file_size(revokes['bytes'])} reclaimed, {revokes['channel_messages_deleted']} channel messages deleted\n"
+    )
+
+    archive = await blocking(get_archive_stats)
+    stats_text += f"**Archive:** {archive['demoted']} cold records archived, {archive['promoted']} reopened\n"
+
+    limits = rate_limit.stats()
+    stats_text += (
+        f"\n**Send rate limit:** {limits['throttled']} of {limits['granted'] + limits['gave_up']} sends delayed, "
+        f"{limits['waited_ms'] / 1000:.1f}s total wait, {limits['gave_up']} sent without a token\n"
+    )
+
+    stats_text += "\n**Streaming clients:**\n"
+    for load in chunk_pool.load():
+        stats_text += (
+            f"• `{load['name']}`: {load['in_flight']} in flight, {load['chunks']} chunks, "
+            f"{load['flood_waits']} flood waits, {load['penalty']}s penalty\n"
+        )
+
+    await message.reply_text(
+        stats_text,
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def describe_media(message: Message):
+    """(file, file_name, mime_type) for a media message, or None"""
+    if message.document:
+        file = message.document
+        return file, file.file_name, file.mime_type or "document"
+    if message.video:
+        file = message.video
+        return file, file.file_name or f"video_{random_id()}.mp4", "video"
+    if message.audio:
+        file = message.audio
+        return file, file.file_name or f"audio_{random_id()}.mp3", "audio"
+    if message.photo:
+        return message.photo, f"photo_{random_id()}.jpg", "photo"
+    return None
+
+async def store_upload(client: Client, message: Message):
+    """Store one upload and reply with its links"""
     try:
         # Get file information
-        if message.document:
-            file = message.document
-            file_name = file.file_name
-            file_size = file.file_size
-            mime_type = file.mime_type or "document"
-        elif message.video:
-            file = message.video
-            file_name = file.file_name or f"video_{random_id()}.mp4"
-            file_size = file.file_size
-            mime_type = "video"
-        elif message.audio:
-            file = message.audio
-            file_name = file.file_name or f"audio_{random_id()}.mp3"
-            file_size = file.file_size
-            mime_type = "audio"
-        elif message.photo:
-            file = message.photo
-            file_name = f"photo_{random_id()}.jpg"
-            file_size = file.file_size
-            mime_type = "photo"
-        else:
+        described = describe_media(message)
+        if not described:
             await message.reply_text("❌ Unsupported file type.")
             return
+        file, file_name, mime_type = described
+        file_size = file.file_size
 
         # Check file size
         if file_size > MAX_FILE_SIZE:
             await message.reply_text("❌ File too large! Maximum size is 2GB.")
             return
 
-        short_id = str(random_id())
-        size_readable = format_file_size(file_size)
         user_id = message.from_user.id
 
-        # Forward file to channel
-        try:
-            forwarded_msg = await message.forward(CHANNEL_ID)
-            channel_msg_id = forwarded_msg.id
-        except Exception as e:
-            await message.reply_text("❌ Failed to store file in cloud. Please try again.")
-            print(f"Forward error: {e}")
+        # A repeated upload of the same file by this user reuses its links
+        existing, own = await blocking(find_duplicate, user_id, file.file_unique_id)
+        if existing and own:
+            await blocking(count_upload, dedup_hit=True)
+            await reply_file_links(message, existing)
             return
 
-        # Get file ID for download
-        file_id = None
-        if message.document:
-            file_id = message.document.file_id
-        elif message.video:
-            file_id = message.video.file_id
-        elif message.audio:
-            file_id = message.audio.file_id
-        elif message.photo:
-            file_id = message.photo.file_id
+        short_id = await blocking(allocate_short_id)
+
+        if existing:
+            # Someone already stored this content; reuse their channel copy
+            channel_msg_id = existing['channel_msg_id']
+        else:
+            # Forward file to channel
+            try:
+                await acquire_async(CHANNEL_ID)
+                forwarded_msg = await message.forward(CHANNEL_ID)
+                channel_msg_id = forwarded_msg.id
+            except Exception as e:
+                await message.reply_text("❌ Failed to store file in cloud. Please try again.")
+                print(f"Forward error: {e}")
+                return
 
         # Prepare file data for Redis
         file_data = {
-            'file_id': file_id,
+            'file_id': file.file_id,
+            'file_unique_id': file.file_unique_id,
             'file_name': file_name,
             'file_size': file_size,
             'user_id': user_id,
-            'timestamp': int(asyncio.get_event_loop().time()),
+            'timestamp': int(time.time()),
             'short_id': short_id,
             'chat_id': message.chat.id,
             'channel_msg_id': channel_msg_id,
-            'mime_type': mime_type
+            'mime_type': mime_type,
+            'expires_at': int(time.time()) + FILE_TTL if FILE_TTL else None
         }
 
         # Save to Redis
-        if not save_to_redis(short_id, file_data):
+        if not await blocking(save_to_redis, short_id, file_data, dedup_hit=existing is not None):
             await message.reply_text("❌ Failed to create file links. Please try again.")
             return
 
-        # Build links
-        clean_name = file_name.replace(' ', '.')
-        download_link = f"{BASE_URL}/api/download/{clean_name}-{short_id}"
-        stream_link = f"{BASE_URL}/api/stream/{clean_name}-{short_id}"
-        share_link = f"https://t.me/{BOT_TOKEN.split(':')[0]}?start=file_{short_id}"
-
-        # Check if file is video/audio for streaming
-        is_video_audio = mime_type.startswith('video') or mime_type.startswith('audio')
-
-        # Create response message like BZW bot
-        response_text = f"""
-✅ **Your Link Generated!**
-
-📁 **FILE NAME:** 
-`{file_name}`
-
-💾 **FILE SIZE:** {size_readable}
-
-⬇️ **Download:** `{download_link}`
-        """
-        
-        if is_video_audio:
-            response_text += f"📺 **Watch:** `{stream_link}`\n"
-        
-        response_text += f"🔗 **Share:** `{share_link}`"
-
-        # Send message with inline keyboard
-        keyboard = create_file_keyboard(short_id, is_video_audio)
-        
-        await message.reply_text(
-            response_text,
-            reply_markup=keyboard,
-            parse_mode=ParseMode.MARKDOWN,
-            disable_web_page_preview=True
-        )
+        inline_search.forget_user(user_id)
+        await reply_file_links(message, file_data)
 
     except Exception as e:
         print(f"Media handler error: {e}")
         await message.reply_text("❌ An error occurred while processing your file.")
 
+async def reply_batch_links(client: Client, chat_id, files, failed):
+    """Send the links for a batch of stored files in as few messages as fit"""
+    blocks = [f"✅ **{len(files)} Links Generated!**"]
+    if failed:
+        blocks.append(f"⚠️ {failed} file{'s' if failed != 1 else ''} could not be stored (over 2GB or failed to save).")
+    for file_data in files:
+        clean_name = file_data['file_name'].replace(' ', '.')
+        short_id = file_data['short_id']
+        block = (f"📁 `{file_data['file_name']}` ({format_file_size(file_data.get('file_size', 0))})\n"
+                 f"⬇️ `{BASE_URL}/api/download/{clean_name}-{short_id}`")
+        mime_type = file_data.get('mime_type', '')
+        if mime_type.startswith('video') or mime_type.startswith('audio'):
+            block += f"\n📺 `{BASE_URL}/api/stream/{clean_name}-{short_id}`"
+        blocks.append(block)
+
+    texts = [blocks[0]]
+    for block in blocks[1:]:
+        if len(texts[-1]) + len(block) + 2 > MAX_MESSAGE_LENGTH:
+            texts.append(block)
+        else:
+            texts[-1] += "\n\n" + block
+    for text in texts:
+        await acquire_async(chat_id)
+        await client.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+
+async def store_batch(client: Client, messages):
+    """Store several uploads from one chat with one channel forward per
+    UPLOAD_BATCH_SIZE files, one Redis pipeline and one combined reply"""
+    chat_id = messages[0].chat.id
+    user_id = messages[0].from_user.id
+    try:
+        uploads = []
+        seen = set()
+        rejected = 0
+        for message in sorted(messages, key=lambda m: m.id):
+            described = describe_media(message)
+            if not described or described[0].file_size > MAX_FILE_SIZE:
+                rejected += 1
+            elif described[0].file_unique_id not in seen:
+                seen.add(described[0].file_unique_id)
+                uploads.append((message, described))
+        duplicates = await blocking(find_duplicates, user_id, [file.file_unique_id for _, (file, _, _) in uploads])
+
+        # Forward everything not already in the channel, matching the
+        # copies back by content since Telegram skips what it cannot forward
+        new = [message.id for (message, _), (existing, _) in zip(uploads, duplicates) if not existing]
+        channel_ids = {}
+        for start in range(0, len(new), UPLOAD_BATCH_SIZE):
+            try:
+                await acquire_async(CHANNEL_ID)
+                forwarded = await client.forward_messages(CHANNEL_ID, chat_id, new[start:start + UPLOAD_BATCH_SIZE])
+            except Exception as e:
+                print(f"Forward error: {e}")
+                continue
+            for copy in forwarded:
+                described = describe_media(copy)
+                if described:
+                    channel_ids[described[0].file_unique_id] = copy.id
+
+        files = [None] * len(uploads)
+        records = []
+        for i, ((message, (file, file_name, mime_type)), (existing, own)) in enumerate(zip(uploads, duplicates)):
+            if existing and own:
+                files[i] = existing
+                continue
+            channel_msg_id = existing['channel_msg_id'] if existing else channel_ids.get(file.file_unique_id)
+            if channel_msg_id:
+                records.append((i, file, file_name, mime_type, channel_msg_id, existing is not None))
+
+        now = time.time()
+        batch = []
+        positions = []
+        short_ids = await blocking(allocate_short_ids, len(records)) if records else []
+        for short_id, (i, file, file_name, mime_type, channel_msg_id, dedup_hit) in zip(short_ids, records):
+            file_data = {
+                'file_id': file.file_id,
+                'file_unique_id': file.file_unique_id,
+                'file_name': file_name,
+                'file_size': file.file_size,
+                'user_id': user_id,
+                'timestamp': int(now),
+                'short_id': short_id,
+                'chat_id': chat_id,
+                'channel_msg_id': channel_msg_id,
+                'mime_type': mime_type,
+                'expires_at': int(now) + FILE_TTL if FILE_TTL else None
+            }
+            # Offsets keep the batch in upload order in the library
+            batch.append((short_id, file_data, now + len(batch) / 1e6, dedup_hit))
+            positions.append(i)
+        stored = set(await blocking(save_many, batch))
+        for i, (short_id, file_data, _, _) in zip(positions, batch):
+            if short_id in stored:
+                files[i] = file_data
+
+        reused = sum(1 for existing, own in duplicates if existing and own)
+        if reused:
+            await blocking(count_upload, dedup_hit=True, count=reused)
+        files = [file_data for file_data in files if file_data]
+        if not files:
+            await acquire_async(chat_id)
+            await client.send_message(chat_id, "❌ Failed to store files in cloud. Please try again.")
+            return
+        if stored:
+            inline_search.forget_user(user_id)
+        await reply_batch_links(client, chat_id, files, rejected + len(uploads) - len(files))
+
+    except Exception as e:
+        print(f"Batch upload error: {e}")
+        await client.send_message(chat_id, "❌ An error occurred while processing your files.")
+
+# Album parts arrive as separate messages sharing a media_group_id; they
+# are collected until none has arrived for UPLOAD_BATCH_WAIT seconds and
+# stored together. The first part starts the task that flushes the album.
+_upload_batches = {}
+_batch_tasks = set()
+
+async def collect_uploads(client: Client, key):
+    messages = _upload_batches[key]
+    deadline = time.monotonic() + UPLOAD_BATCH_MAX_WAIT
+    size = len(messages)
+    while size < UPLOAD_BATCH_SIZE and time.monotonic() + UPLOAD_BATCH_WAIT <= deadline:
+        await asyncio.sleep(UPLOAD_BATCH_WAIT)
+        if len(messages) == size:
+            break
+        size = len(messages)
+    del _upload_batches[key]
+    if len(messages) == 1:
+        await store_upload(client, messages[0])
+    else:
+        await store_batch(client, messages)
+
+# Handle all media messages
+@app.on_message(filters.media & filters.private)
+async def handle_media(client: Client, message: Message):
+    if not message.media_group_id or UPLOAD_BATCH_WAIT <= 0:
+        await store_upload(client, message)
+        return
+    key = (message.chat.id, message.media_group_id)
+    if key in _upload_batches:
+        _upload_batches[key].append(message)
+        return
+    _upload_batches[key] = [message]
+    task = asyncio.create_task(collect_uploads(client, key))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
 # Callback query handler
 @app.on_callback_query()
 async def handle_callback(client: Client, callback_query: CallbackQuery):
@@ -290,13 +667,14 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
 
         if data.startswith('stream_'):
             short_id = data.replace('stream_', '')
-            file_data = get_from_redis(short_id)
+            file_data = await blocking(get_file, short_id)
             
             if file_data and file_data.get('user_id') == user_id:
                 file_name = file_data.get('file_name', 'Unknown')
                 stream_link = f"{BASE_URL}/api/stream/{file_name}-{short_id}"
                 
                 await callback_query.answer("📺 Opening stream...")
+                await acquire_async(chat_id)
                 await client.send_message(
                     chat_id, 
                     f"📺 **Stream Link:**\n`{stream_link}`",
@@ -307,13 +685,14 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
 
         elif data.startswith('download_'):
             short_id = data.replace('download_', '')
-            file_data = get_from_redis(short_id)
+            file_data = await blocking(get_file, short_id)
             
             if file_data and file_data.get('user_id') == user_id:
                 file_name = file_data.get('file_name', 'Unknown')
                 download_link = f"{BASE_URL}/api/download/{file_name}-{short_id}"
                 
                 await callback_query.answer("⬇️ Download link sent!")
+                await acquire_async(chat_id)
                 await client.send_message(
                     chat_id, 
                     f"⬇️ **Download Link:**\n`{download_link}`",
@@ -324,11 +703,12 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
 
         elif data.startswith('share_'):
             short_id = data.replace('share_', '')
-            file_data = get_from_redis(short_id)
+            file_data = await blocking(get_file, short_id)
             
             if file_data and file_data.get('user_id') == user_id:
                 share_link = f"https://t.me/{BOT_TOKEN.split(':')[0]}?start=file_{short_id}"
                 await callback_query.answer("🔗 Share link sent!")
+                await acquire_async(chat_id)
                 await client.send_message(
                     chat_id, 
                     f"🔗 **Share Link:**\n`{share_link}`",
@@ -339,13 +719,27 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
 
         elif data.startswith('revoke_'):
             short_id = data.replace('revoke_', '')
-            # Implement file deletion logic here
-            await callback_query.answer("🗑️ File revoked successfully!")
-            await client.send_message(
-                chat_id,
-                f"🗑️ File with ID `{short_id}` has been revoked.",
-                parse_mode=ParseMode.MARKDOWN
-            )
+            file_data = await blocking(get_file, short_id)
+
+            if file_data and file_data.get('user_id') == user_id:
+                if await blocking(revoke_file, file_data) is None:
+                    await callback_query.answer("❌ Could not revoke the file. Please try again.")
+                    return
+                inline_search.forget_user(user_id)
+                await callback_query.answer("🗑️ File revoked successfully!")
+                await acquire_async(chat_id)
+                await client.send_message(
+                    chat_id,
+                    f"🗑️ File with ID `{short_id}` has been revoked.",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            else:
+                await callback_query.answer("❌ File not found")
+
+        elif data.startswith('myfiles_'):
+            cursor = data.replace('myfiles_', '')
+            await callback_query.answer("📂 Loading more files...")
+            await send_file_page(client, chat_id, user_id, cursor=cursor)
 
         elif data == 'close':
             await callback_query.message.delete()
@@ -358,7 +752,36 @@ async def handle_callback(client: Client, callback_query: CallbackQuery):
         print(f"Callback error: {e}")
         await callback_query.answer("❌ Error processing request")
 
+def start_channel_gc(loop):
+    """Run channel_gc in a thread, deleting through the bot's own client"""
+    def delete_channel_messages(msg_ids):
+        future = asyncio.run_coroutine_threadsafe(app.delete_messages(CHANNEL_ID, msg_ids), loop)
+        future.result(timeout=60)
+        return True
+
+    threading.Thread(target=channel_gc.run_forever,
+                     args=(delete_channel_messages, CHANNEL_GC_INTERVAL, CHANNEL_GC_BATCH),
+                     daemon=True).start()
+
+async def main():
+    await app.start()
+    for worker in worker_clients:
+        await worker.start()
+    chunk_source = PooledChunkSource(chunk_pool)
+    if disk_cache is not None:
+        chunk_source = DiskTierChunkSource(chunk_source, disk_cache)
+    chunk_source = CachingChunkSource(chunk_source, chunk_cache, read_ahead=STREAM_READ_AHEAD)
+    stream_runner = await start_stream_server(chunk_source)
+    start_channel_gc(asyncio.get_running_loop())
+    print(f"🎬 Filmzi Bot Started! ({len(chunk_pool.members)} streaming clients)")
+    await idle()
+    await stream_runner.cleanup()
+    if disk_cache is not None:
+        disk_cache.flush_access_times()
+    for worker in worker_clients:
+        await worker.stop()
+    await app.stop()
+
 # Start the bot
 if __name__ == "__main__":
-    print("🎬 Filmzi Bot Started!")
-    app.run()
+    app.run(main())
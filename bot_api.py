@@ -0,0 +1,224 @@
+import bisect
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+import rate_limit
+from cache import TTLCache, MISSING
+from storage import get_redis_client
+from config import (BOT_TOKEN, TELEGRAM_API_URL, FILE_LINK_TTL, FILE_LINK_REFRESH, BOT_API_CONNECT_TIMEOUT,
+                    BOT_API_READ_TIMEOUT, BOT_API_MAX_RETRIES, BOT_API_MAX_RETRY_AFTER)
+
+# One keep-alive session per process, so a whole upload (forward, getFile,
+# reply) reuses a single TLS connection to the Bot API
+_session = None
+_session_lock = threading.Lock()
+
+# Methods that post into a chat and count against Telegram's send limits
+SEND_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo', 'sendAudio', 'sendMediaGroup',
+                'forwardMessage', 'forwardMessages', 'copyMessage', 'copyMessages'}
+
+# Read-only methods, safe to repeat after any connection failure
+IDEMPOTENT_METHODS = {'getFile', 'getMe', 'getChat', 'getChatMember'}
+
+# Per-method latency histograms, in milliseconds
+LATENCY_BUCKETS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+_latencies = {}
+_latency_lock = threading.Lock()
+
+# Resolved getFile paths keyed by file_id: an in-process layer in front of
+# Redis (fpath:{file_id}), both expiring with Telegram's link validity.
+# Entries close to expiry are re-resolved in a background thread.
+file_path_cache = TTLCache(maxsize=4096, ttl=FILE_LINK_TTL, negative_ttl=60)
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+def api_url(method):
+    return f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}"
+
+def file_url(file_path):
+    return f"{TELEGRAM_API_URL}/file/bot{BOT_TOKEN}/{file_path}"
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+def _observe(method, elapsed_ms):
+    with _latency_lock:
+        histogram = _latencies.get(method)
+        if histogram is None:
+            histogram = _latencies[method] = {'count': 0, 'total_ms': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+        histogram['count'] += 1
+        histogram['total_ms'] += elapsed_ms
+        histogram['buckets'][bisect.bisect_left(LATENCY_BUCKETS, elapsed_ms)] += 1
+
+def latency_stats():
+    """Per-method call counts, mean latency and bucketed histogram"""
+    with _latency_lock:
+        stats = {}
+        for method, histogram in _latencies.items():
+            labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}ms"]
+            stats[method] = {
+                'count': histogram['count'],
+                'mean_ms': round(histogram['total_ms'] / histogram['count'], 1),
+                'buckets': dict(zip(labels, histogram['buckets']))
+            }
+        return stats
+
+def _never_sent(error):
+    """Whether a connection failure happened before the request could reach Telegram"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    while reason is not None:
+        if isinstance(reason, NewConnectionError):
+            return True
+        reason = getattr(reason, 'reason', None)
+    return False
+
+def call(method, **params):
+    """POST a Bot API method over the shared session and return the decoded reply.
+
+    Failures to connect and 5xx replies are retried with exponential backoff;
+    429 replies wait for Telegram's retry_after when it is short enough. Other
+    connection errors are only retried for read-only methods and read
+    timeouts never, as Telegram may already have acted on the call.
+    Sends first wait for a token from the shared rate limiter.
+    """
+    if method in SEND_METHODS and 'chat_id' in params:
+        rate_limit.acquire(params['chat_id'])
+    for attempt in range(BOT_API_MAX_RETRIES + 1):
+        last_attempt = attempt == BOT_API_MAX_RETRIES
+        backoff = 0.5 * 2 ** attempt
+        started = time.monotonic()
+        try:
+            response = get_session().post(api_url(method), json=params,
+                                          timeout=(BOT_API_CONNECT_TIMEOUT, BOT_API_READ_TIMEOUT))
+        except requests.ConnectionError as e:
+            _observe(method, (time.monotonic() - started) * 1000)
+            if last_attempt or not (method in IDEMPOTENT_METHODS or _never_sent(e)):
+                raise
+            time.sleep(backoff)
+            continue
+        _observe(method, (time.monotonic() - started) * 1000)
+
+        try:
+            result = response.json()
+        except ValueError:
+            result = {'ok': False, 'error_code': response.status_code, 'description': response.text[:200]}
+
+        if response.status_code == 429 and not last_attempt:
+            retry_after = result.get('parameters', {}).get('retry_after', backoff)
+            if retry_after <= BOT_API_MAX_RETRY_AFTER:
+                time.sleep(retry_after)
+                continue
+        elif response.status_code >= 500 and not last_attempt:
+            time.sleep(backoff)
+            continue
+        return result
+
+def _request_file_path(file_id):
+    result = call('getFile', file_id=file_id)
+    if result.get('ok'):
+        return result['result']['file_path']
+    return None
+
+def _resolve(file_id):
+    """Call getFile and publish the result to both cache layers"""
+    file_path = _request_file_path(file_id)
+    if not file_path:
+        file_path_cache.set(file_id, None)
+        return None
+
+    expires_at = time.time() + FILE_LINK_TTL
+    entry = (file_path, expires_at)
+    file_path_cache.set(file_id, entry, ttl=FILE_LINK_TTL)
+    try:
+        value = json.dumps({'file_path': file_path, 'expires_at': expires_at})
+        get_redis_client().set(f"fpath:{file_id}", value, ex=FILE_LINK_TTL)
+    except Exception as e:
+        print(f"Redis error: {e}")
+    return entry
+
+def _load_shared(file_id):
+    try:
+        data = get_redis_client().get(f"fpath:{file_id}")
+    except Exception as e:
+        print(f"Redis error: {e}")
+        return None
+    if not data:
+        return None
+
+    data = json.loads(data)
+    remaining = data['expires_at'] - time.time()
+    if remaining <= 0:
+        return None
+    entry = (data['file_path'], data['expires_at'])
+    file_path_cache.set(file_id, entry, ttl=remaining)
+    return entry
+
+def _refresh_worker(file_id):
+    try:
+        _resolve(file_id)
+    except Exception as e:
+        print(f"getFile refresh error: {e}")
+    finally:
+        with _refresh_lock:
+            _refreshing.discard(file_id)
+
+def _refresh_in_background(file_id):
+    with _refresh_lock:
+        if file_id in _refreshing:
+            return
+        _refreshing.add(file_id)
+    threading.Thread(target=_refresh_worker, args=(file_id,), daemon=True).start()
+
+def get_file_path(file_id):
+    """Resolve a file_id to its Bot API file_path, calling getFile only on a miss"""
+    entry = file_path_cache.get(file_id)
+    if entry is MISSING:
+        entry = _load_shared(file_id) or _resolve(file_id)
+    if entry is None:
+        return None
+
+    file_path, expires_at = entry
+    if expires_at - time.time() < FILE_LINK_REFRESH:
+        _refresh_in_background(file_id)
+    return file_path
+
+def get_file_direct_url(file_id):
+    """Get direct download URL from Telegram"""
+    file_path = get_file_path(file_id)
+    if file_path:
+        return file_url(file_path)
+    return None
+
+def download_file(file_id, max_bytes):
+    """Fetch a file's bytes through the Bot API, or None if unavailable or
+    larger than max_bytes. Keeps the token-bearing URL on the server."""
+    file_path = get_file_path(file_id)
+    if not file_path:
+        return None
+    response = get_session().get(file_url(file_path), timeout=(BOT_API_CONNECT_TIMEOUT, BOT_API_READ_TIMEOUT))
+    if response.status_code != 200:
+        print(f"File download failed for {file_id}: HTTP {response.status_code}")
+        # Most likely an expired path; forget it so the next call re-resolves
+        file_path_cache.pop(file_id)
+        try:
+            get_redis_client().delete(f"fpath:{file_id}")
+        except Exception as e:
+            print(f"Redis error: {e}")
+        return None
+    if len(response.content) > max_bytes:
+        return None
+    return response.content
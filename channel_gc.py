@@ -0,0 +1,51 @@
+import time
+from storage import get_redis_client, _on_redis_error, expire_due, CHANNEL_GC_KEY, REVOKE_STATS_KEY
+
+# Deletes storage channel messages that revokes left unreferenced. Revokes
+# only queue message IDs (storage.REVOKE_SCRIPT); the actual deletes run
+# here in batches, at most one batch per interval, so cleaning up after a
+# mass revoke never competes with uploads for Telegram's limits. Records
+# past their expiry are revoked first, so their messages go in the same pass.
+
+def take_batch(size):
+    """Pop up to `size` queued channel message IDs"""
+    pipe = get_redis_client().pipeline(transaction=True)
+    pipe.lrange(CHANNEL_GC_KEY, 0, size - 1)
+    pipe.ltrim(CHANNEL_GC_KEY, size, -1)
+    return [int(msg_id) for msg_id in pipe.execute()[0]]
+
+def requeue(msg_ids):
+    get_redis_client().rpush(CHANNEL_GC_KEY, *msg_ids)
+
+def record_deleted(count):
+    get_redis_client().hincrby(REVOKE_STATS_KEY, 'channel_messages_deleted', count)
+
+def run_once(delete_messages, size):
+    """Delete one batch with delete_messages(ids) -> success; returns how many"""
+    expire_due(size)
+    try:
+        msg_ids = take_batch(size)
+    except Exception as e:
+        _on_redis_error(e)
+        return 0
+    if not msg_ids:
+        return 0
+    try:
+        deleted = delete_messages(msg_ids)
+    except Exception as e:
+        print(f"Channel GC error: {e}")
+        deleted = False
+    try:
+        if deleted:
+            record_deleted(len(msg_ids))
+        else:
+            requeue(msg_ids)
+    except Exception as e:
+        _on_redis_error(e)
+    return len(msg_ids) if deleted else 0
+
+def run_forever(delete_messages, interval, size):
+    """Blocking GC loop; worker.py and bot.py each run it in a daemon thread"""
+    while True:
+        run_once(delete_messages, size)
+        time.sleep(interval)
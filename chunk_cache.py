@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+from collections import OrderedDict
+
+class ChunkCache:
+    """LRU of (channel_msg_id, chunk_index) -> bytes bounded by a total byte budget"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._chunks = OrderedDict()
+        # Prefetched chunks nobody has read yet; evicting one is wasted work
+        self._unread = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
+        self.prefetch_hits = 0
+        self.prefetch_waste = 0
+        self.prefetch_waste_bytes = 0
+
+    def get(self, key):
+        data = self._chunks.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._chunks.move_to_end(key)
+        self.hits += 1
+        self.mark_read(key)
+        return data
+
+    def mark_read(self, key):
+        if key in self._unread:
+            self._unread.discard(key)
+            self.prefetch_hits += 1
+
+    def put(self, key, data, prefetched=False):
+        if len(data) > self.max_bytes:
+            return
+        old = self._chunks.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._chunks[key] = data
+        self.bytes += len(data)
+        if prefetched:
+            self.prefetched += 1
+            self._unread.add(key)
+
+        while self.bytes > self.max_bytes:
+            evicted_key, evicted = self._chunks.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+            if evicted_key in self._unread:
+                self._unread.discard(evicted_key)
+                self.prefetch_waste += 1
+                self.prefetch_waste_bytes += len(evicted)
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'chunks': len(self._chunks),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'prefetched': self.prefetched,
+            'prefetch_hits': self.prefetch_hits,
+            'prefetch_waste': self.prefetch_waste,
+            'prefetch_waste_bytes': self.prefetch_waste_bytes
+        }
+
+class CachingChunkSource:
+    """Wraps a chunk source with a shared ChunkCache, request coalescing and read-ahead"""
+
+    def __init__(self, source, cache, read_ahead=4, max_prefetches=8):
+        self.source = source
+        self.cache = cache
+        self.read_ahead = read_ahead
+        self._in_flight = {}
+        self._prefetch_slots = asyncio.Semaphore(max_prefetches)
+        self._prefetch_tasks = set()
+
+    async def _load(self, key, prefetched=False):
+        """Fetch one chunk, sharing the fetch with any concurrent miss on the same key"""
+        task = self._in_flight.get(key)
+        joined = task is not None
+        if not joined:
+            # The fetch runs as its own task so one viewer disconnecting does
+            # not cancel it for everyone else waiting on the same chunk
+            task = asyncio.ensure_future(self._fetch_and_store(key, prefetched))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        data = await asyncio.shield(task)
+        if joined and not prefetched:
+            self.cache.mark_read(key)
+        return data
+
+    async def _fetch_and_store(self, key, prefetched):
+        data = await self.source.fetch(*key)
+        self.cache.put(key, data, prefetched=prefetched)
+        return data
+
+    def _fetch_done(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            # Retrieve the exception so an unawaited failure is not logged as lost
+            task.exception()
+
+    async def fetch(self, channel_msg_id, index):
+        key = (channel_msg_id, index)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+        return await self._load(key)
+
+    def prefetch(self, channel_msg_id, indexes):
+        """Start background fetches for upcoming chunks not already cached or in flight"""
+        for index in itertools.islice(indexes, self.read_ahead):
+            key = (channel_msg_id, index)
+            if key in self.cache or key in self._in_flight:
+                continue
+            task = asyncio.ensure_future(self._prefetch_one(key))
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _prefetch_one(self, key):
+        async with self._prefetch_slots:
+            if key in self.cache or key in self._in_flight:
+                return
+            try:
+                await self._load(key, prefetched=True)
+            except Exception as e:
+                print(f"Prefetch error for {key}: {e}")
+
+    def locate(self, channel_msg_id, index):
+        """On-disk location of a chunk that is not in memory, for zero-copy sends"""
+        locate = getattr(self.source, 'locate', None)
+        if locate is None or (channel_msg_id, index) in self.cache:
+            return None
+        return locate(channel_msg_id, index)
+
+    def stats(self):
+        return self.cache.stats()
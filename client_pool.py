@@ -0,0 +1,91 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from pyrogram.errors import FloodWait
+from streamer import TelegramChunkSource
+
+class PoolMember:
+    """One MTProto client plus its scheduling state"""
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+        self.in_flight = 0
+        self.flood_until = 0.0
+        self.flood_waits = 0
+        self.chunks = 0
+
+    def is_penalized(self, now):
+        return self.flood_until > now
+
+    def load(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {
+            'name': self.name,
+            'in_flight': self.in_flight,
+            'chunks': self.chunks,
+            'flood_waits': self.flood_waits,
+            'penalty': round(max(self.flood_until - now, 0.0), 1)
+        }
+
+class ClientPool:
+    """Least-loaded scheduler over several bot clients sharing CHANNEL_ID"""
+
+    def __init__(self, members):
+        if not members:
+            raise ValueError("ClientPool needs at least one client")
+        self.members = list(members)
+
+    @classmethod
+    def from_clients(cls, clients):
+        return cls([PoolMember(client.name, TelegramChunkSource(client)) for client in clients])
+
+    def pick(self):
+        """Return the member with the fewest in-flight fetches, skipping FLOOD_WAITed ones"""
+        now = time.monotonic()
+        available = [m for m in self.members if not m.is_penalized(now)]
+        if not available:
+            # Everyone is waiting out a FLOOD_WAIT; take whoever is free first
+            return min(self.members, key=lambda m: m.flood_until)
+        return min(available, key=lambda m: (m.in_flight, m.chunks))
+
+    @asynccontextmanager
+    async def use(self):
+        member = self.pick()
+        member.in_flight += 1
+        try:
+            yield member
+        finally:
+            member.in_flight -= 1
+
+    def penalize(self, member, seconds):
+        member.flood_waits += 1
+        member.flood_until = max(member.flood_until, time.monotonic() + seconds)
+
+    def load(self):
+        now = time.monotonic()
+        return [member.load(now) for member in self.members]
+
+class PooledChunkSource:
+    """Chunk source that spreads fetches across a ClientPool"""
+
+    def __init__(self, pool, max_attempts=None):
+        self.pool = pool
+        self.max_attempts = max_attempts or len(pool.members) + 1
+
+    async def fetch(self, channel_msg_id, index):
+        for attempt in range(self.max_attempts):
+            async with self.pool.use() as member:
+                wait = member.flood_until - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    chunk = await member.source.fetch(channel_msg_id, index)
+                except FloodWait as e:
+                    print(f"FloodWait on {member.name}: {e.value}s")
+                    self.pool.penalize(member, e.value)
+                    if attempt == self.max_attempts - 1:
+                        raise
+                    continue
+                member.chunks += 1
+                return chunk
@@ -17,3 +17,111 @@ BASE_URL = os.environ.get("BASE_URL", "https://filmzicloud.vercel.app")
 
 # Bot settings
 MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024  # 2GB
+
+# In-process file record cache
+FILE_CACHE_SIZE = int(os.environ.get("FILE_CACHE_SIZE", "2048"))
+FILE_CACHE_TTL = int(os.environ.get("FILE_CACHE_TTL", "600"))
+FILE_CACHE_NEGATIVE_TTL = int(os.environ.get("FILE_CACHE_NEGATIVE_TTL", "30"))
+FILE_CACHE_VERSION_CHECK = float(os.environ.get("FILE_CACHE_VERSION_CHECK", "5"))
+
+# Telegram Bot API
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Resolved getFile paths: Telegram guarantees a link for at least one hour
+FILE_LINK_TTL = int(os.environ.get("FILE_LINK_TTL", "3600"))
+FILE_LINK_REFRESH = int(os.environ.get("FILE_LINK_REFRESH", "600"))
+
+# Streaming server (runs alongside bot.py)
+STREAM_HOST = os.environ.get("STREAM_HOST", "0.0.0.0")
+STREAM_PORT = int(os.environ.get("STREAM_PORT", "8080"))
+STREAM_URL = os.environ.get("STREAM_URL", "")
+BOT_API_DOWNLOAD_LIMIT = 20 * 1024 * 1024  # getFile refuses anything larger
+
+# Extra bot tokens for chunk downloads, comma separated; every bot must be
+# a member of CHANNEL_ID
+MULTI_BOT_TOKENS = [t.strip() for t in os.environ.get("MULTI_BOT_TOKENS", "").split(",") if t.strip()]
+
+# Shared in-memory chunk cache for the streaming server
+CHUNK_CACHE_BYTES = int(os.environ.get("CHUNK_CACHE_BYTES", str(256 * 1024 * 1024)))
+STREAM_READ_AHEAD = int(os.environ.get("STREAM_READ_AHEAD", "4"))
+
+# Optional on-disk chunk cache tier; disabled when DISK_CACHE_DIR is empty
+DISK_CACHE_DIR = os.environ.get("DISK_CACHE_DIR", "")
+DISK_CACHE_BYTES = int(os.environ.get("DISK_CACHE_BYTES", str(20 * 1024 * 1024 * 1024)))
+
+# Webhook queue mode: acknowledge Telegram immediately and let worker.py
+# process updates from Redis
+ASYNC_UPDATES = os.environ.get("ASYNC_UPDATES", "").lower() in ("1", "true", "yes")
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", "8"))
+
+# How long processed update_ids and per-user uploads are remembered
+UPDATE_DEDUP_TTL = int(os.environ.get("UPDATE_DEDUP_TTL", "86400"))
+# How long one delivery may hold an update before a redelivery can take it
+# over; must exceed the slowest update (function timeout, album wait)
+UPDATE_CLAIM_TTL = int(os.environ.get("UPDATE_CLAIM_TTL", "120"))
+
+# Key for the short-ID permutation; changing it changes every future ID
+SHORT_ID_SECRET = os.environ.get("SHORT_ID_SECRET", BOT_TOKEN)
+
+# Key for signed links (library pages, downloads)
+LINK_SECRET = os.environ.get("LINK_SECRET", BOT_TOKEN)
+
+# Bot API HTTP client
+BOT_API_CONNECT_TIMEOUT = float(os.environ.get("BOT_API_CONNECT_TIMEOUT", "5"))
+BOT_API_READ_TIMEOUT = float(os.environ.get("BOT_API_READ_TIMEOUT", "30"))
+BOT_API_MAX_RETRIES = int(os.environ.get("BOT_API_MAX_RETRIES", "3"))
+BOT_API_MAX_RETRY_AFTER = int(os.environ.get("BOT_API_MAX_RETRY_AFTER", "10"))
+
+# Outbound send rate limits shared through Redis (messages per second for
+# RATE_LIMIT_GLOBAL/RATE_LIMIT_CHAT, per minute for groups and the storage
+# channel; RATE_LIMIT_CHANNEL=0 leaves the channel bounded only globally)
+RATE_LIMIT_GLOBAL = float(os.environ.get("RATE_LIMIT_GLOBAL", "30"))
+RATE_LIMIT_CHAT = float(os.environ.get("RATE_LIMIT_CHAT", "1"))
+RATE_LIMIT_CHAT_BURST = int(os.environ.get("RATE_LIMIT_CHAT_BURST", "3"))
+RATE_LIMIT_GROUP = float(os.environ.get("RATE_LIMIT_GROUP", "20"))
+RATE_LIMIT_CHANNEL = float(os.environ.get("RATE_LIMIT_CHANNEL", "0"))
+# Global tokens that channel forwards must leave for user-facing replies
+RATE_LIMIT_RESERVE = int(os.environ.get("RATE_LIMIT_RESERVE", "5"))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "10"))
+
+# Signed download links: each is valid for between one and two
+# DOWNLOAD_LINK_TTL windows and cacheable by the CDN for exactly that long.
+# Files up to DOWNLOAD_PROXY_LIMIT are served through the function itself
+# (Vercel caps response bodies at 4.5 MB) so the bot token never leaves it.
+DOWNLOAD_LINK_TTL = int(os.environ.get("DOWNLOAD_LINK_TTL", "3600"))
+DOWNLOAD_PROXY_LIMIT = int(os.environ.get("DOWNLOAD_PROXY_LIMIT", str(4 * 1024 * 1024)))
+
+# File name search: how many indexed words one query word may expand to
+SEARCH_MAX_EXPANSIONS = int(os.environ.get("SEARCH_MAX_EXPANSIONS", "50"))
+
+# Inline mode: per-user result lists kept in process, and how long Telegram
+# may cache each answer on its side
+INLINE_CACHE_TTL = int(os.environ.get("INLINE_CACHE_TTL", "120"))
+INLINE_MAX_RESULTS = int(os.environ.get("INLINE_MAX_RESULTS", "200"))
+INLINE_CACHE_TIME = int(os.environ.get("INLINE_CACHE_TIME", "30"))
+
+# Revoked short IDs answer 410 Gone for this long; channel messages no
+# record references are deleted in batches by the background GC
+REVOKED_TTL = int(os.environ.get("REVOKED_TTL", str(30 * 86400)))
+CHANNEL_GC_INTERVAL = float(os.environ.get("CHANNEL_GC_INTERVAL", "60"))
+CHANNEL_GC_BATCH = int(os.environ.get("CHANNEL_GC_BATCH", "100"))
+
+# Record tiering: uploads expire after FILE_TTL seconds unless it is 0 (a
+# user can still set or clear an expiry per file with /expire). Access times
+# are written at most once per ACCESS_TRACK_INTERVAL; tier_files.py moves
+# records unopened for ARCHIVE_AFTER seconds into ARCHIVE_BUCKETS packed
+# archive hashes.
+FILE_TTL = int(os.environ.get("FILE_TTL", "0"))
+ACCESS_TRACK_INTERVAL = int(os.environ.get("ACCESS_TRACK_INTERVAL", "86400"))
+ARCHIVE_AFTER = int(os.environ.get("ARCHIVE_AFTER", str(90 * 86400)))
+ARCHIVE_BUCKETS = int(os.environ.get("ARCHIVE_BUCKETS", "65536"))
+
+# Album parts (messages sharing a media_group_id) arriving within
+# UPLOAD_BATCH_WAIT seconds of the last are stored as one batch: one channel
+# forward, one Redis pipeline and one reply. Other uploads are never held
+# back; 0 stores album parts on their own too. A batch is closed after
+# UPLOAD_BATCH_MAX_WAIT seconds, and forwarded in chunks of
+# UPLOAD_BATCH_SIZE (Telegram allows 100).
+UPLOAD_BATCH_WAIT = float(os.environ.get("UPLOAD_BATCH_WAIT", "1"))
+UPLOAD_BATCH_MAX_WAIT = float(os.environ.get("UPLOAD_BATCH_MAX_WAIT", "5"))
+UPLOAD_BATCH_SIZE = int(os.environ.get("UPLOAD_BATCH_SIZE", "100"))
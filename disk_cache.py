@@ -0,0 +1,179 @@
+import asyncio
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from streamer import CHUNK_SIZE
+
+class DiskChunkCache:
+    """Chunks stored in sparse per-message cache files under a disk quota.
+
+    A chunk lands at offset index * CHUNK_SIZE of `<root>/<channel_msg_id>.bin`
+    and is only recorded in the SQLite index after its bytes are fsynced, so
+    a crash can lose chunks but never index garbage. Eviction removes whole
+    files, least recently used first.
+    """
+
+    def __init__(self, root, max_bytes, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        self.db = sqlite3.connect(os.path.join(root, 'index.sqlite3'), isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS chunks '
+                        '(msg_id INTEGER, idx INTEGER, length INTEGER, PRIMARY KEY (msg_id, idx))')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files '
+                        '(msg_id INTEGER PRIMARY KEY, bytes INTEGER, last_access REAL)')
+
+        self._chunks = {(msg_id, idx): length for msg_id, idx, length
+                        in self.db.execute('SELECT msg_id, idx, length FROM chunks')}
+        self._files = {msg_id: [size, last_access] for msg_id, size, last_access
+                       in self.db.execute('SELECT msg_id, bytes, last_access FROM files')}
+        self.bytes = sum(entry[0] for entry in self._files.values())
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+
+    def path(self, msg_id):
+        return os.path.join(self.root, f"{msg_id}.bin")
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    def _touch(self, msg_id):
+        entry = self._files.get(msg_id)
+        if entry is not None:
+            entry[1] = time.time()
+
+    def locate(self, key):
+        """Return (path, offset, length) of a cached chunk, or None"""
+        length = self._chunks.get(key)
+        if length is None:
+            return None
+        self.hits += 1
+        self._touch(key[0])
+        return self.path(key[0]), key[1] * self.chunk_size, length
+
+    def read(self, key):
+        """Read a cached chunk through a memory map, or None if absent"""
+        located = self.locate(key)
+        if located is None:
+            return None
+        path, offset, length = located
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), length, offset=offset,
+                                                  access=mmap.ACCESS_READ) as mapped:
+                return mapped[:]
+        except (OSError, ValueError) as e:
+            print(f"Disk cache read error for {key}: {e}")
+            self._forget(key[0])
+            return None
+
+    def put(self, key, data):
+        msg_id, idx = key
+        if not data or len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._chunks:
+                return
+            fd = os.open(self.path(msg_id), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.pwrite(fd, data, idx * self.chunk_size)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            size = self._files.get(msg_id, [0, 0.0])[0] + len(data)
+            now = time.time()
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)', (msg_id, idx, len(data)))
+                self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', (msg_id, size, now))
+            self._chunks[key] = len(data)
+            self._files[msg_id] = [size, now]
+            self.bytes += len(data)
+            self._evict(keep=msg_id)
+
+    def _evict(self, keep):
+        while self.bytes > self.max_bytes:
+            candidates = [m for m in self._files if m != keep]
+            if not candidates:
+                break
+            self._remove_file(min(candidates, key=lambda m: self._files[m][1]))
+            self.evicted_files += 1
+
+    def _remove_file(self, msg_id):
+        with self.db:
+            self.db.execute('DELETE FROM chunks WHERE msg_id = ?', (msg_id,))
+            self.db.execute('DELETE FROM files WHERE msg_id = ?', (msg_id,))
+        for key in [k for k in self._chunks if k[0] == msg_id]:
+            del self._chunks[key]
+        self.bytes -= self._files.pop(msg_id, [0])[0]
+        try:
+            os.unlink(self.path(msg_id))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, msg_id):
+        with self._lock:
+            self._remove_file(msg_id)
+
+    def flush_access_times(self):
+        """Persist in-memory access times so LRU order survives a restart"""
+        with self._lock, self.db:
+            self.db.executemany('UPDATE files SET last_access = ? WHERE msg_id = ?',
+                                [(entry[1], msg_id) for msg_id, entry in self._files.items()])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'files': len(self._files),
+            'chunks': len(self._chunks),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evicted_files': self.evicted_files
+        }
+
+class DiskTierChunkSource:
+    """Chunk source that serves from a DiskChunkCache and fills it on misses"""
+
+    def __init__(self, source, disk):
+        self.source = source
+        self.disk = disk
+        self._writes = set()
+
+    async def fetch(self, channel_msg_id, index):
+        key = (channel_msg_id, index)
+        loop = asyncio.get_running_loop()
+        if key in self.disk:
+            data = await loop.run_in_executor(None, self.disk.read, key)
+            if data is not None:
+                return data
+        else:
+            self.disk.misses += 1
+
+        data = await self.source.fetch(channel_msg_id, index)
+        # Persist in the background; the caller already has the bytes
+        write = loop.run_in_executor(None, self.disk.put, key, data)
+        self._writes.add(write)
+        write.add_done_callback(self._write_done)
+        return data
+
+    def _write_done(self, write):
+        self._writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            print(f"Disk cache write error: {write.exception()}")
+
+    def locate(self, channel_msg_id, index):
+        return self.disk.locate((channel_msg_id, index))
+
+    def stats(self):
+        return self.disk.stats()
@@ -0,0 +1,49 @@
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+# Validators for the stream/download handlers, derived only from the stored
+# record so HEAD and 304 responses never need a Telegram round trip.
+# Telegram's file_unique_id is the same for identical content, which makes
+# it a natural strong ETag; legacy records fall back to the file_id.
+
+def file_etag(file_data, variant=''):
+    """Strong ETag for a stored file, optionally per representation (e.g. a page)"""
+    tag = file_data.get('file_unique_id') or file_data.get('file_id') or file_data['short_id']
+    if variant:
+        tag = f"{tag}.{variant}"
+    return f'"{tag}"'
+
+def last_modified(file_data):
+    timestamp = file_data.get('timestamp')
+    return formatdate(timestamp, usegmt=True) if timestamp else None
+
+def is_not_modified(headers, etag, file_data):
+    """Evaluate If-None-Match, or failing that If-Modified-Since, per RFC 9110"""
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+    if_modified_since = headers.get('If-Modified-Since')
+    timestamp = file_data.get('timestamp')
+    if not if_modified_since or not timestamp:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(timestamp) <= since
+
+def content_type(file_data):
+    """Real MIME type for a record; bot.py stores coarse kinds like 'video'"""
+    mime_type = file_data.get('mime_type') or ''
+    if '/' in mime_type:
+        return mime_type
+    guessed, _ = mimetypes.guess_type(file_data.get('file_name', ''))
+    return guessed or 'application/octet-stream'
+
+def content_disposition(file_name):
+    """attachment header with an ASCII fallback and the exact UTF-8 name"""
+    fallback = file_name.encode('ascii', 'replace').decode().replace('"', "'").replace('\\', '_')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"
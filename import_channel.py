@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import time
+from pyrogram import Client
+from config import API_ID, API_HASH, BOT_TOKEN, CHANNEL_ID
+from storage import get_redis_client, save_many
+from short_ids import allocate_short_ids
+
+# Telegram returns at most 200 messages per get_messages call
+BATCH_SIZE = 200
+
+def describe_media(message):
+    """Pull the stored-file fields out of a channel message, or None"""
+    if message.document:
+        file = message.document
+        return file, file.file_name or f"document_{message.id}", file.mime_type or "document"
+    if message.video:
+        file = message.video
+        return file, file.file_name or f"video_{message.id}.mp4", "video"
+    if message.audio:
+        file = message.audio
+        return file, file.file_name or f"audio_{message.id}.mp3", "audio"
+    if message.photo:
+        return message.photo, f"photo_{message.id}.jpg", "photo"
+    return None
+
+async def import_batch(client, owner_id, message_ids):
+    """Store records for every not-yet-indexed media message in one batch"""
+    messages = await client.get_messages(CHANNEL_ID, message_ids)
+    media = []
+    for message in messages:
+        if message is None or message.empty:
+            continue
+        described = describe_media(message)
+        if described:
+            media.append((message, described))
+    if not media:
+        return 0, 0
+
+    # Skip content that already has a record, in one MGET
+    known = get_redis_client().mget([f"uniq:{file.file_unique_id}" for _, (file, _, _) in media])
+    media = [item for item, short_id in zip(media, known) if not short_id]
+    if not media:
+        return 0, 0
+
+    uploads = []
+    for short_id, (message, (file, file_name, mime_type)) in zip(allocate_short_ids(len(media)), media):
+        timestamp = int(message.date.timestamp()) if message.date else int(time.time())
+        file_data = {
+            'file_id': file.file_id,
+            'file_unique_id': file.file_unique_id,
+            'file_name': file_name,
+            'file_size': file.file_size,
+            'user_id': owner_id,
+            'timestamp': timestamp,
+            'short_id': short_id,
+            'chat_id': CHANNEL_ID,
+            'channel_msg_id': message.id,
+            'mime_type': mime_type
+        }
+        # Message ids break ties between uploads in the same second
+        uploads.append((short_id, file_data, timestamp + (message.id % 1000000) / 1e6, False))
+    return len(uploads), len(save_many(uploads))
+
+async def main():
+    parser = argparse.ArgumentParser(description="Index existing channel messages into Redis")
+    parser.add_argument('--owner', type=int, required=True, help="user id that will own the imported files")
+    parser.add_argument('--first', type=int, default=1, help="first channel message id")
+    parser.add_argument('--last', type=int, required=True, help="last channel message id")
+    parser.add_argument('--batch', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    client = Client("filmzi_import", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN,
+                    in_memory=True, no_updates=True)
+    started = time.monotonic()
+    found = stored = 0
+    async with client:
+        for first in range(args.first, args.last + 1, args.batch):
+            message_ids = list(range(first, min(first + args.batch, args.last + 1)))
+            batch_found, batch_stored = await import_batch(client, args.owner, message_ids)
+            found += batch_found
+            stored += batch_stored
+            print(f"Messages {message_ids[0]}-{message_ids[-1]}: {batch_stored}/{batch_found} stored")
+
+    print(f"Imported {stored} of {found} new files in {time.monotonic() - started:.1f}s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+import argparse
+from storage import get_redis_client, backfill_indexes, CHANNEL_REFS_READY_KEY
+
+# Builds the file name search index and channel message references for
+# records stored before they existed, in their own hashes or archived.
+# Indexing is idempotent, so this can be
+# re-run or run while the bot is live. Revokes only delete channel messages
+# once a full run has completed, since until then an older record could
+# share a message without being counted.
+
+def stored_ids(r, count):
+    """Short IDs of every record, archived ones included"""
+    for key in r.scan_iter(match='file:*', count=count):
+        yield key.split(':', 1)[1]
+    for bucket in r.scan_iter(match='archive:*', count=count, _type='hash'):
+        for short_id, _ in r.hscan_iter(bucket, count=count):
+            yield short_id
+
+def main():
+    parser = argparse.ArgumentParser(description="Index stored records for /search and revoke cleanup")
+    parser.add_argument('--batch', type=int, default=500)
+    args = parser.parse_args()
+
+    r = get_redis_client()
+    indexed = 0
+    batch = []
+    for short_id in stored_ids(r, args.batch):
+        batch.append(short_id)
+        if len(batch) >= args.batch:
+            indexed += backfill_indexes(batch)
+            batch = []
+    if batch:
+        indexed += backfill_indexes(batch)
+    r.set(CHANNEL_REFS_READY_KEY, '1')
+    print(f"Indexed {indexed} records")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import threading
+from collections import OrderedDict
+from cache import TTLCache, MISSING
+from storage import search_user_files, list_user_files
+from tokenizer import tokenize
+from config import INLINE_CACHE_TTL, INLINE_MAX_RESULTS
+
+# Inline queries arrive once per keystroke, so each user's recent result
+# lists are kept in process, keyed by query terms. A result list is
+# "complete" when it holds every match, which a search whose word expansion
+# was truncated never does; any narrower query (another word,
+# or a longer last word) is then answered by filtering it locally instead
+# of asking Redis. For libraries up to INLINE_MAX_RESULTS files the first
+# (empty) query loads everything and later keystrokes never leave process.
+PAGE_SIZE = 50  # Telegram's per-answer limit
+QUERIES_PER_USER = 32
+
+_user_results = TTLCache(maxsize=4096, ttl=INLINE_CACHE_TTL)
+# The bot runs lookups on executor threads, so one user's keystrokes can
+# overlap; the lock guards their OrderedDict but is not held over Redis
+_lock = threading.Lock()
+
+def _matches(file_data, terms):
+    tokens = tokenize(file_data.get('file_name'))
+    return all(any(token.startswith(term) for token in tokens) for term in terms)
+
+def _is_broader(broad, terms):
+    """True if every file matching terms also matches broad"""
+    return all(any(term.startswith(b) for term in terms) for b in broad)
+
+def _load(user_id, terms):
+    if terms:
+        files, total, truncated = search_user_files(user_id, ' '.join(terms), limit=INLINE_MAX_RESULTS)
+        return files, not truncated and total <= len(files)
+    files, next_cursor = list_user_files(user_id, limit=INLINE_MAX_RESULTS)
+    return files, next_cursor is None
+
+def find_files(user_id, query):
+    """Cached-or-loaded matches for query, newest first; returns (files,
+    complete), where complete is False if more files may match"""
+    terms = tuple(tokenize(query))
+    with _lock:
+        entries = _user_results.get(user_id)
+        if entries is MISSING:
+            entries = OrderedDict()
+            _user_results.set(user_id, entries)
+
+        if terms in entries:
+            entries.move_to_end(terms)
+            return entries[terms]
+
+        broader = [files for cached, (files, complete) in entries.items()
+                   if complete and _is_broader(cached, terms)]
+    if broader:
+        files = [file_data for file_data in min(broader, key=len) if _matches(file_data, terms)]
+        complete = True
+    else:
+        files, complete = _load(user_id, terms)
+
+    with _lock:
+        entries[terms] = (files, complete)
+        while len(entries) > QUERIES_PER_USER:
+            entries.popitem(last=False)
+    return files, complete
+
+def inline_page(user_id, query, offset):
+    """One page of results for an inline query; returns (files, next_offset,
+    complete)"""
+    start = int(offset) if offset.isdigit() else 0
+    files, complete = find_files(user_id, query)
+    end = start + PAGE_SIZE
+    return files[start:end], str(end) if end < len(files) else '', complete
+
+def forget_user(user_id):
+    """Drop a user's cached results, e.g. after they upload a file"""
+    _user_results.pop(user_id)
+
+def stats():
+    return _user_results.stats()
@@ -0,0 +1,77 @@
+import argparse
+import time
+import redis
+from storage import get_redis_client
+from records import encode_record, decode_record, decode_legacy
+
+# Converts version 1 JSON file records into version 2 hashes in place.
+# Readers accept both formats, so this can run while the bot is live.
+
+def encoded_size(mapping):
+    return sum(len(str(field)) + len(str(value)) for field, value in mapping.items())
+
+def migrate_batch(r, keys, dry_run):
+    """Convert a batch in one transaction, watching its keys so a record
+    revoked or rewritten meanwhile is re-read instead of written back"""
+    with r.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                pipe.watch(*keys)
+                values = pipe.mget(keys)
+                pipe.multi()
+                stats = {'records': 0, 'json_bytes': 0, 'hash_bytes': 0, 'json_decode': 0.0, 'hash_decode': 0.0}
+                for key, value in zip(keys, values):
+                    if not value:
+                        continue
+                    started = time.perf_counter()
+                    file_data = decode_legacy(value)
+                    stats['json_decode'] += time.perf_counter() - started
+
+                    mapping = encode_record(file_data)
+                    stored = {field: str(v) for field, v in mapping.items()}
+                    started = time.perf_counter()
+                    decode_record(key.split(':', 1)[1], stored)
+                    stats['hash_decode'] += time.perf_counter() - started
+
+                    stats['records'] += 1
+                    stats['json_bytes'] += len(value)
+                    stats['hash_bytes'] += encoded_size(mapping)
+                    if not dry_run:
+                        pipe.delete(key)
+                        pipe.hset(key, mapping=mapping)
+                if not dry_run:
+                    pipe.execute()
+                return stats
+            except redis.WatchError:
+                continue
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON file records to compact hashes")
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help="only report sizes and decode times")
+    args = parser.parse_args()
+
+    r = get_redis_client()
+    totals = {'records': 0, 'json_bytes': 0, 'hash_bytes': 0, 'json_decode': 0.0, 'hash_decode': 0.0}
+    batch = []
+    for key in r.scan_iter(match='file:*', count=args.batch, _type='string'):
+        batch.append(key)
+        if len(batch) >= args.batch:
+            for name, value in migrate_batch(r, batch, args.dry_run).items():
+                totals[name] += value
+            batch = []
+    if batch:
+        for name, value in migrate_batch(r, batch, args.dry_run).items():
+            totals[name] += value
+
+    records = totals['records']
+    if not records:
+        print("No legacy records found")
+        return
+    print(f"{'Checked' if args.dry_run else 'Migrated'} {records} records")
+    print(f"Bytes per record: {totals['json_bytes'] / records:.0f} (JSON) -> {totals['hash_bytes'] / records:.0f} (hash)")
+    print(f"Decode time per million records: {totals['json_decode'] / records * 1e6:.2f}s (JSON) -> "
+          f"{totals['hash_decode'] / records * 1e6:.2f}s (hash)")
+
+if __name__ == "__main__":
+    main()
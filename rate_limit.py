@@ -0,0 +1,128 @@
+import asyncio
+import time
+from storage import get_redis_client, _on_redis_error
+from config import (CHANNEL_ID, RATE_LIMIT_GLOBAL, RATE_LIMIT_CHAT, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_GROUP,
+                    RATE_LIMIT_CHANNEL, RATE_LIMIT_RESERVE, RATE_LIMIT_MAX_WAIT)
+
+# Token buckets in Redis shared by bot.py, the webhook and the worker: one
+# global bucket for Telegram's ~30 msg/s and one per destination chat.
+# Sends to the storage channel are low priority: they only get a global
+# token while RATE_LIMIT_RESERVE tokens remain for user-facing replies.
+GLOBAL_BUCKET_KEY = 'ratelimit:global'
+
+# Checks both buckets and takes a token from each only if both have one.
+# Returns 0 when granted, otherwise the milliseconds until the caller
+# should try again. A chat rate of 0 means the chat has no bucket of its own.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+
+local function level(key, rate, burst)
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+
+local function take(key, tokens, rate, burst)
+    redis.call('HSET', key, 'tokens', tokens - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+
+local global_rate, global_burst = tonumber(ARGV[2]), tonumber(ARGV[3])
+local chat_rate, chat_burst = tonumber(ARGV[4]), tonumber(ARGV[5])
+local needed = 1 + tonumber(ARGV[6])
+
+local wait = 0
+local global_tokens = level(KEYS[1], global_rate, global_burst)
+if global_tokens < needed then
+    wait = (needed - global_tokens) * 1000 / global_rate
+end
+local chat_tokens = 0
+if chat_rate > 0 then
+    chat_tokens = level(KEYS[2], chat_rate, chat_burst)
+    if chat_tokens < 1 then
+        wait = math.max(wait, (1 - chat_tokens) * 1000 / chat_rate)
+    end
+end
+if wait > 0 then
+    return math.ceil(wait)
+end
+
+take(KEYS[1], global_tokens, global_rate, global_burst)
+if chat_rate > 0 then
+    take(KEYS[2], chat_tokens, chat_rate, chat_burst)
+end
+return 0
+"""
+_script = None
+
+# Per-process counters for the status endpoints
+_stats = {'granted': 0, 'throttled': 0, 'waited_ms': 0, 'gave_up': 0}
+
+def _get_script():
+    global _script
+    if _script is None:
+        _script = get_redis_client().register_script(TOKEN_BUCKET_SCRIPT)
+    return _script
+
+def _chat_limits(chat_id):
+    """(rate per second, burst, reserve) for sends to one chat"""
+    if str(chat_id) == str(CHANNEL_ID):
+        return RATE_LIMIT_CHANNEL / 60, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_RESERVE
+    if int(chat_id) < 0:
+        return RATE_LIMIT_GROUP / 60, RATE_LIMIT_CHAT_BURST, 0
+    return RATE_LIMIT_CHAT, RATE_LIMIT_CHAT_BURST, 0
+
+def try_acquire(chat_id):
+    """Take a send token for chat_id; 0 if granted, else seconds to wait.
+    Fails open when Redis is unreachable."""
+    rate, burst, reserve = _chat_limits(chat_id)
+    try:
+        wait_ms = _get_script()(
+            keys=[GLOBAL_BUCKET_KEY, f"ratelimit:chat:{chat_id}"],
+            args=[int(time.time() * 1000), RATE_LIMIT_GLOBAL, RATE_LIMIT_GLOBAL, rate, burst, reserve]
+        )
+    except Exception as e:
+        _on_redis_error(e)
+        return 0
+    return wait_ms / 1000
+
+def _record(waited, granted):
+    _stats['granted' if granted else 'gave_up'] += 1
+    if waited:
+        _stats['throttled'] += 1
+        _stats['waited_ms'] += int(waited * 1000)
+
+def acquire(chat_id):
+    """Block until a send to chat_id is allowed, or RATE_LIMIT_MAX_WAIT passes.
+    Giving up lets the send go ahead and rely on bot_api's 429 handling."""
+    waited = 0.0
+    while True:
+        wait = try_acquire(chat_id)
+        if not wait:
+            _record(waited, True)
+            return True
+        if waited + wait > RATE_LIMIT_MAX_WAIT:
+            _record(waited, False)
+            return False
+        time.sleep(wait)
+        waited += wait
+
+async def acquire_async(chat_id):
+    """acquire() for the Pyrogram bot's event loop; Redis calls run in the
+    default executor so they don't block it"""
+    loop = asyncio.get_running_loop()
+    waited = 0.0
+    while True:
+        wait = await loop.run_in_executor(None, try_acquire, chat_id)
+        if not wait:
+            _record(waited, True)
+            return True
+        if waited + wait > RATE_LIMIT_MAX_WAIT:
+            _record(waited, False)
+            return False
+        await asyncio.sleep(wait)
+        waited += wait
+
+def stats():
+    return dict(_stats)
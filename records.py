@@ -0,0 +1,155 @@
+import base64
+import json
+import zlib
+
+# File records are stored as Redis hashes with one-letter field names
+# (version 2). Version 1 records are JSON strings under the same key and
+# are still read transparently until migrate_records.py converts them.
+RECORD_VERSION = '2'
+
+FIELDS = {
+    'file_id': 'f',
+    'file_unique_id': 'u',
+    'file_name': 'n',
+    'file_size': 's',
+    'user_id': 'o',
+    'timestamp': 't',
+    'chat_id': 'c',
+    'channel_msg_id': 'm',
+    'mime_type': 'y',
+    'accessed_at': 'a',
+    'expires_at': 'x'
+}
+INT_FIELDS = {'file_size', 'user_id', 'timestamp', 'chat_id', 'channel_msg_id', 'accessed_at', 'expires_at'}
+NAMES = {short: name for name, short in FIELDS.items()}
+
+# Not worth storing: the short ID is in the key and getFile URLs expire
+DROPPED = {'short_id', 'file_url'}
+
+def encode_record(file_data):
+    """Flatten a record into a hash mapping with short field names"""
+    mapping = {'v': RECORD_VERSION}
+    for name, value in file_data.items():
+        if name in DROPPED or value is None:
+            continue
+        mapping[FIELDS.get(name, name)] = value
+    return mapping
+
+def decode_record(short_id, mapping):
+    """Inverse of encode_record; None for a missing (empty) hash"""
+    if not mapping:
+        return None
+    file_data = {'short_id': short_id}
+    for field, value in mapping.items():
+        if field == 'v':
+            continue
+        name = NAMES.get(field, field)
+        file_data[name] = int(value) if name in INT_FIELDS else value
+    return file_data
+
+def decode_legacy(value):
+    """Read a version 1 JSON record"""
+    if not value:
+        return None
+    return json.loads(value)
+
+# Cold records are archived as one compact string each. Every present
+# field is a tag byte (its FIELDS position and kind) followed by a zigzag
+# varint, or a length-prefixed UTF-8 string; file IDs are stored as the
+# bytes their base64 decodes to. The result is raw-deflated against a
+# dictionary of common record content when that is smaller, then base85
+# encoded because the Redis client decodes replies as text. FIELDS may only
+# grow at the end, and changing _ZDICT needs new format prefixes.
+ARCHIVE_PLAIN = 'a'
+ARCHIVE_DEFLATED = 'b'
+_NAMES = list(FIELDS)
+_EXTRA = 63
+_INT, _TEXT, _BASE64 = 0, 1, 2
+_ZDICT = (b'video/x-matroskavideo/mp4audio/mpegapplication/pdfapplication/zip'
+          b'application/vnd.android.package-archivedocumentvideoaudiophoto'
+          b'.1080p.720p.480p.2160p.WEB-DL.WEBRip.BluRay.HDRip.x264.x265.HEVC.AAC.Hindi.English'
+          b'.mkv.mp4.mp3.zip.pdf.apk.jpg')
+
+def _write_varint(out, n):
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+def _b64decode(value):
+    """Bytes of an unpadded base64url string, or None if it would not round trip"""
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    except ValueError:
+        return None
+    return raw if base64.urlsafe_b64encode(raw).decode().rstrip('=') == value else None
+
+def _write_field(out, index, value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        out.append(index << 2 | _INT)
+        _write_varint(out, value << 1 if value >= 0 else (~value << 1) | 1)
+        return
+    raw = _b64decode(value) if index < 2 else None
+    kind = _BASE64 if raw is not None else _TEXT
+    if raw is None:
+        raw = value.encode()
+    out.append(index << 2 | kind)
+    _write_varint(out, len(raw))
+    out.extend(raw)
+
+def pack_record(file_data):
+    """Compress a record into an archive entry"""
+    out = bytearray()
+    extra = {}
+    for name, value in file_data.items():
+        if name in DROPPED or value is None:
+            continue
+        if name in FIELDS:
+            _write_field(out, _NAMES.index(name), value)
+        else:
+            extra[name] = value
+    if extra:
+        _write_field(out, _EXTRA, json.dumps(extra, separators=(',', ':')))
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, _ZDICT)
+    deflated = compressor.compress(bytes(out)) + compressor.flush()
+    if len(deflated) < len(out):
+        return ARCHIVE_DEFLATED + base64.b85encode(deflated).decode()
+    return ARCHIVE_PLAIN + base64.b85encode(bytes(out)).decode()
+
+def unpack_record(short_id, entry):
+    """Inverse of pack_record; None for a missing entry"""
+    if not entry:
+        return None
+    data = base64.b85decode(entry[1:])
+    if entry[0] == ARCHIVE_DEFLATED:
+        decompressor = zlib.decompressobj(-15, _ZDICT)
+        data = decompressor.decompress(data) + decompressor.flush()
+    elif entry[0] != ARCHIVE_PLAIN:
+        raise ValueError(f"Unknown archive format: {entry[0]!r}")
+
+    file_data = {'short_id': short_id}
+    pos = 0
+    while pos < len(data):
+        index, kind = data[pos] >> 2, data[pos] & 3
+        value, pos = _read_varint(data, pos + 1)
+        if kind == _INT:
+            value = ~(value >> 1) if value & 1 else value >> 1
+        else:
+            raw = data[pos:pos + value]
+            pos += value
+            value = base64.urlsafe_b64encode(raw).decode().rstrip('=') if kind == _BASE64 else raw.decode()
+        if index == _EXTRA:
+            file_data.update(json.loads(value))
+        else:
+            file_data[_NAMES[index]] = value
+    return file_data
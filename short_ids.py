@@ -0,0 +1,51 @@
+import hashlib
+import hmac
+from storage import get_redis_client
+from config import SHORT_ID_SECRET
+
+# Short IDs are a Redis counter pushed through a keyed Feistel permutation
+# and written in base62. The counter makes them unique across concurrent
+# invocations, the permutation makes them unguessable, and a 34-bit domain
+# keeps them at most 6 characters (62**6 > 2**34).
+COUNTER_KEY = 'ids:counter'
+ID_BITS = 34
+HALF_BITS = ID_BITS // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+_key = hashlib.sha256(SHORT_ID_SECRET.encode()).digest()
+
+def _round(value, i):
+    digest = hmac.new(_key, bytes([i]) + value.to_bytes(4, 'big'), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+def permute(n):
+    """Keyed bijection on [0, 2**ID_BITS)"""
+    left, right = n >> HALF_BITS, n & HALF_MASK
+    for i in range(ROUNDS):
+        left, right = right, left ^ _round(right, i)
+    return (left << HALF_BITS) | right
+
+def encode_base62(n):
+    if n == 0:
+        return ALPHABET[0]
+    digits = []
+    while n:
+        n, rem = divmod(n, 62)
+        digits.append(ALPHABET[rem])
+    return ''.join(reversed(digits))
+
+def allocate_short_id():
+    """Reserve the next short ID; unique for as long as the counter lives"""
+    n = get_redis_client().incr(COUNTER_KEY)
+    if n >= 1 << ID_BITS:
+        raise RuntimeError("short ID space exhausted")
+    return encode_base62(permute(n))
+
+def allocate_short_ids(count):
+    """Reserve `count` consecutive counter values in one round trip"""
+    last = get_redis_client().incrby(COUNTER_KEY, count)
+    if last >= 1 << ID_BITS:
+        raise RuntimeError("short ID space exhausted")
+    return [encode_base62(permute(n)) for n in range(last - count + 1, last + 1)]
@@ -0,0 +1,15 @@
+import base64
+import hashlib
+import hmac
+from config import LINK_SECRET
+
+_key = hashlib.sha256(('links:' + LINK_SECRET).encode()).digest()
+
+def sign(*parts):
+    """Short URL-safe HMAC over the given values"""
+    message = '|'.join(str(part) for part in parts).encode()
+    digest = hmac.new(_key, message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+def verify(signature, *parts):
+    return bool(signature) and hmac.compare_digest(signature, sign(*parts))
@@ -0,0 +1,830 @@
+import threading
+import time
+import uuid
+import zlib
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+from cache import TTLCache, MISSING
+from records import encode_record, decode_record, decode_legacy, pack_record, unpack_record
+from tokenizer import tokenize
+from config import (REDIS_URL, REDIS_TOKEN, FILE_CACHE_SIZE, FILE_CACHE_TTL,
+                    FILE_CACHE_NEGATIVE_TTL, FILE_CACHE_VERSION_CHECK, UPDATE_DEDUP_TTL, UPDATE_CLAIM_TTL,
+                    SEARCH_MAX_EXPANSIONS, REVOKED_TTL, ACCESS_TRACK_INTERVAL, ARCHIVE_BUCKETS)
+
+# Shared Redis connection, created once per process and reused by every
+# handler so warm serverless invocations skip the TCP+TLS handshake
+_client = None
+_client_lock = threading.Lock()
+
+# Decoded file records cached per process. Revokes bump a version key in
+# Redis, which is polled every FILE_CACHE_VERSION_CHECK seconds together
+# with flushing this process's hit/miss counters into a shared stats hash.
+FILES_VERSION_KEY = 'files:version'
+CACHE_STATS_KEY = 'stats:file_cache'
+UPLOAD_STATS_KEY = 'stats:uploads'
+REVOKE_STATS_KEY = 'stats:revokes'
+# Channel message IDs no record references any more, deleted by channel_gc.py
+CHANNEL_GC_KEY = 'gc:channel'
+CHANNEL_REFS_READY_KEY = 'gc:channel:ready'
+# Short IDs of records with an expiry, scored by when they expire
+EXPIRY_KEY = 'files:expiry'
+ARCHIVE_STATS_KEY = 'stats:archive'
+# Value of an update's claim while it is handled; replaced by its result
+UPDATE_IN_PROGRESS = 'processing'
+file_cache = TTLCache(FILE_CACHE_SIZE, FILE_CACHE_TTL, FILE_CACHE_NEGATIVE_TTL)
+_cache_version = MISSING
+_version_checked_at = 0.0
+_flushed_stats = {'hits': 0, 'misses': 0, 'negative_hits': 0, 'evictions': 0}
+# Records read since the last flush whose stored access time is stale
+_pending_access = set()
+_pending_lock = threading.Lock()
+
+def _redis_host():
+    return REDIS_URL.replace('https://', '').split(':')[0]
+
+def get_redis_client():
+    """Return the process-wide pooled Redis client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis(
+                    host=_redis_host(),
+                    port=6379,
+                    password=REDIS_TOKEN,
+                    ssl=True,
+                    decode_responses=True,
+                    max_connections=16,
+                    socket_keepalive=True,
+                    socket_connect_timeout=5,
+                    socket_timeout=10,
+                    health_check_interval=30,
+                    retry=Retry(ExponentialBackoff(cap=1, base=0.05), 3),
+                    retry_on_error=[redis.ConnectionError, redis.TimeoutError]
+                )
+    return _client
+
+def reset_redis_client():
+    """Drop the pooled client so the next call reconnects from scratch"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            try:
+                _client.connection_pool.disconnect()
+            except Exception:
+                pass
+        _client = None
+
+def _on_redis_error(e):
+    print(f"Redis error: {e}")
+    if isinstance(e, (redis.ConnectionError, redis.TimeoutError)):
+        reset_redis_client()
+
+# Every write for one upload in a single atomic round trip. The record hash
+# is only created if the key is free, so nothing gets indexed if its short
+# ID is somehow already taken. KEYS[7] lists the records sharing a channel
+# message ('' if there is none). ARGV[7] is the expiry time ('' for none)
+# and ARGV[6] the number of file name tokens, which follow ARGV[7] and match
+# the token sets in KEYS[10..]; the record's field/value pairs come last.
+SAVE_UPLOAD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+local tokens = tonumber(ARGV[6])
+redis.call('HSET', KEYS[1], unpack(ARGV, 8 + tokens))
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[3], ARGV[2], ARGV[1])
+redis.call('HINCRBY', KEYS[4], 'uploads', 1)
+if ARGV[4] == '1' then
+    redis.call('HINCRBY', KEYS[4], 'dedup_hits', 1)
+end
+if ARGV[3] ~= '' then
+    redis.call('SET', KEYS[5], ARGV[1], 'NX')
+    redis.call('SET', KEYS[6], ARGV[1], 'EX', ARGV[5])
+end
+if KEYS[7] ~= '' then
+    redis.call('SADD', KEYS[7], ARGV[1])
+end
+if ARGV[7] ~= '' then
+    redis.call('ZADD', KEYS[9], ARGV[7], ARGV[1])
+end
+for i = 1, tokens do
+    redis.call('SADD', KEYS[9 + i], ARGV[1])
+    redis.call('ZADD', KEYS[8], 0, ARGV[7 + i])
+end
+return 1
+"""
+_scripts = {}
+
+def _get_script(source):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = get_redis_client().register_script(source)
+    return script
+
+def _channel_refs_key(file_data):
+    channel_msg_id = file_data.get('channel_msg_id')
+    return f"channel:{channel_msg_id}:files" if channel_msg_id else ''
+
+def _save_args(short_id, file_data, dedup_hit, score):
+    user_id = file_data['user_id']
+    unique_id = file_data.get('file_unique_id') or ''
+    keys = [
+        f"file:{short_id}",
+        f"user:{user_id}:files",
+        f"user:{user_id}:uploads",
+        UPLOAD_STATS_KEY,
+        # First record of this content becomes the canonical copy for dedup
+        f"uniq:{unique_id}",
+        f"user:{user_id}:upload:{unique_id}",
+        _channel_refs_key(file_data),
+        f"search:{user_id}:terms",
+        EXPIRY_KEY
+    ]
+    tokens = tokenize(file_data.get('file_name'))
+    keys.extend(f"search:{user_id}:t:{token}" for token in tokens)
+    args = [short_id, score, unique_id, '1' if dedup_hit else '0', UPDATE_DEDUP_TTL, len(tokens),
+            file_data.get('expires_at') or '']
+    args.extend(tokens)
+    for field, value in encode_record(file_data).items():
+        args.extend((field, value))
+    return keys, args
+
+def save_to_redis(short_id, file_data, dedup_hit=False):
+    """Store a record with its user, upload-time and dedup indexes"""
+    try:
+        keys, args = _save_args(short_id, file_data, dedup_hit, time.time())
+        if not _get_script(SAVE_UPLOAD_SCRIPT)(keys=keys, args=args):
+            print(f"Short ID collision: {short_id}")
+            return False
+        file_cache.pop(short_id)
+        return True
+    except Exception as e:
+        _on_redis_error(e)
+        return False
+
+def save_many(uploads):
+    """Bulk save_to_redis: one pipelined round trip for a batch of
+    (short_id, file_data, score, dedup_hit) tuples; returns the short IDs
+    that were stored"""
+    try:
+        script = _get_script(SAVE_UPLOAD_SCRIPT)
+        pipe = get_redis_client().pipeline(transaction=False)
+        for short_id, file_data, score, dedup_hit in uploads:
+            keys, args = _save_args(short_id, file_data, dedup_hit, score)
+            script(keys=keys, args=args, client=pipe)
+        results = pipe.execute()
+    except Exception as e:
+        _on_redis_error(e)
+        return []
+    stored = [upload[0] for upload, result in zip(uploads, results) if result]
+    for short_id in stored:
+        file_cache.pop(short_id)
+    return stored
+
+# Records nobody has opened for a while are moved by tier_files.py from
+# their own hash into archive:{bucket} hashes as packed strings, dropping
+# the per-key overhead; reads fall back to the archive and get_file moves
+# a record back. Access times are written at most once per
+# ACCESS_TRACK_INTERVAL per record and process, batched with the cache sync.
+TOUCH_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('TYPE', key).ok == 'hash' then
+        redis.call('HSET', key, 'a', ARGV[1])
+    end
+end
+return 1
+"""
+
+# KEYS: record, archive bucket, archive stats. Only archives the record if
+# its access time still equals ARGV[3] ('' if never written), so a record
+# read or changed since it was packed stays where it is.
+DEMOTE_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' or (redis.call('HGET', KEYS[1], 'a') or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('DEL', KEYS[1])
+redis.call('HINCRBY', KEYS[3], 'demoted', 1)
+return 1
+"""
+
+# KEYS: record, archive bucket, archive stats. ARGV[2] is the archive entry
+# that was unpacked into the field/value pairs from ARGV[3].
+PROMOTE_SCRIPT = """
+if redis.call('HGET', KEYS[2], ARGV[1]) ~= ARGV[2] then
+    return 0
+end
+redis.call('HDEL', KEYS[2], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+end
+redis.call('HINCRBY', KEYS[3], 'promoted', 1)
+return 1
+"""
+
+def _archive_key(short_id):
+    return f"archive:{zlib.crc32(short_id.encode()) % ARCHIVE_BUCKETS}"
+
+def _is_expired(file_data, now=None):
+    expires_at = file_data.get('expires_at')
+    return bool(expires_at) and expires_at <= (now or time.time())
+
+def _promote(r, file_data, entry):
+    file_data['accessed_at'] = int(time.time())
+    short_id = file_data['short_id']
+    args = [short_id, entry]
+    for field, value in encode_record(file_data).items():
+        args.extend((field, value))
+    try:
+        _get_script(PROMOTE_SCRIPT)(keys=[f"file:{short_id}", _archive_key(short_id), ARCHIVE_STATS_KEY],
+                                    args=args, client=r)
+    except Exception as e:
+        # Still readable from the archive, so serve it anyway
+        _on_redis_error(e)
+
+def _fetch_files(r, short_ids, promote=False):
+    """Records for several IDs in one pipelined round trip, plus one more if
+    any are still legacy JSON strings and one if any are archived (moved
+    back when promote is set). Expired records are revoked on sight; they
+    and missing IDs come back as None."""
+    if not short_ids:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for short_id in short_ids:
+        pipe.hgetall(f"file:{short_id}")
+    results = pipe.execute(raise_on_error=False)
+
+    legacy = [i for i, result in enumerate(results) if isinstance(result, redis.ResponseError)]
+    if legacy:
+        values = r.mget([f"file:{short_ids[i]}" for i in legacy])
+        for i, value in zip(legacy, values):
+            results[i] = decode_legacy(value)
+    records = [
+        result if i in legacy else decode_record(short_id, result)
+        for i, (short_id, result) in enumerate(zip(short_ids, results))
+    ]
+
+    missing = [i for i, file_data in enumerate(records) if file_data is None]
+    if missing:
+        pipe = r.pipeline(transaction=False)
+        for i in missing:
+            pipe.hget(_archive_key(short_ids[i]), short_ids[i])
+        for i, entry in zip(missing, pipe.execute()):
+            if entry:
+                records[i] = unpack_record(short_ids[i], entry)
+                if promote and not _is_expired(records[i]):
+                    _promote(r, records[i], entry)
+
+    now = time.time()
+    for i, file_data in enumerate(records):
+        if file_data and _is_expired(file_data, now):
+            revoke_file(file_data, reason='expired')
+            records[i] = None
+    return records
+
+def _fetch_file(r, short_id, promote=False):
+    return _fetch_files(r, [short_id], promote)[0]
+
+def _note_access(file_data):
+    """Queue an access time write if the stored one is over an interval old"""
+    now = int(time.time())
+    if now - (file_data.get('accessed_at') or file_data.get('timestamp') or 0) < ACCESS_TRACK_INTERVAL:
+        return
+    file_data['accessed_at'] = now
+    with _pending_lock:
+        _pending_access.add(file_data['short_id'])
+
+def _sync_file_cache():
+    """Drop cached records if the version key moved, flush counters and
+    write queued access times"""
+    global _cache_version, _version_checked_at
+    now = time.monotonic()
+    if now - _version_checked_at < FILE_CACHE_VERSION_CHECK:
+        return
+    _version_checked_at = now
+
+    stats = file_cache.stats()
+    with _pending_lock:
+        accessed = list(_pending_access)
+        _pending_access.clear()
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.get(FILES_VERSION_KEY)
+        for name, flushed in _flushed_stats.items():
+            if stats[name] > flushed:
+                pipe.hincrby(CACHE_STATS_KEY, name, stats[name] - flushed)
+        if accessed:
+            _get_script(TOUCH_SCRIPT)(keys=[f"file:{short_id}" for short_id in accessed],
+                                      args=[int(time.time())], client=pipe)
+        version = pipe.execute()[0]
+    except Exception as e:
+        _on_redis_error(e)
+        return
+
+    for name in _flushed_stats:
+        _flushed_stats[name] = stats[name]
+    if version != _cache_version:
+        if _cache_version is not MISSING:
+            file_cache.clear()
+        _cache_version = version
+
+def get_file(short_id):
+    """Cached lookup of a file record; unknown IDs are negatively cached.
+    Archived records are moved back into their own hash."""
+    _sync_file_cache()
+    file_data = file_cache.get(short_id)
+    if file_data is MISSING or (file_data and _is_expired(file_data)):
+        try:
+            file_data = _fetch_file(get_redis_client(), short_id, promote=True)
+        except Exception as e:
+            _on_redis_error(e)
+            return None
+        file_cache.set(short_id, file_data)
+    if file_data:
+        _note_access(file_data)
+    return file_data
+
+def archive_cold_files(short_ids, cutoff, dry_run=False):
+    """Archive the records among short_ids last opened before cutoff;
+    returns (archived, payload bytes before, payload bytes after)"""
+    r = get_redis_client()
+    cold = [file_data for file_data in _fetch_files(r, short_ids)
+            if file_data and (file_data.get('accessed_at') or file_data.get('timestamp') or 0) < cutoff]
+    sizes = []
+    pipe = r.pipeline(transaction=False)
+    script = _get_script(DEMOTE_SCRIPT)
+    for file_data in cold:
+        short_id = file_data['short_id']
+        entry = pack_record(file_data)
+        stored = sum(len(str(field)) + len(str(value)) for field, value in encode_record(file_data).items())
+        sizes.append((stored, len(short_id) + len(entry)))
+        script(keys=[f"file:{short_id}", _archive_key(short_id), ARCHIVE_STATS_KEY],
+               args=[short_id, entry, file_data.get('accessed_at') or ''], client=pipe)
+    archived = [1] * len(cold) if dry_run or not cold else pipe.execute()
+    moved = [size for size, done in zip(sizes, archived) if done]
+    return len(moved), sum(before for before, _ in moved), sum(after for _, after in moved)
+
+def get_archive_stats():
+    try:
+        totals = get_redis_client().hgetall(ARCHIVE_STATS_KEY)
+    except Exception as e:
+        _on_redis_error(e)
+        totals = {}
+    return {name: int(totals.get(name, 0)) for name in ('demoted', 'promoted')}
+
+def get_cache_stats():
+    """File cache counters summed over every process, plus this one"""
+    try:
+        totals = get_redis_client().hgetall(CACHE_STATS_KEY)
+    except Exception as e:
+        _on_redis_error(e)
+        totals = {}
+    return {
+        'global': {name: int(value) for name, value in totals.items()},
+        'local': file_cache.stats()
+    }
+
+def _backfill_uploads(r, user_id):
+    """Build user:{id}:uploads for a library stored before it existed"""
+    file_ids = list(r.smembers(f"user:{user_id}:files"))
+    if not file_ids:
+        return False
+    mapping = {}
+    for file_id, file_data in zip(file_ids, _fetch_files(r, file_ids)):
+        if file_data:
+            mapping[file_id] = file_data.get('timestamp', 0)
+    if not mapping:
+        return False
+    r.zadd(f"user:{user_id}:uploads", mapping)
+    return True
+
+# The page of user:{id}:uploads after a cursor entry (score ARGV[1], member
+# ARGV[2]), newest first with WITHSCORES. Members sharing a score are ranked
+# by member, so the entry's rank marks where the page starts; if it has been
+# removed, the page resumes at its score, skipping tied members already shown.
+LIST_PAGE_SCRIPT = """
+local limit = tonumber(ARGV[3])
+local rank = redis.call('ZREVRANK', KEYS[1], ARGV[2])
+if rank then
+    return redis.call('ZREVRANGE', KEYS[1], rank + 1, rank + limit, 'WITHSCORES')
+end
+local score = tonumber(ARGV[1])
+local ties = redis.call('ZCOUNT', KEYS[1], ARGV[1], ARGV[1])
+local entries = redis.call('ZREVRANGEBYSCORE', KEYS[1], ARGV[1], '-inf', 'WITHSCORES', 'LIMIT', 0, ties + limit)
+local page = {}
+for i = 1, #entries, 2 do
+    if #page == limit * 2 then
+        break
+    end
+    if tonumber(entries[i + 1]) < score or entries[i] < ARGV[2] then
+        page[#page + 1] = entries[i]
+        page[#page + 1] = entries[i + 1]
+    end
+end
+return page
+"""
+
+def list_user_files(user_id, cursor=None, limit=10):
+    """One page of a user's files, newest first; returns (files, next_cursor).
+
+    Two round trips per page regardless of library size: a ranged read of
+    the upload-time index, then one pipelined read of the records.
+    The cursor is "score:short_id" of the last file on the previous page, so
+    files uploaded in the same second are neither skipped nor repeated.
+    """
+    try:
+        r = get_redis_client()
+        key = f"user:{user_id}:uploads"
+        if cursor:
+            score, _, after = cursor.partition(':')
+            page = _get_script(LIST_PAGE_SCRIPT)(keys=[key], args=[score, after, limit + 1])
+            entries = list(zip(page[::2], map(float, page[1::2])))
+        else:
+            entries = r.zrevrangebyscore(key, '+inf', '-inf', start=0, num=limit + 1, withscores=True)
+            if not entries and _backfill_uploads(r, user_id):
+                entries = r.zrevrangebyscore(key, '+inf', '-inf', start=0, num=limit + 1, withscores=True)
+
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        if not entries:
+            return [], None
+        records = _fetch_files(r, [short_id for short_id, _ in entries])
+        files = [file_data for file_data in records if file_data]
+        last_id, last_score = entries[-1]
+        next_cursor = f"{last_score!r}:{last_id}" if has_more else None
+        return files, next_cursor
+    except Exception as e:
+        _on_redis_error(e)
+        return [], None
+
+# Per-user search index over file names: search:{uid}:t:{token} is the set
+# of short IDs whose name contains token, and search:{uid}:terms holds every
+# token of the user in a lexicographic sorted set for prefix expansion.
+
+def index_record(pipe, file_data):
+    """Queue the name search and channel reference writes for one record;
+    SAVE_UPLOAD_SCRIPT does the same for new uploads"""
+    user_id = file_data['user_id']
+    tokens = tokenize(file_data.get('file_name'))
+    for token in tokens:
+        pipe.sadd(f"search:{user_id}:t:{token}", file_data['short_id'])
+    if tokens:
+        pipe.zadd(f"search:{user_id}:terms", {token: 0 for token in tokens})
+    refs_key = _channel_refs_key(file_data)
+    if refs_key:
+        pipe.sadd(refs_key, file_data['short_id'])
+
+def backfill_indexes(short_ids):
+    """Index already stored records; returns how many"""
+    r = get_redis_client()
+    records = [file_data for file_data in _fetch_files(r, short_ids) if file_data and 'user_id' in file_data]
+    pipe = r.pipeline(transaction=False)
+    for file_data in records:
+        index_record(pipe, file_data)
+    pipe.execute()
+    return len(records)
+
+def search_user_files(user_id, query, offset=0, limit=10):
+    """A user's files matching every word of query as a prefix, newest
+    first; returns (files, total matches, truncated). Three round trips:
+    expand the prefixes, intersect in Redis, then read the page of records.
+    A word matching more than SEARCH_MAX_EXPANSIONS indexed words only
+    expands to the first of them, which sets truncated: the results and
+    total then cover just those."""
+    terms = tokenize(query)
+    if not terms:
+        return [], 0, False
+    try:
+        r = get_redis_client()
+        terms_key = f"search:{user_id}:terms"
+        uploads_key = f"user:{user_id}:uploads"
+        pipe = r.pipeline(transaction=False)
+        for term in terms:
+            pipe.zrangebylex(terms_key, f"[{term}", f"[{term}\U0010ffff", start=0, num=SEARCH_MAX_EXPANSIONS + 1)
+        pipe.exists(uploads_key)
+        *expansions, has_uploads = pipe.execute()
+        if not all(expansions):
+            return [], 0, False
+        truncated = any(len(tokens) > SEARCH_MAX_EXPANSIONS for tokens in expansions)
+        expansions = [tokens[:SEARCH_MAX_EXPANSIONS] for tokens in expansions]
+        if not has_uploads:
+            _backfill_uploads(r, user_id)
+
+        # ZUNIONSTORE accepts plain sets, so each term becomes the union of
+        # its expansions; intersecting with the upload index (the only
+        # non-zero weight) scores matches by upload time
+        scratch = f"search:tmp:{uuid.uuid4().hex}"
+        term_keys = [f"{scratch}:{i}" for i in range(len(terms))]
+        pipe = r.pipeline(transaction=True)
+        for term_key, tokens in zip(term_keys, expansions):
+            pipe.zunionstore(term_key, [f"search:{user_id}:t:{token}" for token in tokens])
+        pipe.zinterstore(scratch, dict([(key, 0) for key in term_keys] + [(uploads_key, 1)]))
+        pipe.zrevrange(scratch, offset, offset + limit - 1)
+        pipe.zcard(scratch)
+        pipe.delete(scratch, *term_keys)
+        short_ids, total = pipe.execute()[-3:-1]
+        files = [file_data for file_data in _fetch_files(r, short_ids) if file_data]
+        return files, total, truncated
+    except Exception as e:
+        _on_redis_error(e)
+        return [], 0, False
+
+# Removes a record and every index entry pointing at it in one atomic step,
+# leaving a tombstone so pages can answer 410 instead of 404. The channel
+# message is queued for deletion once no record references it, but only
+# after index_files.py has recorded references for older records (KEYS[12]);
+# until then a dedup'd copy might still share it. ARGV[4] names the counter
+# to bump ('revoked' or 'expired'). Returns {keys removed, bytes}, where
+# bytes counts stored field, value and member payloads.
+REVOKE_SCRIPT = """
+local short_id = ARGV[1]
+local kind = redis.call('TYPE', KEYS[1]).ok
+local bytes = 0
+local removed = 1
+if kind == 'hash' then
+    for _, part in ipairs(redis.call('HGETALL', KEYS[1])) do
+        bytes = bytes + #part
+    end
+    redis.call('DEL', KEYS[1])
+elseif kind == 'string' then
+    bytes = redis.call('STRLEN', KEYS[1])
+    redis.call('DEL', KEYS[1])
+else
+    local entry = redis.call('HGET', KEYS[13], short_id)
+    if not entry then
+        return {0, 0}
+    end
+    redis.call('HDEL', KEYS[13], short_id)
+    bytes = #short_id + #entry
+    removed = 0
+end
+
+bytes = bytes + #short_id * (redis.call('SREM', KEYS[2], short_id) + redis.call('ZREM', KEYS[3], short_id))
+bytes = bytes + #short_id * redis.call('ZREM', KEYS[14], short_id)
+if redis.call('GET', KEYS[5]) == short_id then
+    redis.call('DEL', KEYS[5])
+    removed = removed + 1
+    bytes = bytes + #short_id
+end
+
+for i = 15, #KEYS do
+    if redis.call('SREM', KEYS[i], short_id) == 1 then
+        bytes = bytes + #short_id
+        if redis.call('SCARD', KEYS[i]) == 0 then
+            local token = ARGV[i - 10]
+            redis.call('ZREM', KEYS[11], token)
+            removed = removed + 1
+            bytes = bytes + #token
+        end
+    end
+end
+
+local others = 0
+if KEYS[7] ~= '' then
+    local member = redis.call('SREM', KEYS[7], short_id)
+    others = redis.call('SCARD', KEYS[7])
+    bytes = bytes + #short_id * member
+    if member == 1 and others == 0 then
+        removed = removed + 1
+    end
+    if others == 0 and redis.call('EXISTS', KEYS[12]) == 1 then
+        redis.call('RPUSH', KEYS[8], ARGV[3])
+    end
+end
+if redis.call('GET', KEYS[4]) == short_id then
+    if others > 0 then
+        redis.call('SET', KEYS[4], redis.call('SRANDMEMBER', KEYS[7]))
+    else
+        redis.call('DEL', KEYS[4])
+        removed = removed + 1
+    end
+end
+
+redis.call('SET', KEYS[6], ARGV[4], 'EX', ARGV[2])
+redis.call('INCR', KEYS[9])
+redis.call('HINCRBY', KEYS[10], ARGV[4], 1)
+redis.call('HINCRBY', KEYS[10], 'keys', removed)
+redis.call('HINCRBY', KEYS[10], 'bytes', bytes)
+return {removed, bytes}
+"""
+def revoke_file(file_data, reason='revoked'):
+    """Delete a record with all of its index entries; returns (keys, bytes)
+    reclaimed, or None if Redis failed"""
+    short_id = file_data['short_id']
+    user_id = file_data['user_id']
+    unique_id = file_data.get('file_unique_id') or ''
+    tokens = tokenize(file_data.get('file_name'))
+    keys = [
+        f"file:{short_id}",
+        f"user:{user_id}:files",
+        f"user:{user_id}:uploads",
+        f"uniq:{unique_id}",
+        f"user:{user_id}:upload:{unique_id}",
+        f"revoked:{short_id}",
+        _channel_refs_key(file_data),
+        CHANNEL_GC_KEY,
+        FILES_VERSION_KEY,
+        REVOKE_STATS_KEY,
+        f"search:{user_id}:terms",
+        CHANNEL_REFS_READY_KEY,
+        _archive_key(short_id),
+        EXPIRY_KEY
+    ]
+    keys.extend(f"search:{user_id}:t:{token}" for token in tokens)
+    args = [short_id, REVOKED_TTL, file_data.get('channel_msg_id') or '', reason]
+    args.extend(tokens)
+    try:
+        removed, reclaimed = _get_script(REVOKE_SCRIPT)(keys=keys, args=args)
+    except Exception as e:
+        _on_redis_error(e)
+        return None
+    # This process sees the revoke at once; the version bump reaches the rest
+    file_cache.set(short_id, None)
+    return removed, reclaimed
+
+def is_revoked(short_id):
+    try:
+        return bool(get_redis_client().exists(f"revoked:{short_id}"))
+    except Exception as e:
+        _on_redis_error(e)
+        return False
+
+def get_revoke_stats():
+    try:
+        totals = get_redis_client().hgetall(REVOKE_STATS_KEY)
+    except Exception as e:
+        _on_redis_error(e)
+        totals = {}
+    return {name: int(totals.get(name, 0))
+            for name in ('revoked', 'expired', 'keys', 'bytes', 'channel_messages_deleted')}
+
+# KEYS: record, expiry index, version key. ARGV[2] is the new expiry time,
+# '' to keep the file; the change also counts as an access (ARGV[3]).
+SET_EXPIRY_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'a', ARGV[3])
+if ARGV[2] == '' then
+    redis.call('HDEL', KEYS[1], 'x')
+    redis.call('ZREM', KEYS[2], ARGV[1])
+else
+    redis.call('HSET', KEYS[1], 'x', ARGV[2])
+    redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+end
+redis.call('INCR', KEYS[3])
+return 1
+"""
+
+def set_file_expiry(short_id, expires_at):
+    """Make a stored record expire at a Unix time, or never with None;
+    False if the record is gone or Redis failed"""
+    try:
+        keys = [f"file:{short_id}", EXPIRY_KEY, FILES_VERSION_KEY]
+        args = [short_id, expires_at or '', int(time.time())]
+        if not _get_script(SET_EXPIRY_SCRIPT)(keys=keys, args=args):
+            return False
+    except Exception as e:
+        _on_redis_error(e)
+        return False
+    file_cache.pop(short_id)
+    return True
+
+def expire_due(limit):
+    """Revoke up to limit records whose expiry has passed; returns how many
+    were due"""
+    try:
+        r = get_redis_client()
+        due = r.zrangebyscore(EXPIRY_KEY, '-inf', time.time(), start=0, num=limit)
+        if not due:
+            return 0
+        # Reading an expired record revokes it, which also drops it from the
+        # index; drop entries whose record is already gone as well
+        records = _fetch_files(r, due)
+        r.zrem(EXPIRY_KEY, *[short_id for short_id, file_data in zip(due, records) if file_data is None])
+        return len(due)
+    except Exception as e:
+        _on_redis_error(e)
+        return 0
+
+# Drops a claim only while it is still in progress, never a stored result
+RELEASE_UPDATE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def claim_update(update_id):
+    """Take an update for UPDATE_CLAIM_TTL seconds; False if another delivery
+    holds it or has already finished it"""
+    try:
+        r = get_redis_client()
+        return bool(r.set(f"update:{update_id}", UPDATE_IN_PROGRESS, nx=True, ex=UPDATE_CLAIM_TTL))
+    except Exception as e:
+        # Without Redis we cannot tell, so process rather than drop the update
+        _on_redis_error(e)
+        return True
+
+def release_update(update_id):
+    """Give up a claim after a failure so the next delivery retries the update"""
+    try:
+        _get_script(RELEASE_UPDATE_SCRIPT)(keys=[f"update:{update_id}"], args=[UPDATE_IN_PROGRESS])
+    except Exception as e:
+        _on_redis_error(e)
+
+def finish_update(update_id, result):
+    try:
+        r = get_redis_client()
+        r.set(f"update:{update_id}", result, ex=UPDATE_DEDUP_TTL)
+    except Exception as e:
+        _on_redis_error(e)
+
+def get_update_result(update_id):
+    try:
+        return get_redis_client().get(f"update:{update_id}")
+    except Exception as e:
+        _on_redis_error(e)
+        return None
+
+def get_user_upload(user_id, file_unique_id):
+    """short_id of a file this user recently uploaded, by Telegram file_unique_id"""
+    try:
+        return get_redis_client().get(f"user:{user_id}:upload:{file_unique_id}")
+    except Exception as e:
+        _on_redis_error(e)
+        return None
+
+def find_duplicate(user_id, file_unique_id):
+    """Find a stored copy of this content; returns (file_data, owned_by_user)"""
+    if not file_unique_id:
+        return None, False
+    short_id = get_user_upload(user_id, file_unique_id)
+    file_data = get_file(short_id) if short_id else None
+    if file_data:
+        return file_data, True
+
+    try:
+        short_id = get_redis_client().get(f"uniq:{file_unique_id}")
+    except Exception as e:
+        _on_redis_error(e)
+        return None, False
+    file_data = get_file(short_id) if short_id else None
+    if not file_data or not file_data.get('channel_msg_id'):
+        return None, False
+    return file_data, file_data.get('user_id') == user_id
+
+def find_duplicates(user_id, file_unique_ids):
+    """find_duplicate for several files in two round trips; returns a
+    (file_data, owned_by_user) pair for each"""
+    found = [(None, False)] * len(file_unique_ids)
+    try:
+        r = get_redis_client()
+        pipe = r.pipeline(transaction=False)
+        for unique_id in file_unique_ids:
+            pipe.get(f"user:{user_id}:upload:{unique_id}")
+            pipe.get(f"uniq:{unique_id}")
+        short_ids = pipe.execute()
+        wanted = list({short_id for short_id in short_ids if short_id})
+        records = dict(zip(wanted, _fetch_files(r, wanted)))
+    except Exception as e:
+        _on_redis_error(e)
+        return found
+
+    for i, unique_id in enumerate(file_unique_ids):
+        if not unique_id:
+            continue
+        file_data = records.get(short_ids[2 * i])
+        if file_data:
+            found[i] = (file_data, True)
+            continue
+        file_data = records.get(short_ids[2 * i + 1])
+        if file_data and file_data.get('channel_msg_id'):
+            found[i] = (file_data, file_data.get('user_id') == user_id)
+    return found
+
+def count_upload(dedup_hit, count=1):
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        pipe.hincrby(UPLOAD_STATS_KEY, 'uploads', count)
+        if dedup_hit:
+            pipe.hincrby(UPLOAD_STATS_KEY, 'dedup_hits', count)
+        pipe.execute()
+    except Exception as e:
+        _on_redis_error(e)
+
+def get_upload_stats():
+    try:
+        totals = get_redis_client().hgetall(UPLOAD_STATS_KEY)
+    except Exception as e:
+        _on_redis_error(e)
+        totals = {}
+    uploads = int(totals.get('uploads', 0))
+    dedup_hits = int(totals.get('dedup_hits', 0))
+    return {
+        'uploads': uploads,
+        'dedup_hits': dedup_hits,
+        'dedup_hit_rate': round(dedup_hits / uploads, 4) if uploads else 0.0
+    }
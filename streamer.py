@@ -0,0 +1,152 @@
+import asyncio
+import mimetypes
+from urllib.parse import quote
+from aiohttp import web
+from cache import TTLCache, MISSING
+from storage import get_file
+from config import CHANNEL_ID, STREAM_HOST, STREAM_PORT
+
+# Pyrogram's stream_media works in 1 MiB chunks; offsets are chunk indexes
+CHUNK_SIZE = 1024 * 1024
+
+class TelegramChunkSource:
+    """Fetches single chunks of stored channel messages over MTProto"""
+
+    def __init__(self, client, channel_id=CHANNEL_ID):
+        self.client = client
+        self.channel_id = channel_id
+        self._messages = TTLCache(maxsize=512, ttl=1800)
+
+    async def _get_message(self, channel_msg_id):
+        message = self._messages.get(channel_msg_id)
+        if message is MISSING:
+            message = await self.client.get_messages(self.channel_id, channel_msg_id)
+            self._messages.set(channel_msg_id, message)
+        return message
+
+    async def fetch(self, channel_msg_id, index):
+        """Return chunk number `index` of the message's media"""
+        message = await self._get_message(channel_msg_id)
+        if message is None or message.empty:
+            raise LookupError(f"channel message {channel_msg_id} not found")
+        async for chunk in self.client.stream_media(message, limit=1, offset=index):
+            return chunk
+        return b''
+
+def parse_range(header, size):
+    """Parse a single `bytes=` range into inclusive (start, end), or None if unsatisfiable"""
+    if not header:
+        return 0, size - 1
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+
+    first, _, last = spec.strip().partition('-')
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        return None
+    return start, min(end, size - 1)
+
+async def _sendfile(request, writer, path, offset, count):
+    """Send part of a file on the response's socket without copying it through
+    Python; False if the file was evicted before it could be opened"""
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        return False
+    with f:
+        await writer.drain()
+        await asyncio.get_running_loop().sendfile(request.transport, f, offset, count)
+    return True
+
+def create_app(source, lookup=get_file):
+    """Build the streaming web app; `source` and `lookup` are injectable for tests"""
+
+    async def stream_handler(request):
+        short_id = request.match_info['short_id']
+        loop = asyncio.get_running_loop()
+        file_data = await loop.run_in_executor(None, lookup, short_id)
+        if not file_data or not file_data.get('channel_msg_id'):
+            raise web.HTTPNotFound(text='File not found')
+
+        size = file_data.get('file_size', 0)
+        file_name = file_data.get('file_name', 'file')
+        content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+        disposition = 'attachment' if request.query.get('download') else 'inline'
+        headers = {
+            'Content-Type': content_type,
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition': f"{disposition}; filename*=UTF-8''{quote(file_name)}",
+            'Access-Control-Allow-Origin': '*'
+        }
+
+        range_header = request.headers.get('Range')
+        byte_range = parse_range(range_header, size) if size else None
+        if byte_range is None:
+            headers['Content-Range'] = f'bytes */{size}'
+            return web.Response(status=416, headers=headers)
+
+        start, end = byte_range
+        if range_header:
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        headers['Content-Length'] = str(end - start + 1)
+
+        response = web.StreamResponse(status=206 if range_header else 200, headers=headers)
+        writer = await response.prepare(request)
+        if request.method == 'HEAD':
+            return response
+
+        # Fetch only the chunks covering [start, end] and trim the edges;
+        # sources that support it read ahead while the chunk is being sent
+        channel_msg_id = file_data['channel_msg_id']
+        last_index = (size - 1) // CHUNK_SIZE
+        prefetch = getattr(source, 'prefetch', None)
+        locate = getattr(source, 'locate', None)
+        for index in range(start // CHUNK_SIZE, end // CHUNK_SIZE + 1):
+            chunk_start = index * CHUNK_SIZE
+            lo = max(start - chunk_start, 0)
+
+            # Chunks held by an on-disk tier go straight from file to socket
+            located = locate(channel_msg_id, index) if locate is not None else None
+            sent = False
+            if located is not None:
+                path, offset, length = located
+                hi = min(end - chunk_start + 1, length)
+                if lo >= hi:
+                    break
+                sent = await _sendfile(request, writer, path, offset + lo, hi - lo)
+            if not sent:
+                chunk = await source.fetch(channel_msg_id, index)
+                hi = min(end - chunk_start + 1, len(chunk))
+                if lo >= hi:
+                    break
+                await response.write(chunk[lo:hi])
+
+            if prefetch is not None:
+                prefetch(channel_msg_id, range(index + 1, last_index + 1))
+
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get('/stream/{short_id}', stream_handler)
+    return app
+
+async def start_stream_server(source, host=STREAM_HOST, port=STREAM_PORT):
+    """Start serving /stream/<id> in the running event loop"""
+    runner = web.AppRunner(create_app(source))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,131 @@
+import hashlib
+import html
+from string import Template
+
+# Pages served by the stream and download handlers. Styling and player
+# setup live in static assets (served by api/static/[asset].py with
+# immutable caching), so a page view only sends the few dynamic bits.
+# Asset URLs carry a content hash, so a changed asset gets a new URL.
+
+STYLESHEET = """
+* { margin: 0; padding: 0; box-sizing: border-box; }
+body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: white; }
+.card-page { min-height: 100vh; display: flex; align-items: center; justify-content: center; }
+.card { background: rgba(255,255,255,0.1); padding: 40px; border-radius: 20px; backdrop-filter: blur(10px); text-align: center; max-width: 500px; border: 1px solid rgba(255,255,255,0.2); }
+.card.wide { max-width: 600px; }
+.error-icon { font-size: 80px; margin-bottom: 20px; color: #ff6b6b; }
+.file-icon { font-size: 80px; margin-bottom: 20px; color: #4ecdc4; }
+.filename { font-size: 22px; font-weight: bold; word-break: break-word; margin: 20px 0; }
+.message { margin-bottom: 20px; opacity: 0.8; }
+.card .file-info { background: rgba(255,255,255,0.15); text-align: left; }
+.btn { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 15px 30px; text-decoration: none; border-radius: 10px; display: inline-block; margin: 10px; font-weight: bold; }
+.btn-large { padding: 18px 40px; border-radius: 12px; font-size: 18px; }
+.download-btn { background: linear-gradient(135deg, #00c853 0%, #64dd17 100%); }
+.features { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin: 30px 0; }
+.feature { background: rgba(255,255,255,0.1); padding: 15px; border-radius: 10px; font-size: 14px; }
+.container { max-width: 1200px; margin: 0 auto; padding: 20px; }
+.header { text-align: center; margin-bottom: 30px; }
+.subtitle { opacity: 0.8; margin-top: 10px; }
+.player-container { background: rgba(0,0,0,0.3); padding: 20px; border-radius: 15px; margin-bottom: 20px; }
+.file-info { background: rgba(255,255,255,0.1); padding: 20px; border-radius: 10px; margin: 20px 0; }
+.controls { text-align: center; margin: 20px 0; }
+.plyr { border-radius: 10px; }
+"""
+
+PLAYER_SCRIPT = """
+const player = new Plyr('#player', {
+    ratio: '16:9',
+    autoplay: true,
+    muted: false,
+    controls: ['play', 'progress', 'current-time', 'mute', 'volume', 'settings', 'fullscreen'],
+    settings: ['quality', 'speed'],
+    quality: { default: 0, options: [{name: 'Auto', value: 0}] },
+    speed: { selected: 1, options: [0.5, 0.75, 1, 1.25, 1.5, 1.75, 2] }
+});
+
+player.on('error', event => {
+    console.error('Player error:', event);
+    alert('Streaming error. Please try downloading the file instead.');
+});
+"""
+
+def _asset(content_type, text):
+    body = text.strip().encode() + b'\n'
+    return content_type, body, hashlib.sha256(body).hexdigest()[:16]
+
+# name -> (content type, body, content hash)
+ASSETS = {
+    'filmzi.css': _asset('text/css; charset=utf-8', STYLESHEET),
+    'player.js': _asset('application/javascript; charset=utf-8', PLAYER_SCRIPT)
+}
+
+def asset_url(name):
+    return f"/static/{name}?v={ASSETS[name][2]}"
+
+def _head(stylesheets=()):
+    links = ''.join(f'    <link rel="stylesheet" href="{href}">\n'
+                    for href in list(stylesheets) + [asset_url('filmzi.css')])
+    return """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>$title - Filmzi Cloud</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+""" + links
+
+MESSAGE_PAGE = Template(_head() + """</head>
+<body class="card-page">
+    <div class="card">
+        <div class="error-icon">$icon</div>
+        <h1>$heading</h1>
+        <p class="message">$message</p>
+        <a href="$link" class="btn">$link_text</a>
+    </div>
+</body>
+</html>
+""")
+
+STREAM_PAGE = Template(_head(['https://cdn.plyr.io/3.7.8/plyr.css']) + """</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🎬 Filmzi Cloud Player</h1>
+            <p class="subtitle">Professional streaming experience</p>
+        </div>
+
+        <div class="player-container">
+            <$player_type id="player" controls crossorigin playsinline>
+                <source src="$stream_url" type="$player_type/mp4">
+                Your browser doesn't support HTML5 $player_type.
+            </$player_type>
+        </div>
+
+        <div class="file-info">
+            <h3>📁 $file_name</h3>
+            <p><strong>Streaming:</strong> Direct from Telegram Cloud</p>
+        </div>
+
+        <div class="controls">
+            <a href="$stream_url" class="btn download-btn" download="$file_name">⬇️ Download File</a>
+            <a href="$home" class="btn">🏠 Home</a>
+        </div>
+    </div>
+
+    <script src="https://cdn.plyr.io/3.7.8/plyr.polyfilled.js"></script>
+""" + f"""    <script src="{asset_url('player.js')}"></script>
+</body>
+</html>
+""")
+
+def render(template, **values):
+    """Fill a page template with HTML-escaped values and encode it"""
+    escaped = {key: html.escape(str(value), quote=True) for key, value in values.items()}
+    return template.substitute(escaped).encode()
+
+def message_page(title, icon, heading, message, link, link_text):
+    return render(MESSAGE_PAGE, title=title, icon=icon, heading=heading, message=message,
+                  link=link, link_text=link_text)
+
+# Changes whenever any page markup or asset changes; part of page ETags
+PAGE_VERSION = hashlib.sha256(''.join(
+    [MESSAGE_PAGE.template, STREAM_PAGE.template]).encode()).hexdigest()[:8]
@@ -0,0 +1,158 @@
+import importlib.util
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fakeredis
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:test-token')
+os.environ.setdefault('CHANNEL_ID', '-1001234567890')
+
+import bot_api
+import rate_limit
+import storage
+from cache import MISSING
+
+class FakeBotAPI:
+    """Local stand-in for api.telegram.org that counts calls per method.
+
+    Sends and forwards succeed with increasing message IDs, getFile resolves
+    every file_id, and file downloads return `file_bytes`. Methods listed in
+    `drop` have their connection closed without a reply that many times.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.requests = []
+        self.downloads = 0
+        self.drop = Counter()
+        self.file_bytes = b'x' * 1024
+        self._next_id = 1000
+        self._lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with api._lock:
+                    api.downloads += 1
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(api.file_bytes)))
+                self.end_headers()
+                self.wfile.write(api.file_bytes)
+
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                params = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with api._lock:
+                    if api.drop[method]:
+                        api.drop[method] -= 1
+                        self.close_connection = True
+                        return
+                    api.calls[method] += 1
+                    api.requests.append((method, params))
+                    result = api._reply(method, params)
+                body = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _message_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _reply(self, method, params):
+        if method == 'getFile':
+            return {'file_id': params['file_id'], 'file_path': f"documents/{params['file_id']}"}
+        if method in ('forwardMessages', 'copyMessages'):
+            return [{'message_id': self._message_id()} for _ in params['message_ids']]
+        if method.startswith(('send', 'forward', 'copy')):
+            return {'message_id': self._message_id()}
+        return True
+
+    def count(self, *methods):
+        return sum(self.calls[method] for method in methods)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def load_api_module(name, *path):
+    """Import a Vercel function file such as api/download/[slug].py"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'api', *path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@contextmanager
+def serve(handler):
+    """Run a BaseHTTPRequestHandler on a local port; yields its base URL"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """A fresh in-memory Redis behind storage.get_redis_client()"""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(storage, '_client', client)
+    monkeypatch.setattr(storage, '_scripts', {})
+    monkeypatch.setattr(storage, '_cache_version', MISSING)
+    monkeypatch.setattr(rate_limit, '_script', None)
+    storage.file_cache.clear()
+    bot_api.file_path_cache.clear()
+    yield client
+    storage.file_cache.clear()
+    bot_api.file_path_cache.clear()
+
+@pytest.fixture
+def telegram(monkeypatch, redis_client):
+    """A FakeBotAPI that bot_api talks to, with send rate limits lifted"""
+    api = FakeBotAPI()
+    monkeypatch.setattr(bot_api, 'TELEGRAM_API_URL', api.url)
+    monkeypatch.setattr(bot_api, '_session', None)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_GLOBAL', 1e6)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CHAT', 1e6)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CHAT_BURST', 10 ** 6)
+    yield api
+    api.close()
+
+def document_update(update_id, message_id=500, user_id=42, file_key='A', **message):
+    """A Telegram update carrying one uploaded document"""
+    return {'update_id': update_id, 'message': {
+        'message_id': message_id, 'chat': {'id': user_id, 'type': 'private'}, 'from': {'id': user_id},
+        'document': {'file_id': f"FILE{file_key}", 'file_unique_id': f"UNIQ{file_key}",
+                     'file_name': f"Show {file_key}.mkv", 'file_size': 10 ** 6},
+        **message}}
+
+def make_record(short_id, file_name, user_id=42, timestamp=1700000000, **fields):
+    """A file record as the upload handlers store it"""
+    return {'file_id': f"FILE{short_id}", 'file_unique_id': f"UNIQ{short_id}", 'file_name': file_name,
+            'file_size': 10 ** 6, 'user_id': user_id, 'timestamp': timestamp, 'short_id': short_id,
+            'chat_id': user_id, 'channel_msg_id': 100, **fields}
+
+def store_library(names, user_id=42):
+    """Save one record per file name, oldest first; returns their short IDs"""
+    short_ids = [f"u{user_id}f{i:04}" for i in range(len(names))]
+    storage.save_many([(short_id, make_record(short_id, name, user_id), 1700000000 + i, False)
+                       for i, (short_id, name) in enumerate(zip(short_ids, names))])
+    return short_ids
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+import requests
+
+import storage
+from conftest import load_api_module, make_record, serve
+
+download = load_api_module('download_handler', 'download', '[slug].py')
+stream = load_api_module('stream_handler', 'stream', '[slug].py')
+
+@pytest.fixture
+def download_url(telegram):
+    with serve(download.handler) as url:
+        yield url
+
+@pytest.fixture
+def stream_url(telegram):
+    with serve(stream.handler) as url:
+        yield url
+
+def stored(short_id, file_size=1024 * 1024, **fields):
+    file_data = make_record(short_id, 'Holiday Video.mp4', file_size=file_size, **fields)
+    storage.save_to_redis(short_id, file_data)
+    return file_data
+
+def signed_path(short_id):
+    link, _ = download.signed_download_link('Holiday.Video.mp4', short_id, time.time())
+    return link[len(download.BASE_URL):]
+
+def fetch(base_url, path, method='GET', **headers):
+    return requests.request(method, base_url + path, headers=headers, allow_redirects=False)
+
+@pytest.mark.parametrize('file_size', [1024 * 1024, 0, 10 * 1024 * 1024, 30 * 1024 * 1024])
+def test_head_matches_get_without_calling_telegram(download_url, telegram, file_size):
+    stored('h1', file_size)
+    for path in ('/api/download/Holiday.Video.mp4-h1', signed_path('h1')):
+        before = sum(telegram.calls.values()) + telegram.downloads
+        head = fetch(download_url, path, 'HEAD')
+        assert sum(telegram.calls.values()) + telegram.downloads == before
+
+        get = fetch(download_url, path)
+        assert head.status_code == get.status_code
+        assert head.headers.get('Location') == get.headers.get('Location')
+        assert 'Accept-Ranges' not in head.headers
+        if file_size and head.status_code == 200 and 'Content-Disposition' in head.headers:
+            assert head.headers['Content-Length'] == str(file_size)
+
+def test_head_with_bad_signature_is_refused(download_url, telegram):
+    stored('h2')
+    response = fetch(download_url, '/api/download/Holiday.Video.mp4-h2?sig=bad&exp=9999999999', 'HEAD')
+    assert response.status_code == 403
+    assert sum(telegram.calls.values()) == 0
+
+def test_revalidation_needs_no_telegram_call(download_url, telegram):
+    stored('c1')
+    path = signed_path('c1')
+    etag = fetch(download_url, path, 'HEAD').headers['ETag']
+
+    assert fetch(download_url, path, **{'If-None-Match': etag}).status_code == 304
+    assert fetch(download_url, path, **{'If-None-Match': '*'}).status_code == 304
+    assert sum(telegram.calls.values()) == telegram.downloads == 0
+
+def test_bad_signature_never_revalidates(download_url, telegram):
+    stored('c2')
+    response = fetch(download_url, '/api/download/Holiday.Video.mp4-c2?sig=bad&exp=1', **{'If-None-Match': '*'})
+    assert response.status_code == 403
+
+def test_stream_page_head_and_304_need_no_telegram_call(stream_url, telegram):
+    stored('p1', mime_type='video/mp4')
+    path = '/api/stream/Holiday.Video.mp4-p1'
+    head = fetch(stream_url, path, 'HEAD')
+    assert head.status_code == 200
+
+    assert fetch(stream_url, path, **{'If-None-Match': head.headers['ETag']}).status_code == 304
+    assert sum(telegram.calls.values()) == telegram.downloads == 0
@@ -0,0 +1,99 @@
+import re
+import time
+
+import pytest
+import requests
+
+import bot_api
+import storage
+from conftest import load_api_module, make_record, serve
+
+download = load_api_module('download_handler', 'download', '[slug].py')
+
+def shared_max_age(cache_control):
+    """Seconds a shared cache may keep a response, as Vercel's edge reads it"""
+    if 'no-store' in cache_control or 'private' in cache_control:
+        return 0
+    match = re.search(r's-maxage=(\d+)', cache_control) or re.search(r'max-age=(\d+)', cache_control)
+    return int(match.group(1)) if match else 0
+
+class CDN:
+    """A shared cache in front of the download function that counts origin hits"""
+
+    def __init__(self, origin_url):
+        self.origin_url = origin_url
+        self.cache = {}
+        self.origin_hits = 0
+
+    def request(self, path, method='GET', headers=None):
+        cached = self.cache.get((method, path))
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        self.origin_hits += 1
+        response = requests.request(method, self.origin_url + path, headers=headers, allow_redirects=False)
+        ttl = shared_max_age(response.headers.get('Cache-Control', ''))
+        if ttl:
+            self.cache[(method, path)] = (time.monotonic() + ttl, response)
+        return response
+
+    def download(self, path):
+        """Follow our own redirects through the cache, as a browser would"""
+        responses = []
+        while True:
+            response = self.request(path)
+            responses.append(response)
+            location = response.headers.get('Location', '')
+            if response.status_code != 302 or not location.startswith(download.BASE_URL):
+                return responses
+            path = location[len(download.BASE_URL):]
+
+@pytest.fixture
+def origin(telegram):
+    """Base URL of the download function served locally"""
+    with serve(download.handler) as url:
+        yield url
+
+def stored_file(short_id, file_size):
+    storage.save_to_redis(short_id, make_record(short_id, 'Popular Movie.mkv', file_size=file_size))
+    return f"/api/download/Popular.Movie.mkv-{short_id}"
+
+def leaks_token(response):
+    token = bot_api.BOT_TOKEN
+    return token in response.headers.get('Location', '') or token.encode() in response.content
+
+def test_popular_file_reaches_origin_once_per_link(origin, telegram):
+    path = stored_file('pop1', 1024 * 1024)
+    cdn = CDN(origin)
+    for _ in range(50):
+        *redirects, response = cdn.download(path)
+        assert response.status_code == 200
+        assert response.content == telegram.file_bytes
+
+    # One hit for the permanent link's redirect, one for the signed link
+    assert cdn.origin_hits == 2
+    assert telegram.downloads == 1
+    assert telegram.calls['getFile'] == 1
+
+def test_file_over_proxy_limit_without_streamer(origin, telegram, monkeypatch):
+    monkeypatch.setattr(download, 'STREAM_URL', '')
+    path = stored_file('big1', 10 * 1024 * 1024)
+    cdn = CDN(origin)
+    for _ in range(20):
+        responses = cdn.download(path)
+        assert not any(leaks_token(response) for response in responses)
+        assert responses[-1].status_code == 200
+
+    assert cdn.origin_hits == 2
+    assert telegram.count('getFile') == 0 and telegram.downloads == 0
+
+def test_file_over_proxy_limit_with_streamer(origin, telegram, monkeypatch):
+    monkeypatch.setattr(download, 'STREAM_URL', 'https://stream.example')
+    path = stored_file('big2', 10 * 1024 * 1024)
+    cdn = CDN(origin)
+    for _ in range(20):
+        response = cdn.download(path)[-1]
+        assert response.status_code == 302
+        assert response.headers['Location'] == 'https://stream.example/stream/big2?download=1'
+
+    assert cdn.origin_hits == 2
+    assert sum(telegram.calls.values()) == 0
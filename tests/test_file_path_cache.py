@@ -0,0 +1,53 @@
+import json
+import time
+
+import requests
+
+import bot_api
+import storage
+from conftest import load_api_module, make_record, serve
+
+download = load_api_module('download_handler', 'download', '[slug].py')
+
+def test_repeat_lookups_call_getfile_once(telegram):
+    for _ in range(100):
+        assert bot_api.get_file_path('FILE1') == 'documents/FILE1'
+    assert telegram.calls['getFile'] == 1
+
+    # A fresh instance finds the path another one resolved in Redis
+    bot_api.file_path_cache.clear()
+    assert bot_api.get_file_path('FILE1') == 'documents/FILE1'
+    assert telegram.calls['getFile'] == 1
+
+    # Once both layers have let it go, Telegram is asked again
+    bot_api.file_path_cache.clear()
+    bot_api.get_redis_client().delete('fpath:FILE1')
+    assert bot_api.get_file_path('FILE1') == 'documents/FILE1'
+    assert telegram.calls['getFile'] == 2
+
+def test_path_near_expiry_is_refreshed_once_in_background(telegram, redis_client):
+    expires_at = time.time() + bot_api.FILE_LINK_REFRESH / 2
+    redis_client.set('fpath:FILE2', json.dumps({'file_path': 'documents/old', 'expires_at': expires_at}))
+
+    # Callers keep getting the cached path while a single refresh runs
+    paths = {bot_api.get_file_path('FILE2') for _ in range(20)}
+    deadline = time.monotonic() + 5
+    while bot_api._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert paths <= {'documents/old', 'documents/FILE2'}
+    assert telegram.calls['getFile'] == 1
+    assert bot_api.get_file_path('FILE2') == 'documents/FILE2'
+    assert json.loads(redis_client.get('fpath:FILE2'))['expires_at'] > expires_at
+
+def test_downloads_of_one_file_share_one_getfile(telegram):
+    storage.save_to_redis('same1', make_record('same1', 'Clip.mp4'))
+    with serve(download.handler) as url:
+        for _ in range(10):
+            link = requests.get(f"{url}/api/download/Clip.mp4-same1", allow_redirects=False).headers['Location']
+            response = requests.get(url + link[len(download.BASE_URL):])
+            assert response.status_code == 200
+            assert response.content == telegram.file_bytes
+
+    assert telegram.calls['getFile'] == 1
+    assert telegram.downloads == 10
@@ -0,0 +1,78 @@
+import statistics
+import threading
+import time
+
+import pytest
+
+import inline_search
+import storage
+from cache import TTLCache
+from conftest import store_library
+
+SHOWS = ['avengers endgame', 'avatar', 'breaking bad', 'better call saul', 'dark', 'daredevil',
+         'the office', 'the expanse', 'succession', 'severance']
+# 60 names sharing "aa" push "avengers" past the search's expansion limit
+NAMES = ([f"{show} s{season:02}e{episode:02}.mkv" for show in SHOWS for season in range(1, 6)
+          for episode in range(1, 11)]
+         + [f"aa{i:02} episode.mkv" for i in range(60)] + ["avengers.mkv"])
+QUERIES = ['avengers', 'av', 'a', 'aa1', 'the ex', 'better saul s03', 'dar', 'sev e10', 'zzz']
+
+@pytest.fixture
+def library(redis_client, monkeypatch):
+    monkeypatch.setattr(inline_search, '_user_results', TTLCache(maxsize=64, ttl=120))
+    monkeypatch.setattr(storage, 'SEARCH_MAX_EXPANSIONS', 50)
+    calls = []
+    search = storage.search_user_files
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return search(*args, **kwargs)
+    monkeypatch.setattr(inline_search, 'search_user_files', counted)
+    for user_id in (1, 2, 3):
+        store_library(NAMES, user_id)
+    return calls
+
+def expected(query):
+    """Every match, newest first, as a full scan of the library finds them"""
+    terms = inline_search.tokenize(query)
+    return [name for name in reversed(NAMES) if inline_search._matches({'file_name': name}, terms)]
+
+def names(files):
+    return [file_data['file_name'] for file_data in files]
+
+def test_truncated_search_is_not_reused_for_narrower_queries(library):
+    files, complete = inline_search.find_files(1, 'a')
+    assert files and not complete
+
+    files, complete = inline_search.find_files(1, 'av')
+    assert complete
+    assert names(files) == expected('av')
+    assert 'avengers.mkv' in names(files)
+
+def test_keystroke_bursts_match_a_full_scan(library):
+    latencies = []
+    errors = []
+
+    def type_queries(user_id):
+        for query in QUERIES:
+            for end in range(1, len(query) + 1):
+                started = time.perf_counter()
+                files, complete = inline_search.find_files(user_id, query[:end])
+                latencies.append(time.perf_counter() - started)
+                matches = expected(query[:end])
+                # An incomplete answer must say so and hold only real matches
+                if complete != (names(files) == matches) or not set(names(files)) <= set(matches):
+                    errors.append((user_id, query[:end]))
+
+    threads = [threading.Thread(target=type_queries, args=(user_id,)) for user_id in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    keystrokes = 3 * sum(len(query) for query in QUERIES)
+    assert errors == []
+    assert len(latencies) == keystrokes
+    # Most keystrokes narrow a complete cached result and never reach Redis
+    assert len(library) < keystrokes / 2
+    assert statistics.median(latencies) < 0.1
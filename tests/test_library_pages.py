@@ -0,0 +1,38 @@
+import json
+
+import storage
+from conftest import make_record, store_library
+
+def legacy_library(redis_client, count, user_id=42, timestamp=1700000000):
+    """Version 1 records sharing one upload time, without an upload index"""
+    short_ids = [f"{10000000 + i}" for i in range(count)]
+    for short_id in short_ids:
+        redis_client.set(f"file:{short_id}", json.dumps(make_record(short_id, f"{short_id}.mkv", user_id, timestamp)))
+    redis_client.sadd(f"user:{user_id}:files", *short_ids)
+    return short_ids
+
+def all_pages(user_id, limit, cursor=None):
+    seen = []
+    while True:
+        files, cursor = storage.list_user_files(user_id, cursor=cursor, limit=limit)
+        seen += [file_data['short_id'] for file_data in files]
+        if not cursor:
+            return seen
+
+def test_pages_cover_files_sharing_an_upload_time(redis_client):
+    short_ids = legacy_library(redis_client, 5)
+    seen = all_pages(42, limit=2)
+    assert sorted(seen) == sorted(short_ids)
+    assert len(seen) == len(set(seen))
+
+def test_page_resumes_when_the_cursor_file_is_revoked(redis_client):
+    short_ids = legacy_library(redis_client, 7)
+    files, cursor = storage.list_user_files(42, limit=3)
+    storage.revoke_file(files[-1])
+
+    seen = [file_data['short_id'] for file_data in files] + all_pages(42, limit=3, cursor=cursor)
+    assert sorted(seen) == sorted(short_ids)
+
+def test_pages_are_newest_first(redis_client):
+    short_ids = store_library([f"file {i}.mkv" for i in range(9)])
+    assert all_pages(42, limit=4) == short_ids[::-1]
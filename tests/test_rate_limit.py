@@ -0,0 +1,76 @@
+import heapq
+import types
+
+import pytest
+
+import rate_limit
+
+CHATS = 10
+SENDS_PER_CHAT = 200
+CHANNEL_SENDS = 300
+
+@pytest.fixture
+def clock(redis_client, monkeypatch):
+    """Simulated time for the limiter; tests advance `now` themselves"""
+    clock = types.SimpleNamespace(now=1700000000.0)
+    monkeypatch.setattr(rate_limit, 'time', types.SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(rate_limit, 'CHANNEL_ID', '-100777')
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_GLOBAL', 30.0)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CHAT', 5.0)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CHAT_BURST', 3)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_CHANNEL', 0.0)
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_RESERVE', 5)
+    return clock
+
+def most_in_window(times, window):
+    """The largest number of grants falling within `window` seconds"""
+    most = start = 0
+    for end, granted_at in enumerate(times):
+        while granted_at - times[start] >= window:
+            start += 1
+        most = max(most, end - start + 1)
+    return most
+
+def test_thousands_of_sends_never_overflow_a_bucket(clock, redis_client):
+    # Every sender sends as fast as the limiter lets it, retrying after the
+    # wait it is told; the heap orders attempts by simulated time
+    remaining = {str(chat_id): SENDS_PER_CHAT for chat_id in range(1, CHATS + 1)}
+    remaining['-100777'] = CHANNEL_SENDS
+    attempts = [(clock.now, chat_id) for chat_id in remaining]
+    granted = {chat_id: [] for chat_id in remaining}
+    channel_levels = []
+    started = clock.now
+    while attempts:
+        clock.now, chat_id = heapq.heappop(attempts)
+        wait = rate_limit.try_acquire(chat_id)
+        if wait:
+            heapq.heappush(attempts, (clock.now + wait, chat_id))
+            continue
+        granted[chat_id].append(clock.now)
+        if chat_id == '-100777':
+            channel_levels.append(float(redis_client.hget(rate_limit.GLOBAL_BUCKET_KEY, 'tokens')))
+        remaining[chat_id] -= 1
+        if remaining[chat_id]:
+            heapq.heappush(attempts, (clock.now, chat_id))
+
+    everything = sorted(t for times in granted.values() for t in times)
+    assert len(everything) == CHATS * SENDS_PER_CHAT + CHANNEL_SENDS
+
+    # A bucket of rate r and burst b grants at most b + r * T in any T seconds
+    for window in (0.001, 1, 10):
+        assert most_in_window(everything, window) <= 30 + 30 * window
+        for chat_id in map(str, range(1, CHATS + 1)):
+            assert most_in_window(granted[chat_id], window) <= 3 + 5 * window
+
+    # Channel sends never dip into the tokens kept for user replies
+    assert min(channel_levels) >= rate_limit.RATE_LIMIT_RESERVE
+
+    # ...and the limiter still lets the full global rate through
+    elapsed = everything[-1] - started
+    assert elapsed <= (len(everything) - 30) / 30 * 1.05
+
+def test_redis_outage_fails_open(redis_client, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise ConnectionError("Redis is down")
+    monkeypatch.setattr(rate_limit, '_get_script', lambda: unreachable)
+    assert rate_limit.try_acquire(42) == 0
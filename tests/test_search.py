@@ -0,0 +1,34 @@
+import storage
+from api import webhook
+from conftest import store_library
+
+# 60 names sharing the prefix "aa" push "avengers" past the expansion limit
+NAMES = [f"aa{i:02} episode.mkv" for i in range(60)] + ["avengers.mkv"]
+
+def test_search_reports_truncated_expansion(redis_client, monkeypatch):
+    monkeypatch.setattr(storage, 'SEARCH_MAX_EXPANSIONS', 50)
+    store_library(NAMES)
+
+    files, total, truncated = storage.search_user_files(42, 'a', limit=100)
+    assert truncated
+    assert total == len(files) < len(NAMES)
+
+    files, total, truncated = storage.search_user_files(42, 'av')
+    assert not truncated
+    assert [file_data['file_name'] for file_data in files] == ['avengers.mkv']
+
+def test_search_within_limit_is_complete(redis_client):
+    store_library(NAMES)
+    files, total, truncated = storage.search_user_files(42, 'aa0 episode', limit=100)
+    assert not truncated
+    assert total == len(files) == 10
+
+def test_search_command_warns_when_truncated(telegram, monkeypatch):
+    monkeypatch.setattr(storage, 'SEARCH_MAX_EXPANSIONS', 50)
+    store_library(NAMES)
+
+    webhook.send_search_results(42, 42, 'a')
+    (method, params), = telegram.requests
+    assert method == 'sendMessage'
+    assert webhook.SEARCH_TRUNCATED_TEXT in params['text']
+    assert '+ matching files' in params['text']
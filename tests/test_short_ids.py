@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+import short_ids
+
+def test_concurrent_allocations_never_repeat(redis_client):
+    allocated = []
+    lock = threading.Lock()
+
+    def allocate(worker):
+        ids = []
+        for i in range(200):
+            # Mix single uploads with album batches of varying size
+            if (worker + i) % 3:
+                ids.append(short_ids.allocate_short_id())
+            else:
+                ids.extend(short_ids.allocate_short_ids(i % 10 + 1))
+        with lock:
+            allocated.extend(ids)
+
+    threads = [threading.Thread(target=allocate, args=(worker,)) for worker in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(allocated) == int(redis_client.get(short_ids.COUNTER_KEY))
+    assert len(set(allocated)) == len(allocated)
+    assert all(0 < len(short_id) <= 6 and set(short_id) <= set(short_ids.ALPHABET) for short_id in allocated)
+
+def test_permutation_is_collision_free_across_the_domain():
+    top = (1 << short_ids.ID_BITS) - 1
+    samples = list(range(50000)) + list(range(top - 50000, top + 1))
+    permuted = [short_ids.permute(n) for n in samples]
+
+    assert len(set(permuted)) == len(samples)
+    assert all(0 <= n <= top for n in permuted)
+
+def test_exhausted_counter_refuses_to_wrap(redis_client):
+    redis_client.set(short_ids.COUNTER_KEY, (1 << short_ids.ID_BITS) - 1)
+    with pytest.raises(RuntimeError):
+        short_ids.allocate_short_id()
+    with pytest.raises(RuntimeError):
+        short_ids.allocate_short_ids(5)
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import storage
+from api import webhook
+from conftest import document_update
+
+def test_replayed_update_forwards_once(telegram):
+    update = document_update(1)
+    results = [webhook.process_update(update) for _ in range(5)]
+
+    assert results == ['ok'] * 5
+    assert telegram.calls['forwardMessage'] == 1
+    assert telegram.calls['sendMessage'] == 1
+
+def test_concurrent_redeliveries_forward_once(telegram):
+    update = document_update(2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(webhook.process_update(update))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert telegram.calls['forwardMessage'] == 1
+    assert set(results) <= {'ok', storage.UPDATE_IN_PROGRESS}
+    assert webhook.process_update(update) == 'ok'
+    assert telegram.calls['forwardMessage'] == 1
+
+def test_redelivery_after_crash_is_processed(telegram):
+    update = document_update(3)
+    # The forward's connection drops, which is not retried, so the update fails
+    telegram.drop['forwardMessage'] = 1
+    try:
+        webhook.process_update(update)
+    except Exception:
+        pass
+    else:
+        raise AssertionError("expected the dropped forward to fail the update")
+    assert telegram.calls['forwardMessage'] == 0
+
+    assert webhook.process_update(update) == 'ok'
+    assert webhook.process_update(update) == 'ok'
+    assert telegram.calls['forwardMessage'] == 1
+
+def test_claim_of_a_killed_delivery_lapses(telegram, monkeypatch):
+    monkeypatch.setattr(storage, 'UPDATE_CLAIM_TTL', 1)
+    update = document_update(4)
+    # A delivery that claimed the update and was then killed mid-way
+    assert storage.claim_update(4)
+
+    assert webhook.process_update(update) == storage.UPDATE_IN_PROGRESS
+    assert telegram.calls['forwardMessage'] == 0
+
+    time.sleep(1.1)
+    assert webhook.process_update(update) == 'ok'
+    assert telegram.calls['forwardMessage'] == 1
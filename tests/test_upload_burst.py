@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+import storage
+from api import webhook
+from conftest import document_update
+
+FILES = 50
+
+@pytest.fixture
+def burst(telegram, monkeypatch):
+    monkeypatch.setattr(webhook, 'UPLOAD_BATCH_WAIT', 0.3)
+
+    def send(album_size=None):
+        """Deliver FILES uploads ~10 ms apart, each as its own webhook call"""
+        threads = []
+        for i in range(FILES):
+            extra = {'media_group_id': f"album{i // album_size}"} if album_size else {}
+            update = document_update(i + 1, message_id=500 + i, file_key=f"{i:02}", **extra)
+            thread = threading.Thread(target=webhook.process_update, args=(update,))
+            threads.append(thread)
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return telegram
+    return send
+
+def stored_names(user_id=42):
+    files, _ = storage.list_user_files(user_id, limit=FILES + 1)
+    return sorted(file_data['file_name'] for file_data in files)
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_separate_uploads_cost_three_calls_each(burst):
+    telegram = burst()
+    # The getFile warm-up runs in the background; let it finish
+    wait_for(lambda: telegram.calls['getFile'] >= FILES)
+
+    assert dict(telegram.calls) == {'forwardMessage': FILES, 'sendMessage': FILES, 'getFile': FILES}
+    assert stored_names() == sorted(f"Show {i:02}.mkv" for i in range(FILES))
+
+def test_albums_are_stored_with_one_forward_and_one_reply(burst):
+    telegram = burst(album_size=10)
+
+    assert dict(telegram.calls) == {'forwardMessages': 5, 'sendMessage': 5}
+    forwarded = [params['message_ids'] for method, params in telegram.requests if method == 'forwardMessages']
+    assert sorted(forwarded) == [list(range(500 + start, 510 + start)) for start in range(0, FILES, 10)]
+    assert stored_names() == sorted(f"Show {i:02}.mkv" for i in range(FILES))
+    assert storage.get_redis_client().zcard('upload:batches') == 0
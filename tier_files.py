@@ -0,0 +1,43 @@
+import argparse
+import time
+from storage import get_redis_client, archive_cold_files, CHANNEL_REFS_READY_KEY
+from config import ARCHIVE_AFTER
+
+# Moves records nobody has opened for ARCHIVE_AFTER seconds into the packed
+# archive. Reads fall back to the archive and opening a file moves it back,
+# so this can run from cron while the bot is live.
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive file records that have gone cold")
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--days', type=float, default=ARCHIVE_AFTER / 86400,
+                        help="archive records not opened for this many days")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be archived")
+    args = parser.parse_args()
+
+    r = get_redis_client()
+    if not args.dry_run and not r.exists(CHANNEL_REFS_READY_KEY):
+        # Archived records would be skipped by an unfinished index_files.py run
+        print("Run index_files.py to completion before archiving records")
+        return
+    cutoff = time.time() - args.days * 86400
+    totals = [0, 0, 0]
+    batch = []
+    for key in r.scan_iter(match='file:*', count=args.batch, _type='hash'):
+        batch.append(key.split(':', 1)[1])
+        if len(batch) >= args.batch:
+            totals = [total + n for total, n in zip(totals, archive_cold_files(batch, cutoff, args.dry_run))]
+            batch = []
+    if batch:
+        totals = [total + n for total, n in zip(totals, archive_cold_files(batch, cutoff, args.dry_run))]
+
+    archived, before, after = totals
+    if not archived:
+        print("No cold records found")
+        return
+    print(f"{'Would archive' if args.dry_run else 'Archived'} {archived} records")
+    print(f"Payload bytes per record: {before / archived:.0f} (hash) -> {after / archived:.0f} (archive), "
+          f"plus one Redis key each no longer stored")
+
+if __name__ == "__main__":
+    main()
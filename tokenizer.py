@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+# File names are indexed as lowercase, accent-free word tokens, so
+# "Été.2024.1080p.MKV" is found by "ete", "2024" or "108".
+MAX_TOKENS = 32
+MAX_TOKEN_LENGTH = 32
+_WORD = re.compile(r'[^\W_]+')
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def tokenize(text):
+    """Distinct tokens of a file name or query, in order of appearance"""
+    tokens = []
+    for token in _WORD.findall(normalize(text or '')):
+        token = token[:MAX_TOKEN_LENGTH]
+        if token not in tokens:
+            tokens.append(token)
+            if len(tokens) == MAX_TOKENS:
+                break
+    return tokens
@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from storage import get_redis_client, UPDATE_IN_PROGRESS
+from config import UPDATE_CLAIM_TTL
+
+# Updates wait in QUEUE_KEY; a worker atomically moves each one to
+# PROCESSING_KEY while it runs. Updates another delivery still holds stay
+# there, and the list is requeued every UPDATE_CLAIM_TTL seconds, so a
+# crashed worker's updates are retried once their claims lapse.
+QUEUE_KEY = 'updates:queue'
+PROCESSING_KEY = 'updates:processing'
+
+def enqueue_update(update):
+    """Push a raw Telegram update for a worker to process"""
+    get_redis_client().lpush(QUEUE_KEY, json.dumps(update))
+
+def requeue_stale():
+    """Move updates left in the processing list back onto the queue"""
+    r = get_redis_client()
+    moved = 0
+    while r.rpoplpush(PROCESSING_KEY, QUEUE_KEY):
+        moved += 1
+    return moved
+
+def run_worker(process, concurrency, poll_timeout=5):
+    """Drain the queue forever, running at most `concurrency` updates at once"""
+    r = get_redis_client()
+    slots = threading.BoundedSemaphore(concurrency)
+    moved = requeue_stale()
+    if moved:
+        print(f"Requeued {moved} unfinished updates")
+
+    def run(raw):
+        started = time.monotonic()
+        done = True
+        try:
+            done = process(json.loads(raw)) != UPDATE_IN_PROGRESS
+        except Exception as e:
+            print(f"Update processing error: {e}")
+        finally:
+            try:
+                if done:
+                    r.lrem(PROCESSING_KEY, 1, raw)
+            except Exception as e:
+                print(f"Redis error: {e}")
+            slots.release()
+        print(f"Processed update in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    requeue_at = time.monotonic() + UPDATE_CLAIM_TTL
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            if time.monotonic() >= requeue_at:
+                requeue_at = time.monotonic() + UPDATE_CLAIM_TTL
+                try:
+                    requeue_stale()
+                except Exception as e:
+                    print(f"Redis error: {e}")
+            slots.acquire()
+            try:
+                raw = r.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=poll_timeout)
+            except Exception as e:
+                print(f"Redis error: {e}")
+                slots.release()
+                time.sleep(1)
+                continue
+            if raw is None:
+                slots.release()
+                continue
+            pool.submit(run, raw)
@@ -0,0 +1,61 @@
+import json
+import time
+from storage import get_redis_client
+
+# Collects album parts for api/webhook.py, where every update is its own
+# invocation. Each part is appended to its album's batch; the invocation
+# that opened the batch leads it: it waits until no message has arrived for
+# `wait` seconds, then takes the whole batch. Appending and taking each run
+# in a MULTI, so every message ends up in exactly one leader's batch.
+# Open batches are listed in OPEN_BATCHES_KEY by when their leader's lease
+# runs out; if a leader dies, a later upload adopts its batch, which is
+# kept for ORPHAN_TTL seconds past the lease.
+OPEN_BATCHES_KEY = 'upload:batches'
+ORPHAN_TTL = 600
+
+def _keys(chat_id, group_id):
+    batch_key = f"upload:batch:{chat_id}:{group_id}"
+    return batch_key, f"{batch_key}:leader"
+
+def join_batch(chat_id, group_id, message, leader_ttl):
+    """Add a message to its album's batch; True if the caller leads it"""
+    batch_key, leader_key = _keys(chat_id, group_id)
+    pipe = get_redis_client().pipeline(transaction=True)
+    pipe.rpush(batch_key, json.dumps(message))
+    pipe.expire(batch_key, leader_ttl + ORPHAN_TTL)
+    pipe.set(leader_key, '1', nx=True, ex=leader_ttl)
+    pipe.zadd(OPEN_BATCHES_KEY, {batch_key: time.time() + leader_ttl}, nx=True)
+    return bool(pipe.execute()[2])
+
+def _take(r, batch_key):
+    pipe = r.pipeline(transaction=True)
+    pipe.lrange(batch_key, 0, -1)
+    pipe.delete(batch_key, f"{batch_key}:leader")
+    pipe.zrem(OPEN_BATCHES_KEY, batch_key)
+    return [json.loads(raw) for raw in pipe.execute()[0]]
+
+def collect_batch(chat_id, group_id, wait, max_wait, max_size):
+    """Wait for a led batch to settle and take every message in it"""
+    r = get_redis_client()
+    batch_key, _ = _keys(chat_id, group_id)
+    deadline = time.monotonic() + max_wait
+    size = r.llen(batch_key)
+    while size < max_size and time.monotonic() + wait <= deadline:
+        time.sleep(wait)
+        grown = r.llen(batch_key)
+        if grown == size:
+            break
+        size = grown
+    return _take(r, batch_key)
+
+def adopt_orphans(leader_ttl, limit=10):
+    """Take over batches whose leader's lease ran out before it took them;
+    returns the message list of each"""
+    r = get_redis_client()
+    batches = []
+    for batch_key in r.zrangebyscore(OPEN_BATCHES_KEY, '-inf', time.time(), start=0, num=limit):
+        if r.set(f"{batch_key}:leader", '1', nx=True, ex=leader_ttl):
+            messages = _take(r, batch_key)
+            if messages:
+                batches.append(messages)
+    return batches
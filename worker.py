@@ -0,0 +1,18 @@
+import threading
+import bot_api
+import channel_gc
+from config import WORKER_CONCURRENCY, CHANNEL_ID, CHANNEL_GC_INTERVAL, CHANNEL_GC_BATCH
+from update_queue import run_worker
+from api.webhook import process_update
+
+def delete_channel_messages(msg_ids):
+    return bot_api.call('deleteMessages', chat_id=CHANNEL_ID, message_ids=msg_ids).get('ok')
+
+# Drains updates queued by api/webhook.py when ASYNC_UPDATES is enabled
+if __name__ == "__main__":
+    print(f"🎬 Filmzi update worker started ({WORKER_CONCURRENCY} concurrent)")
+    # Also deletes channel messages that revokes left unreferenced
+    threading.Thread(target=channel_gc.run_forever,
+                     args=(delete_channel_messages, CHANNEL_GC_INTERVAL, CHANNEL_GC_BATCH),
+                     daemon=True).start()
+    run_worker(process_update, WORKER_CONCURRENCY)